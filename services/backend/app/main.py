@@ -1,39 +1,58 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import aiohttp
+import hmac
 import logging
+import math
 import ssl
+import time
 import certifi
 from tortoise.contrib.fastapi import register_tortoise
-from utils.config import DATABASE_URL, TELEGRAM_API_URL, APP_NAME, BOT_NAME
-from models.models import User, Share
-from fastapi.responses import JSONResponse
+from typing import Optional
+from utils.config import (
+    DATABASE_URL, TELEGRAM_API_URL, APP_NAME, BOT_NAME,
+    USERS_PAGE_SIZE, USERS_MAX_PAGE_SIZE, USERS_STREAM_BATCH_SIZE,
+    USER_STATS_CACHE_TTL, SHARE_CACHE_TTL, SHARE_CACHE_SOFT_TTL, METRICS_PATH,
+    TRACING_ENABLED, SERVER_TIMING_ENABLED, SLOW_REQUEST_THRESHOLD_MS,
+    ADMIN_TOKEN, PROFILER_MAX_SECONDS
+)
+from models.models import User, Share, ensure_indexes
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from utils.serialization import dumps
 from utils.redis_utils import (
-    get_cache, set_cache, 
-    get_share_cache_key, get_user_cache_key
+    get_cache_raw, set_cache, set_many,
+    get_share_cache_key, get_user_cache_key, get_user_stats_cache_key, get_cache_stats,
+    start_cache_invalidation_listener, stop_cache_invalidation_listener, close_redis
 )
 from utils.redis_advanced import (
-    get_redis_info, get_redis_stats,
-    rate_limit_check, increment_counter, get_counter
+    rate_limiter, counter_aggregator, increment_counter,
+    get_or_load
+)
+from utils.redis_monitoring import redis_monitor
+from utils.request_utils import get_client_ip, get_telegram_user_id, get_route_path
+from utils.metrics import (
+    metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    http_requests, http_request_duration, http_requests_in_flight, instrument_tortoise
 )
+from utils.tracing import trace_span, start_trace, finish_trace, server_timing, format_span_tree
+from utils.profiler import sampling_profiler, ProfilerBusyError
+from utils.pagination import USER_ORDER_FIELDS, encode_cursor, decode_cursor
 from utils.kafka_utils import (
     kafka_client, send_share_created_event,
-    send_user_updated_event, send_telegram_message_event
+    send_user_updated_event, send_template_message_event, TEMPLATE_SHARE_SAVED
 )
+from utils.share_expiry import share_expiry_sweeper
 from schemas.share import (
     ShareDataRequest, ShareResponse, SharedDataResponse,
     ShareData, UserData
 )
 from schemas.user import (
-    UserResponse, UserListResponse, UserStatsResponse
+    UserResponse, UserListResponse, UserCountResponse, UserStatsResponse
 )
 from schemas.system import (
     RedisMonitoringResponse
 )
-from schemas.message import (
-    MessageData
-)
 
 # Настройка логирования
 logging.basicConfig(
@@ -42,6 +61,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Медленные запросы логируются с уровнем WARNING независимо от общего уровня
+slow_request_logger = logging.getLogger("slow_requests")
+slow_request_logger.setLevel(logging.WARNING)
+
 # Инициализация FastAPI
 app = FastAPI()
 
@@ -62,20 +85,57 @@ app.add_middleware(
 # Добавляем middleware для логирования запросов
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Middleware для логирования запросов и ограничения скорости"""
+    """Middleware для логирования запросов, учета метрик, трассировки и ограничения скорости"""
+    http_requests_in_flight.inc()
+    started = time.perf_counter()
+    status = 500
+    trace = start_trace(f"{request.method} {request.url.path}") if TRACING_ENABLED else None
+    try:
+        response = await limit_requests(request, call_next)
+        status = response.status_code
+        # Время шагов раскрывает устройство сервиса, поэтому по умолчанию отдается только с токеном администратора
+        if trace is not None and (SERVER_TIMING_ENABLED or is_admin_token(request.headers.get("x-admin-token"))):
+            response.headers["Server-Timing"] = server_timing(trace[0])
+        return response
+    finally:
+        http_requests_in_flight.dec()
+        elapsed = time.perf_counter() - started
+        # Учитываем и запросы, отклоненные ограничением скорости
+        route = get_route_path(request)
+        http_request_duration.observe(elapsed, request.method, route)
+        http_requests.inc(request.method, route, str(status))
+        if trace is not None:
+            finish_trace(*trace)
+            if elapsed * 1000 >= SLOW_REQUEST_THRESHOLD_MS > 0:
+                slow_request_logger.warning(f"Медленный запрос ({status}):\n{format_span_tree(trace[0])}")
+
+async def limit_requests(request: Request, call_next):
+    """Проверка ограничения скорости и передача запроса обработчику"""
     logger.info(f"Входящий запрос: {request.method} {request.url}")
     logger.info(f"Заголовки запроса: {request.headers}")
     
+    # Сбор метрик не должен расходовать лимиты и обращаться к Redis
+    if request.url.path == METRICS_PATH:
+        return await call_next(request)
+    
     # Увеличиваем счетчик API запросов
     await increment_counter("api_requests")
     
-    # Проверяем ограничение скорости по IP
-    client_ip = request.client.host
-    if not await rate_limit_check(f"ip:{client_ip}", limit=100, period=60):
+    # Проверяем все правила ограничения скорости одним вызовом Redis
+    client_ip = get_client_ip(request)
+    with trace_span("rate_limit"):
+        allowed, retry_after = await rate_limiter.check(
+            request.method,
+            request.url.path,
+            client_ip,
+            get_telegram_user_id(request)
+        )
+    if not allowed:
         logger.warning(f"Превышен лимит запросов для IP: {client_ip}")
         return JSONResponse(
             status_code=429,
-            content={"detail": "Too many requests"}
+            content={"detail": "Too many requests"},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
         )
     
     response = await call_next(request)
@@ -87,12 +147,27 @@ async def startup_event():
     """Инициализация при запуске приложения"""
     await kafka_client.start()
     logger.info("Kafka client started")
+    await share_expiry_sweeper.start()
+    await start_cache_invalidation_listener()
+    await rate_limiter.load()
+    await counter_aggregator.start()
+    await redis_monitor.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка ресурсов при остановке приложения"""
+    await share_expiry_sweeper.stop()
+    await stop_cache_invalidation_listener()
+    await counter_aggregator.stop()
+    await redis_monitor.stop()
     await kafka_client.stop()
     logger.info("Kafka client stopped")
+    await close_redis()
+
+@app.get(METRICS_PATH, include_in_schema=False)
+async def get_metrics():
+    """Метрики процесса в формате Prometheus"""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 @app.get("/api/")
 async def root():
@@ -109,98 +184,77 @@ async def share_data(share_data: ShareDataRequest):
     try:
         logger.info(f"Получен запрос на сохранение данных: {share_data}")
         
-        # Создаем или обновляем пользователя
-        user = await User.get_or_none(id=str(share_data.chatId))
-        if user is None:
-            user = await User.create(
-                id=str(share_data.chatId),
-                first_name=share_data.userInfo.first_name,
-                last_name=share_data.userInfo.last_name,
-                username=share_data.userInfo.username
+        # Создаем или обновляем пользователя одним запросом
+        with trace_span("user_upsert"):
+            user, created = await User.upsert_profile(
+                str(share_data.chatId),
+                share_data.userInfo.first_name,
+                share_data.userInfo.last_name,
+                share_data.userInfo.username
             )
-            # Отправляем событие о создании пользователя
+        # Отправляем событие о создании или обновлении пользователя
+        with trace_span("user_updated_event"):
             await send_user_updated_event(user.id, {
                 'first_name': user.first_name,
                 'last_name': user.last_name,
                 'username': user.username,
-                'action': 'created'
-            })
-        else:
-            user.first_name = share_data.userInfo.first_name
-            user.last_name = share_data.userInfo.last_name
-            user.username = share_data.userInfo.username
-            await user.save()
-            # Отправляем событие об обновлении пользователя
-            await send_user_updated_event(user.id, {
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'username': user.username,
-                'action': 'updated'
+                'action': 'created' if created else 'updated'
             })
 
         # Создаем запись о шаринге
-        share = await Share.create(
-            id=share_data.shareId,
-            user=user,
-            birthday=share_data.data['birthday']
-        )
+        with trace_span("share_create"):
+            share = await Share.create(
+                id=share_data.shareId,
+                user=user,
+                birthday=share_data.data['birthday']
+            )
         
         # Отправляем событие о создании share
-        await send_share_created_event(
-            share.id,
-            user.id,
-            {'birthday': share.birthday.isoformat()}
-        )
-        
-        # Очищаем устаревшие записи и кэш
-        await Share.cleanup_expired()
+        with trace_span("share_created_event"):
+            await send_share_created_event(
+                share.id,
+                user.id,
+                {'birthday': share.birthday.isoformat(), 'created_at': share.created_at.isoformat()}
+            )
         
-        # Кэшируем данные пользователя
+        # Кэшируем данные пользователя и шаринга и сбрасываем его статистику за один проход
         user_cache_key = get_user_cache_key(str(share_data.chatId))
-        await set_cache(user_cache_key, {
-            'id': user.id,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'username': user.username,
-            'last_active': user.last_active.isoformat()
-        })
-        
-        # Кэшируем данные шаринга
         share_cache_key = get_share_cache_key(share.id)
-        await set_cache(share_cache_key, {
-            'share': {
-                'id': share.id,
-                'birthday': share.birthday.isoformat(),
-                'created_at': share.created_at.isoformat()
-            },
-            'user': {
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'username': user.username
-            }
-        })
+        with trace_span("cache_write"):
+            await set_many({
+                user_cache_key: {
+                    'id': user.id,
+                    'first_name': user.first_name,
+                    'last_name': user.last_name,
+                    'username': user.username,
+                    'last_active': user.last_active.isoformat()
+                },
+                share_cache_key: {
+                    'share': {
+                        'id': share.id,
+                        'birthday': share.birthday.isoformat(),
+                        'created_at': share.created_at.isoformat()
+                    },
+                    'user': {
+                        'first_name': user.first_name,
+                        'last_name': user.last_name,
+                        'username': user.username
+                    }
+                }
+            }, expire={
+                user_cache_key: 3600,
+                share_cache_key: SHARE_CACHE_TTL
+            }, delete_keys=[get_user_stats_cache_key(user.id)])
         
         # Создаем ссылку для шаринга
         share_link = f"https://t.me/{BOT_NAME}/{APP_NAME}?startapp=share_{share.id}" 
         logger.info(f"Создана ссылка для шаринга: {share_link}")
         
-        # Отправляем сообщение в чат через Kafka
-        message_text = (
-            "✅ Данные успешно сохранены!\n\n"
-            "Нажмите на ссылку ниже, чтобы открыть мини-приложение с вашими данными:\n"
-            "⚠️ Ссылка действительна 24 часа\n\n"
-            f"{share_link}"
-        )
-        
-        # Создаем данные сообщения
-        message_data = MessageData(
-            chat_id=share_data.chatId,
-            text=message_text,
-            parse_mode="HTML"
-        )
-        
-        # Отправляем событие в Kafka
-        success = await send_telegram_message_event(message_data.dict())
+        # Отправляем сообщение в чат через Kafka: текст собирается в боте по шаблону
+        with trace_span("share_saved_message"):
+            success = await send_template_message_event(
+                share_data.chatId, TEMPLATE_SHARE_SAVED, {'share_link': share_link}
+            )
         if not success:
             logger.warning(f"Не удалось отправить сообщение пользователю {share_data.chatId}")
         
@@ -213,28 +267,16 @@ async def share_data(share_data: ShareDataRequest):
         logger.error(f"Ошибка при обработке данных: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/share/{share_id}", response_model=SharedDataResponse)
-async def get_shared_data(share_id: str):
-    """Получение данных шары"""
-    logger.info(f"Запрос на получение данных share_id: {share_id}")
-    
-    # Пробуем получить данные из кэша
-    cache_key = get_share_cache_key(share_id)
-    cached_data = await get_cache(cache_key)
-    if cached_data:
-        logger.info(f"Данные получены из кэша для share_id: {share_id}")
-        return cached_data
-    
-    # Если данных нет в кэше, получаем из базы
+async def load_shared_data(share_id: str) -> Optional[bytes]:
+    """Загрузка данных шары из базы в виде готового тела ответа"""
     share = await Share.get_or_none(id=share_id).prefetch_related('user')
     if not share:
-        logger.warning(f"Данные не найдены для share_id: {share_id}")
-        raise HTTPException(status_code=404, detail="Данные не найдены")
+        return None
     
     logger.info(f"Найдены данные для share_id {share_id}: {share.birthday}, пользователь: {share.user.first_name}")
     
     # Формируем ответ
-    response_data = SharedDataResponse(
+    return dumps(SharedDataResponse(
         share=ShareData(
             id=share.id,
             birthday=share.birthday,
@@ -245,12 +287,28 @@ async def get_shared_data(share_id: str):
             last_name=share.user.last_name,
             username=share.user.username
         )
-    )
+    ).dict())
+
+@app.get("/api/share/{share_id}", response_model=SharedDataResponse)
+async def get_shared_data(share_id: str):
+    """Получение данных шары"""
+    logger.info(f"Запрос на получение данных share_id: {share_id}")
     
-    # Сохраняем в кэш
-    await set_cache(cache_key, response_data.dict(), 3600)
+    # Одновременные промахи по одной шаре загружают ее из базы один раз,
+    # а устаревшая запись отдается, пока обновляется в фоне
+    body = await get_or_load(
+        get_share_cache_key(share_id),
+        lambda: load_shared_data(share_id),
+        expire=SHARE_CACHE_TTL,
+        soft_ttl=SHARE_CACHE_SOFT_TTL,
+        raw=True
+    )
+    if body is None:
+        logger.warning(f"Данные не найдены для share_id: {share_id}")
+        raise HTTPException(status_code=404, detail="Данные не найдены")
     
-    return response_data
+    # Кэш хранит готовое тело ответа, поэтому отдаем его без повторной валидации
+    return Response(content=body, media_type="application/json")
 
 @app.get("/api/user/{user_id}", response_model=UserResponse)
 async def get_user_data(user_id: str):
@@ -259,10 +317,10 @@ async def get_user_data(user_id: str):
     
     # Пробуем получить данные из кэша
     cache_key = get_user_cache_key(user_id)
-    cached_data = await get_cache(cache_key)
-    if cached_data:
+    cached_body = await get_cache_raw(cache_key)
+    if cached_body:
         logger.info(f"Данные получены из кэша для пользователя: {user_id}")
-        return cached_data
+        return Response(content=cached_body, media_type="application/json")
     
     # Если данных нет в кэше, получаем из базы
     user = await User.get_or_none(id=user_id)
@@ -271,94 +329,150 @@ async def get_user_data(user_id: str):
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     # Формируем ответ
-    response_data = UserResponse(
+    body = dumps(UserResponse(
         id=user.id,
         first_name=user.first_name,
         last_name=user.last_name,
         username=user.username,
         last_active=user.last_active
-    )
+    ).dict())
     
-    # Кэшируем данные
-    await set_cache(cache_key, response_data.dict())
+    # Кэшируем готовое тело ответа
+    await set_cache(cache_key, body)
     
-    return response_data
+    return Response(content=body, media_type="application/json")
 
 @app.get("/api/monitoring/redis", response_model=RedisMonitoringResponse)
 async def get_redis_monitoring():
-    """Получение информации о состоянии Redis"""
+    """Получение информации о состоянии Redis из замеров фонового сборщика"""
+    summary = redis_monitor.summary()
+    if summary is None:
+        # Сборщик еще не успел сделать ни одного замера
+        await redis_monitor.sample()
+        summary = redis_monitor.summary()
+    if summary is None:
+        raise HTTPException(status_code=503, detail="Статистика Redis пока недоступна")
+    
+    return RedisMonitoringResponse(
+        status="success",
+        cache_layers=get_cache_stats(),
+        sample_age=round(time.time() - summary["sampled_at"], 3),
+        **summary
+    )
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Совпадает ли токен с ADMIN_TOKEN (сравнение за постоянное время)"""
+    # compare_digest принимает строки только из ASCII, поэтому сравниваем байты
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def check_admin_token(token: Optional[str]) -> None:
+    """Проверяет токен служебных эндпоинтов; без ADMIN_TOKEN они недоступны"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(token):
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+
+@app.post("/api/admin/profile", include_in_schema=False)
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Профилирует процесс указанное время и возвращает свернутые стеки
+    (flamegraph.pl, speedscope). Профилируется только воркер, принявший запрос.
+    """
+    check_admin_token(x_admin_token)
     try:
-        # Получаем статистику Redis
-        stats = await get_redis_stats()
-        
-        # Получаем счетчики запросов
-        api_requests = await get_counter("api_requests")
-        share_created = await get_counter("share_created")
-        user_updated = await get_counter("user_updated")
-        messages_sent = await get_counter("messages_sent")
-        
-        return RedisMonitoringResponse(
-            status="success",
-            redis_stats=stats,
-            counters={
-                "api_requests": api_requests,
-                "share_created": share_created,
-                "user_updated": user_updated,
-                "messages_sent": messages_sent
-            }
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при получении мониторинга Redis: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        folded = await sampling_profiler.profile(seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=folded, media_type="text/plain")
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse, который закрывает генератор тела, даже если клиент
+    отключился посреди передачи, а не оставляет его сборщику мусора
+    """
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+
+async def stream_users_ndjson(order_by: str):
+    """Отдает всех пользователей построчно в формате NDJSON"""
+    batches = User.iter_batches(order_by, USERS_STREAM_BATCH_SIZE)
+    try:
+        async for rows in batches:
+            yield b"".join(dumps(row) + b"\n" for row in rows)
+    finally:
+        # Досрочное закрытие освобождает курсор и транзакцию iter_batches
+        await batches.aclose()
 
 @app.get("/api/users", response_model=UserListResponse)
-async def get_users():
-    """Получение списка всех пользователей"""
+async def get_users(
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    order_by: str = Query("id", regex=f"^({'|'.join(USER_ORDER_FIELDS)})$"),
+    stream: bool = False
+):
+    """Получение списка пользователей постранично или потоком NDJSON"""
+    if stream:
+        return ClosingStreamingResponse(
+            stream_users_ndjson(order_by),
+            media_type="application/x-ndjson"
+        )
+    
     try:
-        # Получаем всех пользователей
-        users = await User.all()
-        total = len(users)
-        
-        # Формируем ответ
-        user_list = [
-            UserResponse(
-                id=user.id,
-                first_name=user.first_name,
-                last_name=user.last_name,
-                username=user.username,
-                last_active=user.last_active
-            ) for user in users
-        ]
+        after = decode_cursor(cursor, order_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        # Запрашиваем на одну запись больше, чтобы понять, есть ли следующая страница
+        rows = await User.keyset_page(order_by, after, limit + 1)
+        next_cursor = encode_cursor(order_by, rows[limit - 1]) if len(rows) > limit else None
         
         return UserListResponse(
-            users=user_list,
-            total=total
+            users=[UserResponse(**row) for row in rows[:limit]],
+            next_cursor=next_cursor
         )
     except Exception as e:
         logger.error(f"Ошибка при получении списка пользователей: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/users/count", response_model=UserCountResponse)
+async def get_users_count(exact: bool = False):
+    """Получение количества пользователей (по умолчанию — быстрая оценка)"""
+    try:
+        if exact:
+            return UserCountResponse(total=await User.all().count(), approximate=False)
+        return UserCountResponse(total=await User.approximate_count(), approximate=True)
+    except Exception as e:
+        logger.error(f"Ошибка при получении количества пользователей: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/user/{user_id}/stats", response_model=UserStatsResponse)
 async def get_user_stats(user_id: str):
     """Получение статистики пользователя"""
     try:
+        # Пробуем получить статистику из кэша
+        cache_key = get_user_stats_cache_key(user_id)
+        cached_body = await get_cache_raw(cache_key)
+        if cached_body:
+            return Response(content=cached_body, media_type="application/json")
+        
         # Получаем пользователя
-        user = await User.get_or_none(id=user_id).prefetch_related('shares')
+        user = await User.get_or_none(id=user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Пользователь не найден")
         
-        # Получаем количество шар
-        shares_count = len(user.shares)
-        
-        # Получаем дату последней шары
-        last_share_date = None
-        if shares_count > 0:
-            # Сортируем шары по дате создания (от новых к старым)
-            sorted_shares = sorted(user.shares, key=lambda x: x.created_at, reverse=True)
-            last_share_date = sorted_shares[0].created_at
+        # Количество шар и дату последней считает база одним запросом
+        shares_count, last_share_date = await Share.stats_for_user(user_id)
         
         # Формируем ответ
-        return UserStatsResponse(
+        body = dumps(UserStatsResponse(
             user=UserResponse(
                 id=user.id,
                 first_name=user.first_name,
@@ -368,7 +482,12 @@ async def get_user_stats(user_id: str):
             ),
             shares_count=shares_count,
             last_share_date=last_share_date
-        )
+        ).dict())
+        
+        # Кэшируем статистику; ее сбрасывают создание шары и очистка устаревших шар
+        await set_cache(cache_key, body, USER_STATS_CACHE_TTL)
+        
+        return Response(content=body, media_type="application/json")
     except HTTPException:
         raise
     except Exception as e:
@@ -384,6 +503,13 @@ register_tortoise(
     add_exception_handlers=True,
 )
 
+@app.on_event("startup")
+async def create_indexes():
+    """Создание недостающих индексов (после инициализации TortoiseORM)"""
+    # Классы клиентов базы загружаются при инициализации, поэтому замеры подключаем здесь
+    instrument_tortoise()
+    await ensure_indexes()
+
 if __name__ == "__main__":
     logger.info("Запуск сервера FastAPI")
     uvicorn.run(
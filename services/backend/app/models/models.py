@@ -1,5 +1,23 @@
-from tortoise import fields, models
+import logging
+from tortoise import fields, models, timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.functions import Count, Max
+from tortoise.transactions import in_transaction
 from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from utils.config import SHARE_TTL_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Поля пользователя, которые отдаются в API
+USER_FIELDS = ("id", "first_name", "last_name", "username", "last_active")
+
+# Обновляемые при конфликте поля пользователя
+USER_UPSERT_SET = (
+    "first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name, "
+    "username = EXCLUDED.username, last_active = EXCLUDED.last_active"
+)
 
 class User(models.Model):
     """Модель пользователя"""
@@ -11,6 +29,181 @@ class User(models.Model):
     
     class Meta:
         table = "users"
+    
+    @classmethod
+    async def upsert_profile(
+        cls,
+        user_id: str,
+        first_name: str,
+        last_name: Optional[str] = None,
+        username: Optional[str] = None
+    ) -> Tuple["User", bool]:
+        """
+        Создает или обновляет пользователя одним запросом
+        :return: Пользователь и признак того, что он был создан
+        """
+        db = cls._meta.db
+        if db.capabilities.dialect == "postgres":
+            # xmax = 0 только у строки, вставленной этим запросом, а не обновленной
+            _, rows = await db.execute_query(
+                "INSERT INTO users (id, first_name, last_name, username, last_active) "
+                "VALUES ($1, $2, $3, $4, NOW()) "
+                f"ON CONFLICT (id) DO UPDATE SET {USER_UPSERT_SET} "
+                "RETURNING id, first_name, last_name, username, last_active, (xmax = 0) AS created",
+                [user_id, first_name, last_name, username]
+            )
+            row = dict(rows[0])
+            created = row.pop("created")
+            return cls._init_from_db(**row), created
+        
+        user = await cls.get_or_none(id=user_id)
+        if user is None:
+            try:
+                user = await cls.create(
+                    id=user_id,
+                    first_name=first_name,
+                    last_name=last_name,
+                    username=username
+                )
+                return user, True
+            except IntegrityError:
+                # Параллельный запрос успел создать пользователя между чтением и вставкой
+                user = await cls.get(id=user_id)
+        user.first_name = first_name
+        user.last_name = last_name
+        user.username = username
+        await user.save()
+        return user, False
+    
+    @classmethod
+    async def bulk_upsert_profiles(cls, profiles: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Создает или обновляет пользователей по профилям Telegram одним запросом
+        :param profiles: Словари с ключами id, first_name, last_name, username
+        :return: Количество созданных и обновленных пользователей
+        """
+        # Один INSERT не может обновить строку дважды, поэтому оставляем последний профиль для id
+        unique = {str(p["id"]): p for p in profiles}
+        if not unique:
+            return 0, 0
+        
+        db = cls._meta.db
+        if db.capabilities.dialect == "postgres":
+            _, rows = await db.execute_query(
+                "INSERT INTO users (id, first_name, last_name, username, last_active) "
+                "SELECT p.id, p.first_name, p.last_name, p.username, NOW() "
+                "FROM unnest($1::varchar[], $2::varchar[], $3::varchar[], $4::varchar[]) "
+                "AS p(id, first_name, last_name, username) "
+                f"ON CONFLICT (id) DO UPDATE SET {USER_UPSERT_SET} "
+                "RETURNING (xmax = 0) AS created",
+                [
+                    list(unique),
+                    [p["first_name"] for p in unique.values()],
+                    [p.get("last_name") for p in unique.values()],
+                    [p.get("username") for p in unique.values()]
+                ]
+            )
+            created = sum(1 for row in rows if row["created"])
+            return created, len(rows) - created
+        
+        # SQLite (тесты и локальный запуск) поддерживает ON CONFLICT с версии 3.24.
+        # Дата пишется в том же виде, что и у Tortoise, чтобы не ломать сортировку по last_active
+        now = timezone.now().isoformat(" ")
+        async with in_transaction(db.connection_name) as conn:
+            placeholders = ", ".join("?" * len(unique))
+            _, rows = await conn.execute_query(
+                f"SELECT COUNT(*) AS existing FROM users WHERE id IN ({placeholders})", list(unique)
+            )
+            existing = rows[0]["existing"]
+            await conn.execute_many(
+                "INSERT INTO users (id, first_name, last_name, username, last_active) "
+                f"VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET {USER_UPSERT_SET}",
+                [
+                    [user_id, p["first_name"], p.get("last_name"), p.get("username"), now]
+                    for user_id, p in unique.items()
+                ]
+            )
+        return len(unique) - existing, existing
+
+    @classmethod
+    async def keyset_page(
+        cls,
+        order_by: str,
+        after: Optional[Tuple[Any, str]],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        """
+        Возвращает страницу пользователей после указанной позиции (keyset-пагинация)
+        :param order_by: "id" (по возрастанию) или "last_active" (сначала недавно активные)
+        :param after: Пара (значение поля сортировки, id) последней записи предыдущей страницы
+        :param limit: Размер страницы
+        """
+        query = cls.all()
+        if order_by == "last_active":
+            if after is not None:
+                last_active, user_id = after
+                query = query.filter(
+                    Q(last_active__lt=last_active) | Q(last_active=last_active, id__lt=user_id)
+                )
+            query = query.order_by("-last_active", "-id")
+        else:
+            if after is not None:
+                query = query.filter(id__gt=after[1])
+            query = query.order_by("id")
+        return await query.limit(limit).values(*USER_FIELDS)
+    
+    @classmethod
+    async def iter_batches(cls, order_by: str, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Последовательно отдает всех пользователей порциями, не загружая таблицу целиком.
+        В PostgreSQL читает из серверного курсора, в остальных СУБД — keyset-страницами.
+        """
+        db = cls._meta.db
+        if db.capabilities.dialect != "postgres":
+            after = None
+            while True:
+                rows = await cls.keyset_page(order_by, after, batch_size)
+                if not rows:
+                    break
+                yield rows
+                last = rows[-1]
+                after = (last[order_by], last["id"])
+        else:
+            order = "last_active DESC, id DESC" if order_by == "last_active" else "id"
+            async with in_transaction(db.connection_name) as conn:
+                await conn.execute_script(
+                    f"DECLARE users_stream NO SCROLL CURSOR FOR "
+                    f"SELECT {', '.join(USER_FIELDS)} FROM users ORDER BY {order}"
+                )
+                try:
+                    while True:
+                        _, rows = await conn.execute_query(f"FETCH {int(batch_size)} FROM users_stream")
+                        if not rows:
+                            break
+                        yield [dict(row) for row in rows]
+                finally:
+                    # Курсор закрываем и при досрочной остановке (например, клиент отключился)
+                    try:
+                        await conn.execute_script("CLOSE users_stream")
+                    except Exception as e:
+                        # Транзакция все равно откатится и освободит курсор
+                        logger.error(f"Ошибка при закрытии курсора users_stream: {str(e)}")
+    
+    @classmethod
+    async def approximate_count(cls) -> int:
+        """
+        Возвращает оценку количества пользователей по статистике планировщика без сканирования таблицы
+        """
+        db = cls._meta.db
+        if db.capabilities.dialect == "postgres":
+            _, rows = await db.execute_query(
+                "SELECT reltuples::bigint AS estimate FROM pg_class WHERE oid = 'users'::regclass"
+            )
+            estimate = rows[0]["estimate"] if rows else 0
+            # Для таблицы, по которой еще не собрана статистика, оценки нет
+            if estimate > 0:
+                return estimate
+        return await cls.all().count()
 
 class Share(models.Model):
     """Модель для хранения расшаренных данных"""
@@ -23,7 +216,67 @@ class Share(models.Model):
         table = "shares"
     
     @classmethod
-    async def cleanup_expired(cls):
-        """Удаляет записи старше 24 часов"""
-        expiration_date = datetime.now() - timedelta(hours=24)
-        await cls.filter(created_at__lt=expiration_date).delete() 
\ No newline at end of file
+    async def delete_expired_batch(
+        cls,
+        limit: int,
+        ttl_hours: int = SHARE_TTL_HOURS
+    ) -> List[Tuple[str, str]]:
+        """
+        Удаляет одну порцию устаревших записей
+        :param limit: Максимальное количество удаляемых записей
+        :param ttl_hours: Время жизни записи в часах
+        :return: Пары (id шары, id пользователя) удаленных записей
+        """
+        db = cls._meta.db
+        if db.capabilities.dialect == "postgres":
+            # Выбираем порцию по ctid и пропускаем строки, заблокированные другими транзакциями,
+            # чтобы очистка не конкурировала с запросами пользователей
+            _, rows = await db.execute_query(
+                "DELETE FROM shares WHERE ctid = ANY(ARRAY("
+                "SELECT ctid FROM shares WHERE created_at < NOW() - $1 * INTERVAL '1 hour' "
+                "LIMIT $2 FOR UPDATE SKIP LOCKED"
+                ")) RETURNING id, user_id",
+                [ttl_hours, limit]
+            )
+            return [(row["id"], row["user_id"]) for row in rows]
+        
+        expiration_date = timezone.now() - timedelta(hours=ttl_hours)
+        rows = await cls.filter(created_at__lt=expiration_date).limit(limit).values_list("id", "user_id")
+        if rows:
+            await cls.filter(id__in=[share_id for share_id, _ in rows]).delete()
+        return [tuple(row) for row in rows]
+    
+    @classmethod
+    async def stats_for_user(cls, user_id: str) -> Tuple[int, Optional[datetime]]:
+        """
+        Считает количество шар пользователя и дату последней одним агрегирующим запросом
+        :return: Количество шар и дата создания последней шары
+        """
+        rows = await cls.filter(user_id=user_id).annotate(
+            shares_count=Count("id"),
+            last_share_date=Max("created_at")
+        ).values("shares_count", "last_share_date")
+        if not rows:
+            return 0, None
+        return rows[0]["shares_count"] or 0, rows[0]["last_share_date"]
+
+
+# Индексы, которые нужно добавить и в уже существующие таблицы
+# (generate_schemas создает только отсутствующие таблицы)
+INDEXES = [
+    ("idx_users_last_active_id", "users", "last_active, id"),
+    ("idx_shares_user_id_created_at", "shares", "user_id, created_at"),
+]
+
+async def ensure_indexes() -> None:
+    """Создает недостающие индексы"""
+    db = User._meta.db
+    # В PostgreSQL строим индекс без блокировки записи в таблицу
+    concurrently = "CONCURRENTLY " if db.capabilities.dialect == "postgres" else ""
+    for name, table, columns in INDEXES:
+        try:
+            await db.execute_script(
+                f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns})"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при создании индекса {name}: {str(e)}")
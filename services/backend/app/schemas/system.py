@@ -2,6 +2,7 @@
 Схемы Pydantic для валидации данных, связанных с системными операциями.
 """
 from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
 
 class RedisStats(BaseModel):
     """Схема для статистики Redis."""
@@ -13,6 +14,7 @@ class RedisStats(BaseModel):
     keyspace_hits: int
     keyspace_misses: int
     hit_rate: float
+    used_memory_bytes: int = 0
 
 
 class RedisCounters(BaseModel):
@@ -23,8 +25,37 @@ class RedisCounters(BaseModel):
     messages_sent: int = 0
 
 
+class RedisRates(BaseModel):
+    """Схема для скоростей между двумя замерами."""
+    requests_per_sec: float
+    shares_per_sec: float
+    user_updates_per_sec: float
+    messages_per_sec: float
+    commands_per_sec: float
+    hit_rate: Optional[float] = Field(None, description="Доля попаданий в Redis за интервал, %")
+
+
+class RedisHistoryPoint(RedisRates):
+    """Схема для точки истории мониторинга."""
+    timestamp: float
+    used_memory_bytes: int
+
+
 class RedisMonitoringResponse(BaseModel):
     """Схема для ответа с мониторингом Redis."""
     status: str = Field("success", description="Статус операции")
     redis_stats: RedisStats
     counters: RedisCounters
+    cache_layers: Dict[str, Dict[str, int]] = Field(
+        default_factory=dict,
+        description="Попадания, промахи и вытеснения по уровням кэша"
+    )
+    sampled_at: Optional[float] = Field(None, description="Время последнего замера (unix time)")
+    sample_age: Optional[float] = Field(None, description="Сколько секунд назад сделан последний замер")
+    window_seconds: float = Field(0, description="Период, охваченный хранимыми замерами")
+    rates: Optional[RedisRates] = Field(None, description="Скорости за последний интервал")
+    window_rates: Optional[RedisRates] = Field(None, description="Скорости за все хранимое окно")
+    history: List[RedisHistoryPoint] = Field(
+        default_factory=list,
+        description="Скорости и доля попаданий по интервалам сбора, от старых к новым"
+    )
@@ -20,9 +20,15 @@ class UserResponse(UserBase):
 
 
 class UserListResponse(BaseModel):
-    """Схема для ответа со списком пользователей."""
+    """Схема для ответа со страницей списка пользователей."""
     users: List[UserResponse]
-    total: int = Field(..., description="Общее количество пользователей")
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, если она есть")
+
+
+class UserCountResponse(BaseModel):
+    """Схема для ответа с количеством пользователей."""
+    total: int = Field(..., description="Количество пользователей")
+    approximate: bool = Field(..., description="Значение является оценкой")
 
 
 class UserStatsResponse(BaseModel):
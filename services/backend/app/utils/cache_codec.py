@@ -0,0 +1,124 @@
+"""
+Кодек значений кэша Redis.
+
+Бинарный формат записи:
+    байт 0    — маркер 0xC1 (в msgpack не используется, а JSON с него начаться не может)
+    байт 1    — версия схемы
+    байт 2    — флаги сжатия
+    остальное — msgpack (возможно, сжатый)
+
+Записи без маркера считаются JSON прежнего формата и читаются как есть,
+поэтому кэш можно переводить на новый формат без сброса.
+
+Формат msgpack экономит около 20% объема значений, но при попадании в Redis
+запись приходится переводить в JSON для тела ответа (распаковка и
+сериализация, единицы микросекунд на шару, см. benchmarks/bench_cache_hit.py).
+Перевод выполняется один раз на воркер: дальше готовое тело отдается из
+локального кэша до истечения L1_CACHE_TTL. Если важнее CPU, чем память Redis,
+CACHE_CODEC=json хранит готовое тело и отдает его без преобразований.
+"""
+import zlib
+from datetime import date, datetime
+from typing import Any, Union
+import msgpack
+from utils.config import CACHE_CODEC, CACHE_COMPRESSION, CACHE_COMPRESSION_THRESHOLD
+from utils.serialization import dumps, loads
+
+try:
+    import lz4.block as lz4_block
+except ImportError:  # pragma: no cover - lz4 есть в requirements; без него сжатие идет через zlib
+    lz4_block = None
+
+MAGIC = 0xC1
+SCHEMA_VERSION = 1
+HEADER_SIZE = 3
+
+# Флаги сжатия
+FLAG_NONE = 0
+FLAG_ZLIB = 1
+FLAG_LZ4 = 2
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+def _default(obj: Any) -> Any:
+    """Даты кодируются так же, как в JSON — строкой ISO 8601"""
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+class CacheCodec:
+    """Кодирует значения кэша в выбранный формат и читает оба формата"""
+    def __init__(
+        self,
+        codec: str = CACHE_CODEC,
+        compression: str = CACHE_COMPRESSION,
+        compression_threshold: int = CACHE_COMPRESSION_THRESHOLD
+    ):
+        if codec not in ("msgpack", "json"):
+            raise ValueError(f"Неизвестный формат кэша: {codec}")
+        self.codec = codec
+        if compression == "lz4" and lz4_block is None:
+            compression = "zlib"
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+    
+    def encode(self, value: Any) -> bytes:
+        """
+        Кодирует значение для записи в Redis
+        :param value: Объект или готовый JSON в bytes
+        """
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            if self.codec == "json":
+                return bytes(value)
+            value = loads(value)
+        if self.codec == "json":
+            return dumps(value)
+        
+        payload = msgpack.packb(value, default=_default, use_bin_type=True)
+        flags = FLAG_NONE
+        if self.compression != "none" and len(payload) > self.compression_threshold:
+            compressed = self._compress(payload)
+            # Сжатие оставляем, только если оно действительно уменьшило запись
+            if len(compressed[1]) < len(payload):
+                flags, payload = compressed
+        return bytes((MAGIC, SCHEMA_VERSION, flags)) + payload
+    
+    def decode(self, data: Buffer) -> Any:
+        """Декодирует запись любого поддерживаемого формата в объект"""
+        if not self.is_binary(data):
+            return loads(data)
+        return msgpack.unpackb(self._payload(data), raw=False)
+    
+    def to_json(self, data: Buffer) -> bytes:
+        """Возвращает запись в виде JSON, пригодного для тела ответа"""
+        if not self.is_binary(data):
+            return bytes(data)
+        return dumps(msgpack.unpackb(self._payload(data), raw=False))
+    
+    @staticmethod
+    def is_binary(data: Buffer) -> bool:
+        return len(data) >= HEADER_SIZE and data[0] == MAGIC
+    
+    def _compress(self, payload: bytes):
+        if self.compression == "lz4":
+            return FLAG_LZ4, lz4_block.compress(payload, store_size=True)
+        return FLAG_ZLIB, zlib.compress(payload)
+    
+    @staticmethod
+    def _payload(data: Buffer) -> Buffer:
+        version, flags = data[1], data[2]
+        if version != SCHEMA_VERSION:
+            raise ValueError(f"Неподдерживаемая версия записи кэша: {version}")
+        payload = memoryview(data)[HEADER_SIZE:]
+        if flags == FLAG_LZ4:
+            if lz4_block is None:
+                raise ValueError("Запись сжата lz4, но модуль lz4 не установлен")
+            return lz4_block.decompress(payload)
+        if flags == FLAG_ZLIB:
+            return zlib.decompress(payload)
+        return payload
+
+# Создаем глобальный кодек
+cache_codec = CacheCodec()
@@ -16,6 +16,18 @@ DATABASE_URL = f"postgres://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME
 
 # URL для Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Пул подключений: максимум подключений на воркер и сколько ждать свободного (в секундах)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+# Проверка простаивающего подключения перед использованием (в секундах)
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+# Автомат: сколько сетевых ошибок за окно (в секундах) отключают Redis до восстановления
+REDIS_BREAKER_FAILURE_THRESHOLD = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", "5"))
+REDIS_BREAKER_FAILURE_WINDOW = float(os.getenv("REDIS_BREAKER_FAILURE_WINDOW", "10"))
+REDIS_BREAKER_PROBE_INTERVAL = float(os.getenv("REDIS_BREAKER_PROBE_INTERVAL", "0.5"))
+REDIS_BREAKER_MAX_PROBE_INTERVAL = float(os.getenv("REDIS_BREAKER_MAX_PROBE_INTERVAL", "10"))
 
 # Настройки Telegram бота
 BOT_NAME = os.getenv("BOT_NAME", "WiquzixBot")
@@ -27,3 +39,96 @@ APP_NAME = os.getenv("APP_NAME", "wiquzix") #в моем случае это н
 EXTERNAL_URL = os.getenv("EXTERNAL_URL") 
 
 # Название приложения
+
+# Настройки Kafka
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+# Конвейерная отправка: не ждем подтверждения брокера в обработчике запроса
+KAFKA_PIPELINED = os.getenv("KAFKA_PIPELINED", "true").lower() == "true"
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "5"))
+KAFKA_MAX_BATCH_SIZE = int(os.getenv("KAFKA_MAX_BATCH_SIZE", "100"))
+KAFKA_MAX_BATCH_BYTES = int(os.getenv("KAFKA_MAX_BATCH_BYTES", "65536"))
+KAFKA_COMPRESSION_TYPE = os.getenv("KAFKA_COMPRESSION_TYPE", "lz4")  # lz4, zstd, gzip или none
+KAFKA_QUEUE_SIZE = int(os.getenv("KAFKA_QUEUE_SIZE", "10000"))
+
+# Настройки хранения шар
+SHARE_TTL_HOURS = int(os.getenv("SHARE_TTL_HOURS", "24"))
+# Фоновая очистка устаревших шар: период запуска (сек), размер порции и число порций за запуск
+SHARE_EXPIRY_INTERVAL = int(os.getenv("SHARE_EXPIRY_INTERVAL", "60"))
+SHARE_EXPIRY_BATCH_SIZE = int(os.getenv("SHARE_EXPIRY_BATCH_SIZE", "500"))
+SHARE_EXPIRY_MAX_BATCHES = int(os.getenv("SHARE_EXPIRY_MAX_BATCHES", "20"))
+
+# Локальный (L1) кэш в памяти процесса перед Redis
+L1_CACHE_MAX_SIZE = int(os.getenv("L1_CACHE_MAX_SIZE", "10000"))
+L1_CACHE_TTL = int(os.getenv("L1_CACHE_TTL", "30"))
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache_invalidation")
+
+# Ограничение скорости запросов
+# Прокси, которым доверяем заголовки с адресом клиента (cloudflared и фронтенд в сети docker)
+TRUSTED_PROXIES = [
+    net.strip() for net in os.getenv(
+        "TRUSTED_PROXIES",
+        "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16"
+    ).split(",") if net.strip()
+]
+# JSON-список правил, заменяющий правила по умолчанию, например:
+# [{"name": "share", "limit": 10, "period": 60, "algorithm": "token_bucket", "scope": "ip", "route": "/api/share", "methods": ["POST"]}]
+RATE_LIMIT_POLICIES = os.getenv("RATE_LIMIT_POLICIES")
+# Сколько секунд подписанные данные Telegram WebApp (initData) считаются действительными
+TELEGRAM_INIT_DATA_MAX_AGE = int(os.getenv("TELEGRAM_INIT_DATA_MAX_AGE", "86400"))
+
+# Фоновый сбор статистики Redis для мониторинга: период (сек) и число хранимых замеров
+REDIS_MONITOR_INTERVAL = float(os.getenv("REDIS_MONITOR_INTERVAL", "5"))
+REDIS_MONITOR_SAMPLES = int(os.getenv("REDIS_MONITOR_SAMPLES", "120"))
+
+# Локальная агрегация счетчиков перед записью в Redis
+COUNTER_FLUSH_INTERVAL_MS = int(os.getenv("COUNTER_FLUSH_INTERVAL_MS", "1000"))
+COUNTER_SHARDS = int(os.getenv("COUNTER_SHARDS", "8"))
+# Горячие счетчики, которые раскладываются по нескольким ключам
+COUNTER_SHARDED_KEYS = [
+    key.strip() for key in os.getenv("COUNTER_SHARDED_KEYS", "api_requests").split(",") if key.strip()
+]
+
+# Постраничная выдача пользователей
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "1000"))
+# Размер порции, читаемой из серверного курсора при потоковой выдаче
+USERS_STREAM_BATCH_SIZE = int(os.getenv("USERS_STREAM_BATCH_SIZE", "500"))
+
+# Время жизни кэша статистики пользователя (сек)
+USER_STATS_CACHE_TTL = int(os.getenv("USER_STATS_CACHE_TTL", "300"))
+
+# Кэш шар: полное время жизни и "мягкое", после которого запись обновляется в фоне
+SHARE_CACHE_TTL = int(os.getenv("SHARE_CACHE_TTL", "3600"))
+SHARE_CACHE_SOFT_TTL = int(os.getenv("SHARE_CACHE_SOFT_TTL", "300"))
+# Заполнение кэша при промахе: время жизни блокировки и сколько ждать чужой загрузки (сек)
+CACHE_FILL_LOCK_TTL = int(os.getenv("CACHE_FILL_LOCK_TTL", "5"))
+CACHE_FILL_WAIT_TIMEOUT = float(os.getenv("CACHE_FILL_WAIT_TIMEOUT", "1.0"))
+
+# Формат значений кэша в Redis: msgpack (компактный бинарный, переводится в JSON
+# при попадании в Redis) или json (прежний, отдается как готовое тело ответа)
+CACHE_CODEC = os.getenv("CACHE_CODEC", "msgpack")
+# Значения больше порога (в байтах) сжимаются; алгоритм: lz4, zlib или none
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "lz4")
+CACHE_COMPRESSION_THRESHOLD = int(os.getenv("CACHE_COMPRESSION_THRESHOLD", "512"))
+
+# Метрики Prometheus: путь выгрузки и границы корзин гистограмм задержек (сек)
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_LATENCY_BUCKETS = [
+    float(bound) for bound in os.getenv(
+        "METRICS_LATENCY_BUCKETS",
+        "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",") if bound.strip()
+]
+
+# Трассировка запросов: заголовок Server-Timing и лог медленных запросов с деревом участков
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Заголовок Server-Timing для всех клиентов; без этого он отдается только запросам с X-Admin-Token
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "500"))
+# Не больше стольких участков на один уровень дерева (защита от разрастания на длинных запросах)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+# Токен для служебных эндпоинтов (заголовок X-Admin-Token); без токена они отключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Максимальная длительность профилирования по запросу (сек)
+PROFILER_MAX_SECONDS = int(os.getenv("PROFILER_MAX_SECONDS", "60"))
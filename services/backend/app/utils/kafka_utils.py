@@ -1,40 +1,108 @@
 from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
+import asyncio
 import json
 import logging
-from typing import Any, Dict, List
-import os
-from datetime import datetime
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from utils.config import (
+    KAFKA_BOOTSTRAP_SERVERS, KAFKA_PIPELINED, KAFKA_LINGER_MS,
+    KAFKA_MAX_BATCH_SIZE, KAFKA_MAX_BATCH_BYTES, KAFKA_COMPRESSION_TYPE,
+    KAFKA_QUEUE_SIZE
+)
 from utils.redis_advanced import increment_counter
+from utils.serialization import dumps
+from utils.tracing import record_span
+from utils.metrics import metrics, CallbackMetric, kafka_produce_duration, kafka_produce_errors, kafka_batch_size
+# Топики, шаблоны и типы событий общие с ботом
+from common.events import (
+    SHARE_CREATED_TOPIC, USER_UPDATED_TOPIC, SEND_MESSAGE_TOPIC, TEMPLATE_SHARE_SAVED,
+    ShareCreated, UserUpdated, SendMessage, encode_event
+)
 
 logger = logging.getLogger(__name__)
 
-# Явно указываем адрес Kafka
-KAFKA_BOOTSTRAP_SERVERS = 'kafka:9092'
 
-# Определяем топики
-SHARE_CREATED_TOPIC = 'share_created'
-USER_UPDATED_TOPIC = 'user_updated'
-SEND_MESSAGE_TOPIC = 'send_message'
+# Колбэк ошибки доставки: (топик, значение, исключение)
+ErrorCallback = Callable[[str, Any, BaseException], None]
+
+def serialize_value(value: Any) -> bytes:
+    """События кодируются в бинарный конверт, готовые bytes передаются как есть, остальное — JSON"""
+    if isinstance(value, (ShareCreated, UserUpdated, SendMessage)):
+        return encode_event(value)
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return dumps(value)
 
 class KafkaClient:
     """Клиент для работы с Kafka"""
-    def __init__(self):
+    def __init__(
+        self,
+        pipelined: bool = KAFKA_PIPELINED,
+        linger_ms: int = KAFKA_LINGER_MS,
+        max_batch_size: int = KAFKA_MAX_BATCH_SIZE,
+        compression_type: Optional[str] = KAFKA_COMPRESSION_TYPE,
+        queue_size: int = KAFKA_QUEUE_SIZE
+    ):
         self.producer = None
         self.consumers: Dict[str, AIOKafkaConsumer] = {}
         
+        # Параметры конвейерной отправки
+        self.pipelined = pipelined
+        self.linger = linger_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.compression_type = None if compression_type in (None, "", "none") else compression_type
+        self.queue_size = queue_size
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._sender_task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Future] = set()
+        self._error_callbacks: List[ErrorCallback] = []
+        self.metrics: Dict[str, float] = {
+            "enqueued": 0,
+            "sent": 0,
+            "delivered": 0,
+            "failed": 0,
+            "batches": 0,
+            "last_batch_size": 0,
+            "delivery_latency_total": 0.0,
+            "delivery_latency_max": 0.0,
+        }
+        
     async def start(self):
         """Инициализация Kafka producer"""
         if not self.producer:
             self.producer = AIOKafkaProducer(
                 bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
+                value_serializer=serialize_value,
+                linger_ms=int(self.linger * 1000),
+                max_batch_size=KAFKA_MAX_BATCH_BYTES,
+                compression_type=self.compression_type,
+                # Повторная отправка батча после таймаута не создает дубликатов в топике
+                enable_idempotence=True
             )
             await self.producer.start()
             logger.info("Kafka producer started")
+        
+        if self.pipelined and self._sender_task is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._sender_task = asyncio.create_task(self._sender_loop())
+            logger.info("Kafka pipelined sender started")
     
     async def stop(self):
         """Остановка Kafka producer и consumers"""
+        if self._sender_task:
+            # Даем отправителю выгрузить очередь перед остановкой
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=5)
+            except asyncio.TimeoutError:
+                logger.warning(f"Kafka queue not drained, {self._queue.qsize()} messages left")
+            self._sender_task.cancel()
+            await asyncio.gather(self._sender_task, return_exceptions=True)
+            self._sender_task = None
+            self._queue = None
+        
         if self.producer:
+            # stop() дожидается отправки накопленных батчей
             await self.producer.stop()
             self.producer = None
             logger.info("Kafka producer stopped")
@@ -44,17 +112,132 @@ class KafkaClient:
         self.consumers.clear()
         logger.info("Kafka consumers stopped")
     
-    async def send_message(self, topic: str, value: Any, key: str = None):
-        """Отправка сообщения в Kafka"""
+    def add_error_callback(self, callback: ErrorCallback) -> None:
+        """Регистрирует колбэк, вызываемый при ошибке фоновой доставки"""
+        self._error_callbacks.append(callback)
+    
+    def get_metrics(self) -> Dict[str, float]:
+        """Возвращает метрики конвейерной отправки"""
+        metrics = dict(self.metrics)
+        metrics["pending"] = len(self._pending)
+        metrics["queued"] = self._queue.qsize() if self._queue else 0
+        delivered = metrics["delivered"]
+        metrics["delivery_latency_avg"] = (
+            metrics["delivery_latency_total"] / delivered if delivered else 0.0
+        )
+        return metrics
+    
+    async def send_message(self, topic: str, value: Any, key: str = None, wait: Optional[bool] = None):
+        """
+        Отправка сообщения в Kafka
+        :param wait: Ждать подтверждения брокера. По умолчанию ждем только
+                     если конвейерный режим выключен
+        """
+        # В конвейерном режиме в запрос попадает только постановка в очередь
+        traced_at = time.perf_counter()
         try:
             if not self.producer:
                 await self.start()
             
+            if wait is None:
+                wait = not self.pipelined
+            if not wait and self._queue is not None:
+                await self.publish(topic, value, key=key)
+                return
+            
             key_bytes = key.encode() if key else None
+            started = time.monotonic()
             await self.producer.send_and_wait(topic, value, key=key_bytes)
+            kafka_produce_duration.observe(time.monotonic() - started, topic, "sync")
         except Exception as e:
+            kafka_produce_errors.inc(topic)
             logger.error(f"Error sending message to Kafka: {str(e)}")
             raise
+        finally:
+            record_span("kafka", traced_at, time.perf_counter() - traced_at, topic)
+    
+    async def publish(self, topic: str, value: Any, key: str = None) -> None:
+        """
+        Ставит сообщение в очередь конвейерной отправки, не дожидаясь подтверждения.
+        Блокируется только если очередь переполнена. Если конвейерный режим
+        выключен, сообщение отправляется синхронно с ожиданием подтверждения.
+        """
+        if self._queue is None:
+            await self.start()
+        if self._queue is None:
+            await self.send_message(topic, value, key=key, wait=True)
+            return
+        await self._queue.put((topic, value, key, time.monotonic()))
+        self.metrics["enqueued"] += 1
+    
+    async def _sender_loop(self):
+        """Собирает сообщения из очереди в батчи и передает их producer'у"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.linger
+                while len(batch) < self.max_batch_size:
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._send_batch(batch)
+        except asyncio.CancelledError:
+            logger.info("Kafka sender task was cancelled")
+    
+    async def _send_batch(self, batch: List[Tuple[str, Any, Optional[str], float]]):
+        """Передает батч producer'у без ожидания подтверждений"""
+        self.metrics["batches"] += 1
+        self.metrics["last_batch_size"] = len(batch)
+        kafka_batch_size.observe(len(batch))
+        for topic, value, key, enqueued_at in batch:
+            try:
+                key_bytes = key.encode() if key else None
+                # send() только кладет сообщение в аккумулятор и возвращает future доставки
+                future = await self.producer.send(topic, value, key=key_bytes)
+                self.metrics["sent"] += 1
+                self._pending.add(future)
+                future.add_done_callback(
+                    lambda f, t=topic, v=value, ts=enqueued_at: self._on_delivery(f, t, v, ts)
+                )
+            except Exception as e:
+                self._on_error(topic, value, e)
+            finally:
+                self._queue.task_done()
+    
+    def _on_delivery(self, future: asyncio.Future, topic: str, value: Any, enqueued_at: float):
+        """Обрабатывает результат фоновой доставки"""
+        self._pending.discard(future)
+        if future.cancelled():
+            self._on_error(topic, value, asyncio.CancelledError())
+            return
+        error = future.exception()
+        if error is not None:
+            self._on_error(topic, value, error)
+            return
+        latency = time.monotonic() - enqueued_at
+        self.metrics["delivered"] += 1
+        self.metrics["delivery_latency_total"] += latency
+        self.metrics["delivery_latency_max"] = max(self.metrics["delivery_latency_max"], latency)
+        kafka_produce_duration.observe(latency, topic, "pipelined")
+    
+    def _on_error(self, topic: str, value: Any, error: BaseException):
+        """Учитывает ошибку доставки и вызывает зарегистрированные колбэки"""
+        self.metrics["failed"] += 1
+        kafka_produce_errors.inc(topic)
+        logger.error(f"Error delivering message to Kafka topic {topic}: {str(error)}")
+        for callback in self._error_callbacks:
+            try:
+                callback(topic, value, error)
+            except Exception as e:
+                logger.error(f"Error in Kafka error callback: {str(e)}")
     
     async def get_consumer(self, topic: str, group_id: str) -> AIOKafkaConsumer:
         """Получение или создание consumer для топика"""
@@ -74,14 +257,21 @@ class KafkaClient:
 # Создаем глобальный экземпляр клиента
 kafka_client = KafkaClient()
 
+# Очередь конвейерной отправки и сообщения, ждущие подтверждения брокера
+metrics.register(CallbackMetric(
+    "kafka_queue_messages", "Сообщения в очереди конвейерной отправки и ожидающие подтверждения", ("state",),
+    lambda: {("queued",): kafka_client._queue.qsize() if kafka_client._queue else 0,
+             ("pending",): len(kafka_client._pending)}
+))
+
 async def send_share_created_event(share_id: str, user_id: str, data: Dict):
     """Отправка события о создании share"""
-    event = {
-        'share_id': share_id,
-        'user_id': user_id,
-        'data': data,
-        'event_type': 'share_created'
-    }
+    event = ShareCreated(
+        share_id=share_id,
+        user_id=user_id,
+        birthday=data.get('birthday'),
+        created_at=data.get('created_at')
+    )
     await kafka_client.send_message(SHARE_CREATED_TOPIC, event, key=share_id)
     
     # Увеличиваем счетчик созданных шар
@@ -89,32 +279,38 @@ async def send_share_created_event(share_id: str, user_id: str, data: Dict):
 
 async def send_user_updated_event(user_id: str, data: Dict):
     """Отправка события об обновлении пользователя"""
-    event = {
-        'user_id': user_id,
-        'data': data,
-        'event_type': 'user_updated'
-    }
+    event = UserUpdated(
+        user_id=user_id,
+        action=data.get('action', 'updated'),
+        first_name=data.get('first_name'),
+        last_name=data.get('last_name'),
+        username=data.get('username')
+    )
     await kafka_client.send_message(USER_UPDATED_TOPIC, event, key=user_id)
     
     # Увеличиваем счетчик обновлений пользователей
     await increment_counter("user_updated")
 
-async def send_telegram_message_event(message_data: Dict):
-    """Отправка события для отправки сообщения через Telegram Bot API"""
+async def send_template_message_event(
+    chat_id: int,
+    template_id: str,
+    params: Optional[Dict] = None,
+    priority: Optional[str] = None
+) -> bool:
+    """
+    Отправка события для отправки сообщения по шаблону бота.
+    Текст и клавиатура собираются в боте, в событии только идентификатор и параметры.
+    :param chat_id: ID чата в Telegram
+    :param template_id: Идентификатор шаблона (TEMPLATE_*)
+    :param params: Параметры для подстановки в шаблон
+    :param priority: Класс приоритета отправки (reply, notification или bulk)
+    :return: True, если событие поставлено в очередь
+    """
+    event = SendMessage(chat_id=chat_id, template_id=template_id, params=params or {}, priority=priority)
     try:
-        event = {
-            'message_data': message_data,
-            'event_type': 'send_message',
-            'timestamp': datetime.now().isoformat()
-        }
-        logger.info(f"Sending message event to user {message_data.get('chat_id')}")
-        await kafka_client.send_message(SEND_MESSAGE_TOPIC, event)
-        
-        # Увеличиваем счетчик отправленных сообщений
+        await kafka_client.send_message(SEND_MESSAGE_TOPIC, event, key=str(chat_id))
         await increment_counter("messages_sent")
-        
         return True
     except Exception as e:
-        logger.error(f"Error sending message event: {str(e)}")
-        logger.error(f"Event data: {event}")
-        return False 
\ No newline at end of file
+        logger.error(f"Error sending template message event: {str(e)}")
+        return False
@@ -0,0 +1,295 @@
+"""
+Метрики процесса в формате Prometheus.
+
+Значения хранятся в обычных словарях и обновляются без блокировок: весь код
+приложения выполняется в одном потоке цикла событий, а между обновлением и
+чтением нет await. Учет замера — поиск корзины и два сложения, поэтому
+инструментирование стоит микросекунды и не обращается к Redis.
+"""
+import bisect
+import contextvars
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+from utils.config import METRICS_LATENCY_BUCKETS
+from utils.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# Тип ответа /metrics (текстовый формат Prometheus 0.0.4; charset добавляет Starlette)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Корзины для размеров пачек
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+Labels = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    """Базовый класс метрики с именованными метками"""
+    TYPE = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """Возвращает (суффикс имени, имена меток, значения меток, значение)"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield "", self.labelnames, labels, value
+
+
+class Gauge(Counter):
+    """Значение, которое может расти и уменьшаться"""
+    TYPE = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Гистограмма: в каждой корзине хранится число попавших только в нее
+    замеров, накопительные суммы считаются при выгрузке
+    """
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = METRICS_LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bucket_labels = tuple(_format_value(bound) for bound in self.buckets) + ("+Inf",)
+        # Метки -> [счетчики по корзинам (последняя — +Inf), сумма]
+        self._values: Dict[Labels, List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self._bucket_labels, counts):
+                cumulative += count
+                yield "_bucket", names, labels + (bound,), cumulative
+            yield "_sum", self.labelnames, labels, total
+            yield "_count", self.labelnames, labels, cumulative
+
+
+class CallbackMetric(Metric):
+    """Метрика, значения которой читаются из чужих счетчиков в момент выгрузки"""
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        collect: Callable[[], Dict[Labels, float]],
+        metric_type: str = "gauge"
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.TYPE = metric_type
+
+    def samples(self):
+        for labels, value in sorted(self.collect().items()):
+            yield "", self.labelnames, labels, value
+
+
+class MetricsRegistry:
+    """Набор метрик процесса, выгружаемый по /metrics"""
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Регистрирует метрику; повторная регистрация имени возвращает уже существующую"""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = METRICS_LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> bytes:
+        """Выгружает все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Ошибка при выгрузке метрики {metric.name}: {str(e)}")
+        return ("\n".join(lines) + "\n").encode()
+
+
+# Создаем глобальный реестр метрик
+metrics = MetricsRegistry()
+
+# HTTP
+http_requests = metrics.counter(
+    "http_requests_total", "Обработанные HTTP-запросы", ("method", "route", "status")
+)
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса до начала ответа", ("method", "route")
+)
+http_requests_in_flight = metrics.gauge(
+    "http_requests_in_flight", "HTTP-запросы, обрабатываемые в данный момент"
+)
+
+# База данных
+db_query_duration = metrics.histogram(
+    "db_query_duration_seconds", "Время выполнения запросов к базе через Tortoise ORM", ("operation",)
+)
+db_query_errors = metrics.counter(
+    "db_query_errors_total", "Запросы к базе, завершившиеся ошибкой", ("operation",)
+)
+
+# Redis
+redis_command_duration = metrics.histogram(
+    "redis_command_duration_seconds", "Время выполнения команд и пакетов Redis", ("command",)
+)
+redis_command_errors = metrics.counter(
+    "redis_command_errors_total", "Команды и пакеты Redis, завершившиеся ошибкой", ("command",)
+)
+
+# Kafka
+kafka_produce_duration = metrics.histogram(
+    "kafka_produce_duration_seconds",
+    "Время от отправки сообщения до подтверждения брокером (pipelined — с учетом очереди)",
+    ("topic", "mode")
+)
+kafka_produce_errors = metrics.counter(
+    "kafka_produce_errors_total", "Сообщения, не доставленные в Kafka", ("topic",)
+)
+kafka_batch_size = metrics.histogram(
+    "kafka_batch_size", "Число сообщений в пачке конвейерной отправки", buckets=SIZE_BUCKETS
+)
+
+
+# Ключевые слова SQL, по которым группируются запросы; остальные попадают в other
+SQL_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "DECLARE", "FETCH", "CLOSE"))
+DB_CLIENT_METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script")
+
+# Глубина вложенных вызовов клиента базы (клиент транзакции вызывает базовый)
+_db_call_depth: contextvars.ContextVar = contextvars.ContextVar("db_call_depth", default=0)
+_db_instrumented = False
+
+
+def sql_operation(query: Any) -> str:
+    """Определяет вид запроса по первому ключевому слову"""
+    if not isinstance(query, str):
+        return "other"
+    head = query.lstrip()[:8].split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation.lower() if operation in SQL_OPERATIONS else "other"
+
+
+def _timed_db_method(method):
+    @functools.wraps(method)
+    async def wrapper(self, query, *args, **kwargs):
+        depth = _db_call_depth.get()
+        if depth:
+            return await method(self, query, *args, **kwargs)
+        token = _db_call_depth.set(1)
+        operation = sql_operation(query)
+        started = time.perf_counter()
+        try:
+            return await method(self, query, *args, **kwargs)
+        except Exception:
+            db_query_errors.inc(operation)
+            raise
+        finally:
+            _db_call_depth.reset(token)
+            duration = time.perf_counter() - started
+            db_query_duration.observe(duration, operation)
+            record_span("db", started, duration, operation)
+    return wrapper
+
+
+def instrument_tortoise() -> None:
+    """
+    Оборачивает методы execute_* клиентов Tortoise ORM замером времени.
+    Вызывается после инициализации Tortoise, когда классы клиентов уже загружены.
+    """
+    global _db_instrumented
+    if _db_instrumented:
+        return
+    from tortoise.backends.base.client import BaseDBAsyncClient
+    pending = [BaseDBAsyncClient]
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        for name in DB_CLIENT_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None:
+                setattr(cls, name, _timed_db_method(method))
+    _db_instrumented = True
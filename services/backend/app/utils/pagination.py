@@ -0,0 +1,37 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Поля, по которым поддерживается курсорная пагинация пользователей
+USER_ORDER_FIELDS = ("id", "last_active")
+
+def encode_cursor(order_by: str, row: Dict[str, Any]) -> str:
+    """
+    Кодирует позицию последней записи страницы в непрозрачный курсор
+    :param order_by: Поле сортировки
+    :param row: Последняя запись страницы
+    """
+    value = row[order_by]
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([order_by, value, row["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], order_by: str) -> Optional[Tuple[Any, str]]:
+    """
+    Декодирует курсор в пару (значение поля сортировки, id)
+    :raises ValueError: Если курсор поврежден или получен для другой сортировки
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        field, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if field == "last_active":
+            value = datetime.fromisoformat(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Некорректный курсор") from e
+    if field != order_by:
+        raise ValueError("Курсор получен для другой сортировки")
+    return value, str(row_id)
@@ -0,0 +1,89 @@
+"""
+Сэмплирующий профилировщик для включения в работающем процессе.
+
+Отдельный поток с заданным интервалом снимает стек потока цикла событий
+через sys._current_frames() и считает одинаковые стеки. Результат отдается
+в свернутом формате ("main.py:share_data;models.py:upsert_profile 42"),
+который принимают flamegraph.pl, speedscope и inferno.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilerBusyError(Exception):
+    """Профилирование уже запущено"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Точка с запятой разделяет кадры в свернутом формате
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Профилировщик потока цикла событий на время одного вызова profile()"""
+    def __init__(self, max_depth: int = 128):
+        """
+        :param max_depth: Сколько верхних кадров стека учитывать
+        """
+        self.max_depth = max_depth
+        self.running = False
+        self.stats: Dict[str, float] = {"runs": 0, "last_samples": 0, "last_duration": 0.0}
+
+    async def profile(self, seconds: float, interval: float = 0.005) -> bytes:
+        """
+        Профилирует поток цикла событий в течение seconds секунд
+        :param seconds: Длительность профилирования
+        :param interval: Интервал между снимками стека в секундах
+        :return: Свернутые стеки, по одной строке "кадр;кадр;... количество"
+        :raises ProfilerBusyError: Если профилирование уже идет
+        """
+        if self.running:
+            raise ProfilerBusyError("Профилирование уже запущено")
+        self.running = True
+        stacks: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(), stacks, stop, interval),
+            name="sampling-profiler",
+            daemon=True
+        )
+        started = time.monotonic()
+        try:
+            sampler.start()
+            # Цикл событий продолжает обслуживать запросы, пока идет сбор
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.get_running_loop().run_in_executor(None, sampler.join)
+            self.running = False
+        self.stats["runs"] += 1
+        self.stats["last_samples"] = sum(stacks.values())
+        self.stats["last_duration"] = round(time.monotonic() - started, 3)
+        logger.info(f"Профилирование завершено: {self.stats['last_samples']} снимков")
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()).encode()
+
+    def _sample(self, thread_id: int, stacks: Counter, stop: threading.Event, interval: float):
+        """Снимает стек потока thread_id, пока не выставлен stop"""
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            del frame
+            stacks[";".join(reversed(labels))] += 1
+
+# Создаем глобальный профилировщик
+sampling_profiler = SamplingProfiler()
@@ -1,16 +1,22 @@
+import asyncio
 import json
-import time
-from redis.asyncio import Redis
-from typing import Optional, Any, List, Dict, Union, Set
+import random
+import uuid
+from collections import defaultdict
+from typing import Optional, Any, Awaitable, Callable, List, Dict, Set, Tuple
 import logging
-from utils.config import REDIS_URL
-from utils.redis_utils import get_redis
+from utils.config import (
+    RATE_LIMIT_POLICIES,
+    COUNTER_FLUSH_INTERVAL_MS, COUNTER_SHARDS, COUNTER_SHARDED_KEYS,
+    CACHE_FILL_LOCK_TTL, CACHE_FILL_WAIT_TIMEOUT
+)
+from utils.redis_utils import (
+    get_redis, get_cache, get_cache_raw, get_cache_with_ttl, set_cache, delete_cache,
+    redis_breaker, report_redis_error
+)
 
 logger = logging.getLogger(__name__)
 
-# Создаем подключение к Redis
-redis = Redis.from_url(REDIS_URL, decode_responses=True)
-
 # Префиксы для разных типов данных
 CACHE_PREFIX = "cache:"
 LOCK_PREFIX = "lock:"
@@ -24,6 +30,28 @@ DEFAULT_LOCK_TTL = 30     # 30 секунд
 DEFAULT_RATE_LIMIT_TTL = 60  # 1 минута
 DEFAULT_SESSION_TTL = 86400  # 24 часа
 
+def redis_stats_from_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Выбирает из ответа INFO поля статистики Redis
+    :param info: Ответ INFO (можно объединить несколько секций)
+    :return: Словарь со статистикой
+    """
+    hits = info.get("keyspace_hits", 0)
+    misses = info.get("keyspace_misses", 0)
+    total = hits + misses
+    return {
+        "used_memory": info.get("used_memory_human", "N/A"),
+        "used_memory_bytes": info.get("used_memory", 0),
+        "used_memory_peak": info.get("used_memory_peak_human", "N/A"),
+        "total_connections_received": info.get("total_connections_received", 0),
+        "total_commands_processed": info.get("total_commands_processed", 0),
+        "instantaneous_ops_per_sec": info.get("instantaneous_ops_per_sec", 0),
+        "keyspace_hits": hits,
+        "keyspace_misses": misses,
+        # Процент попаданий в кэш
+        "hit_rate": round((hits / total) * 100, 2) if total > 0 else 0
+    }
+
 async def get_redis_info() -> Dict[str, Any]:
     """
     Получает информацию о состоянии Redis сервера
@@ -34,7 +62,7 @@ async def get_redis_info() -> Dict[str, Any]:
         info = await redis.info()
         return info
     except Exception as e:
-        logger.error(f"Ошибка при получении информации о Redis: {str(e)}")
+        report_redis_error("Ошибка при получении информации о Redis", e)
         return {}
 
 async def get_redis_stats() -> Dict[str, Any]:
@@ -44,28 +72,9 @@ async def get_redis_stats() -> Dict[str, Any]:
     """
     try:
         redis = await get_redis()
-        info = await redis.info()
-        stats = {
-            "used_memory": info.get("used_memory_human", "N/A"),
-            "used_memory_peak": info.get("used_memory_peak_human", "N/A"),
-            "total_connections_received": info.get("total_connections_received", 0),
-            "total_commands_processed": info.get("total_commands_processed", 0),
-            "instantaneous_ops_per_sec": info.get("instantaneous_ops_per_sec", 0),
-            "keyspace_hits": info.get("keyspace_hits", 0),
-            "keyspace_misses": info.get("keyspace_misses", 0),
-            "hit_rate": 0
-        }
-        
-        # Вычисляем процент попаданий в кэш
-        hits = info.get("keyspace_hits", 0)
-        misses = info.get("keyspace_misses", 0)
-        total = hits + misses
-        if total > 0:
-            stats["hit_rate"] = round((hits / total) * 100, 2)
-            
-        return stats
+        return redis_stats_from_info(await redis.info())
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики Redis: {str(e)}")
+        report_redis_error("Ошибка при получении статистики Redis", e)
         return {}
 
 async def acquire_lock(lock_name: str, owner: str, ttl: int = DEFAULT_LOCK_TTL) -> bool:
@@ -83,9 +92,17 @@ async def acquire_lock(lock_name: str, owner: str, ttl: int = DEFAULT_LOCK_TTL)
         result = await redis.set(lock_key, owner, nx=True, ex=ttl)
         return result is not None
     except Exception as e:
-        logger.error(f"Ошибка при получении блокировки {lock_name}: {str(e)}")
+        report_redis_error(f"Ошибка при получении блокировки {lock_name}", e)
         return False
 
+# Удаляет блокировку только если ей по-прежнему владеет вызывающий
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 async def release_lock(lock_name: str, owner: str) -> bool:
     """
     Освобождает блокировку, если текущий владелец совпадает
@@ -96,65 +113,458 @@ async def release_lock(lock_name: str, owner: str) -> bool:
     lock_key = f"{LOCK_PREFIX}{lock_name}"
     try:
         redis = await get_redis()
-        # Проверяем, что блокировка принадлежит указанному владельцу
-        current_owner = await redis.get(lock_key)
-        if current_owner != owner:
-            return False
-        
-        # Удаляем блокировку
-        await redis.delete(lock_key)
-        return True
+        # Проверка владельца и удаление выполняются атомарно одним вызовом
+        released = await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, owner)
+        return bool(released)
     except Exception as e:
-        logger.error(f"Ошибка при освобождении блокировки {lock_name}: {str(e)}")
+        report_redis_error(f"Ошибка при освобождении блокировки {lock_name}", e)
         return False
 
+# Загрузки, выполняемые в этом воркере: ключ кэша -> future с результатом
+_inflight_loads: Dict[str, asyncio.Future] = {}
+# Результат загрузки, отмененной вместе с начавшим ее запросом
+_LOAD_CANCELLED = object()
+# Ключи, для которых уже запущено фоновое обновление
+_refreshing: Set[str] = set()
+
+async def get_or_load(
+    key: str,
+    loader: Callable[[], Awaitable[Optional[Any]]],
+    expire: int = DEFAULT_CACHE_TTL,
+    soft_ttl: Optional[int] = None,
+    raw: bool = False
+) -> Optional[Any]:
+    """
+    Получает данные из кэша, а при промахе загружает их один раз на все
+    одновременные запросы: внутри воркера запросы ждут общую загрузку,
+    между воркерами загрузку выполняет владелец блокировки.
+    :param key: Ключ кэша
+    :param loader: Корутина загрузки данных; None означает, что данных нет
+    :param expire: Время жизни записи в кэше в секундах
+    :param soft_ttl: Через сколько секунд запись считается устаревшей: она еще
+                     отдается, но обновляется в фоне
+    :param raw: Вернуть сериализованные данные (bytes); loader тогда тоже возвращает bytes
+    :return: Данные или None
+    """
+    value, ttl = await get_cache_with_ttl(key, raw=raw)
+    if value is not None:
+        if soft_ttl is not None and ttl is not None and expire - ttl >= soft_ttl:
+            _schedule_refresh(key, loader, expire)
+        return value
+    
+    future = _inflight_loads.get(key)
+    if future is not None:
+        value = await asyncio.shield(future)
+        if value is not _LOAD_CANCELLED:
+            return value
+        # Загрузку отменили вместе с запросом, который ее начал
+        return await _load_and_fill(key, loader, expire, raw)
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight_loads[key] = future
+    try:
+        value = await _load_and_fill(key, loader, expire, raw)
+        future.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        future.set_result(_LOAD_CANCELLED)
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # Помечаем исключение как полученное, если загрузку никто не ждал
+        future.exception()
+        raise
+    finally:
+        _inflight_loads.pop(key, None)
+
+async def _load_and_fill(
+    key: str,
+    loader: Callable[[], Awaitable[Optional[Any]]],
+    expire: int,
+    raw: bool = False
+) -> Optional[Any]:
+    """Загружает данные под блокировкой или дожидается загрузки другим воркером"""
+    if redis_breaker.is_open:
+        # Без Redis координировать воркеров нельзя — сразу читаем из базы
+        return await loader()
+    owner = uuid.uuid4().hex
+    lock_name = f"fill:{key}"
+    if await acquire_lock(lock_name, owner, ttl=CACHE_FILL_LOCK_TTL):
+        try:
+            value = await loader()
+            if value is not None:
+                await set_cache(key, value, expire)
+            return value
+        finally:
+            await release_lock(lock_name, owner)
+    
+    # Данные уже загружает другой воркер: ждем, пока они появятся в кэше
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + CACHE_FILL_WAIT_TIMEOUT
+    while loop.time() < deadline and not redis_breaker.is_open:
+        await asyncio.sleep(0.05)
+        value = await (get_cache_raw(key) if raw else get_cache(key))
+        if value is not None:
+            return value
+    # Не дождались (или данных нет) — загружаем сами
+    return await loader()
+
+def _schedule_refresh(key: str, loader: Callable[[], Awaitable[Optional[Any]]], expire: int) -> None:
+    """Запускает фоновое обновление устаревшей записи, если оно еще не запущено"""
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+    task = asyncio.create_task(_refresh(key, loader, expire))
+    task.add_done_callback(lambda _: _refreshing.discard(key))
+
+async def _refresh(key: str, loader: Callable[[], Awaitable[Optional[Any]]], expire: int) -> None:
+    owner = uuid.uuid4().hex
+    lock_name = f"fill:{key}"
+    # Обновляет только один воркер; остальные продолжают отдавать устаревшие данные
+    if not await acquire_lock(lock_name, owner, ttl=CACHE_FILL_LOCK_TTL):
+        return
+    try:
+        value = await loader()
+        if value is None:
+            await delete_cache(key)
+        else:
+            await set_cache(key, value, expire)
+    except Exception as e:
+        logger.error(f"Ошибка при фоновом обновлении кэша {key}: {str(e)}")
+    finally:
+        await release_lock(lock_name, owner)
+
+# Алгоритмы ограничения скорости
+SLIDING_WINDOW = "sliding_window"
+TOKEN_BUCKET = "token_bucket"
+
+# Области действия правил
+SCOPE_IP = "ip"
+SCOPE_USER = "user"
+SCOPE_GLOBAL = "global"
+
+# Lua-скрипт проверяет все подходящие правила атомарно и списывает запрос,
+# только если его пропускают все правила. На каждое правило приходится
+# один ключ и три аргумента: алгоритм, лимит, период в мс (для token bucket
+# лимит — это емкость корзины, пополняемая за период).
+# Возвращает {1, 0} если запрос разрешен, иначе {0, через сколько мс повторить}.
+RATE_LIMIT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local retry = 0
+local plans = {}
+for i, key in ipairs(KEYS) do
+    local base = (i - 1) * 3
+    local algo = ARGV[base + 1]
+    local limit = tonumber(ARGV[base + 2])
+    local period = tonumber(ARGV[base + 3])
+    if algo == 'sw' then
+        local start = now - (now % period)
+        local data = redis.call('HMGET', key, 'start', 'cur', 'prev')
+        local s = tonumber(data[1]) or start
+        local cur = tonumber(data[2]) or 0
+        local prev = tonumber(data[3]) or 0
+        if s ~= start then
+            if start - s == period then prev = cur else prev = 0 end
+            cur = 0
+        end
+        local elapsed = now - start
+        local estimated = prev * (period - elapsed) / period + cur
+        if estimated + 1 > limit then
+            local wait = period - elapsed
+            if prev > 0 and cur + 1 <= limit then
+                wait = math.min(wait, math.ceil((estimated + 1 - limit) * period / prev))
+            end
+            retry = math.max(retry, wait)
+        end
+        plans[i] = {start, cur + 1, prev}
+    else
+        local rate = limit / period
+        local data = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or limit
+        local ts = tonumber(data[2]) or now
+        tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+        if tokens < 1 then
+            retry = math.max(retry, math.ceil((1 - tokens) / rate))
+        end
+        plans[i] = {tokens - 1}
+    end
+end
+if retry > 0 then
+    return {0, retry}
+end
+for i, key in ipairs(KEYS) do
+    local base = (i - 1) * 3
+    local period = tonumber(ARGV[base + 3])
+    if ARGV[base + 1] == 'sw' then
+        redis.call('HSET', key, 'start', plans[i][1], 'cur', plans[i][2], 'prev', plans[i][3])
+        redis.call('PEXPIRE', key, period * 2)
+    else
+        redis.call('HSET', key, 'tokens', tostring(plans[i][1]), 'ts', now)
+        redis.call('PEXPIRE', key, period + 1000)
+    end
+end
+return {1, 0}
+"""
+
+class RateLimitPolicy:
+    """Декларативное правило ограничения скорости"""
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        period: int = DEFAULT_RATE_LIMIT_TTL,
+        algorithm: str = SLIDING_WINDOW,
+        scope: str = SCOPE_IP,
+        route: Optional[str] = None,
+        methods: Optional[List[str]] = None
+    ):
+        """
+        :param name: Имя правила, входит в ключ Redis
+        :param limit: Количество запросов за период (емкость корзины для token bucket)
+        :param period: Период в секундах
+        :param algorithm: SLIDING_WINDOW или TOKEN_BUCKET
+        :param scope: По какому признаку считать запросы: ip, user или global
+        :param route: Префикс пути, к которому применяется правило (None — ко всем)
+        :param methods: HTTP-методы, к которым применяется правило (None — ко всем)
+        """
+        if algorithm not in (SLIDING_WINDOW, TOKEN_BUCKET):
+            raise ValueError(f"Неизвестный алгоритм ограничения скорости: {algorithm}")
+        if scope not in (SCOPE_IP, SCOPE_USER, SCOPE_GLOBAL):
+            raise ValueError(f"Неизвестная область ограничения скорости: {scope}")
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.algorithm = algorithm
+        self.scope = scope
+        self.route = route
+        self.methods = {m.upper() for m in methods} if methods else None
+    
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method.upper() not in self.methods:
+            return False
+        return self.route is None or path.startswith(self.route)
+    
+    def key_for(self, client_ip: str, user_id: Optional[str]) -> Optional[str]:
+        """Ключ счетчика правила или None, если правило неприменимо к запросу"""
+        if self.scope == SCOPE_GLOBAL:
+            return f"{RATE_LIMIT_PREFIX}{self.name}"
+        if self.scope == SCOPE_USER:
+            return f"{RATE_LIMIT_PREFIX}{self.name}:user:{user_id}" if user_id else None
+        return f"{RATE_LIMIT_PREFIX}{self.name}:ip:{client_ip}"
+    
+    def script_args(self) -> List[Any]:
+        algo = "sw" if self.algorithm == SLIDING_WINDOW else "tb"
+        return [algo, self.limit, self.period * 1000]
+
+# Правила по умолчанию
+DEFAULT_RATE_LIMIT_POLICIES = [
+    RateLimitPolicy("ip", limit=100, period=60),
+    RateLimitPolicy("share_create", limit=10, period=60, algorithm=TOKEN_BUCKET,
+                    route="/api/share", methods=["POST"]),
+    RateLimitPolicy("user", limit=60, period=60, scope=SCOPE_USER),
+    RateLimitPolicy("global", limit=2000, period=1, algorithm=TOKEN_BUCKET, scope=SCOPE_GLOBAL),
+]
+
+class RateLimiter:
+    """Проверка набора правил одним вызовом предзагруженного Lua-скрипта"""
+    def __init__(self, policies: List[RateLimitPolicy]):
+        self.policies = policies
+        self._script = None
+    
+    async def load(self) -> None:
+        """Предзагружает скрипт в Redis, чтобы вызовы шли через EVALSHA"""
+        try:
+            redis = await get_redis()
+            self._script = redis.register_script(RATE_LIMIT_SCRIPT)
+            await redis.script_load(RATE_LIMIT_SCRIPT)
+        except Exception as e:
+            report_redis_error("Ошибка при загрузке скрипта ограничения скорости", e)
+    
+    async def check(
+        self,
+        method: str,
+        path: str,
+        client_ip: str,
+        user_id: Optional[str] = None
+    ) -> Tuple[bool, float]:
+        """
+        Проверяет все подходящие правила за один запрос к Redis
+        :return: Разрешен ли запрос и через сколько секунд можно повторить
+        """
+        keys, args = [], []
+        for policy in self.policies:
+            if not policy.matches(method, path):
+                continue
+            key = policy.key_for(client_ip, user_id)
+            if key is None:
+                continue
+            keys.append(key)
+            args.extend(policy.script_args())
+        if not keys:
+            return True, 0
+        return await self._evaluate(keys, args)
+    
+    async def check_key(
+        self,
+        key: str,
+        limit: int,
+        period: int = DEFAULT_RATE_LIMIT_TTL,
+        algorithm: str = SLIDING_WINDOW
+    ) -> Tuple[bool, float]:
+        """
+        Проверяет произвольный ключ вне набора правил
+        :param key: Ключ счетчика без префикса
+        :param limit: Количество запросов за период
+        :param period: Период в секундах
+        :return: Разрешен ли запрос и через сколько секунд можно повторить
+        """
+        policy = RateLimitPolicy(key, limit, period, algorithm=algorithm)
+        return await self._evaluate([f"{RATE_LIMIT_PREFIX}{key}"], policy.script_args())
+    
+    async def _evaluate(self, keys: List[str], args: List[Any]) -> Tuple[bool, float]:
+        try:
+            redis = await get_redis()
+            if self._script is None:
+                self._script = redis.register_script(RATE_LIMIT_SCRIPT)
+            # Script сам перезагрузит скрипт при NOSCRIPT, например после рестарта Redis
+            allowed, retry_ms = await self._script(keys=keys, args=args, client=redis)
+            return bool(allowed), int(retry_ms) / 1000
+        except Exception as e:
+            report_redis_error(f"Ошибка при проверке ограничения скорости для {keys}", e)
+            # В случае ошибки разрешаем запрос
+            return True, 0
+
+def load_rate_limit_policies(raw: Optional[str]) -> List[RateLimitPolicy]:
+    """
+    Загружает правила из JSON-строки или возвращает правила по умолчанию
+    """
+    if not raw:
+        return DEFAULT_RATE_LIMIT_POLICIES
+    try:
+        return [RateLimitPolicy(**policy) for policy in json.loads(raw)]
+    except (ValueError, TypeError) as e:
+        logger.error(f"Некорректные правила ограничения скорости, используются правила по умолчанию: {str(e)}")
+        return DEFAULT_RATE_LIMIT_POLICIES
+
+# Создаем глобальный ограничитель скорости
+rate_limiter = RateLimiter(load_rate_limit_policies(RATE_LIMIT_POLICIES))
+
 async def rate_limit_check(key: str, limit: int, period: int = DEFAULT_RATE_LIMIT_TTL) -> bool:
     """
-    Проверяет, не превышен ли лимит запросов
+    Проверяет, не превышен ли лимит запросов (скользящее окно, один вызов Redis)
     :param key: Ключ для ограничения (например, IP-адрес или user_id)
     :param limit: Максимальное количество запросов за период
     :param period: Период в секундах
     :return: True, если лимит не превышен, иначе False
     """
-    rate_key = f"{RATE_LIMIT_PREFIX}{key}"
-    try:
-        redis = await get_redis()
-        # Получаем текущее количество запросов
-        count = await redis.get(rate_key)
-        
-        # Если ключа нет, создаем его
-        if count is None:
-            await redis.set(rate_key, 1, ex=period)
-            return True
-        
-        # Если лимит не превышен, увеличиваем счетчик
-        count = int(count)
-        if count < limit:
-            await redis.incr(rate_key)
-            return True
-        
-        # Лимит превышен
-        return False
-    except Exception as e:
-        logger.error(f"Ошибка при проверке ограничения скорости для {key}: {str(e)}")
-        # В случае ошибки разрешаем запрос
-        return True
+    allowed, _ = await rate_limiter.check_key(key, limit, period)
+    return allowed
+
+class CounterAggregator:
+    """
+    Накапливает приращения счетчиков в памяти процесса и периодически
+    записывает их в Redis одним пакетом
+    """
+    def __init__(
+        self,
+        flush_interval_ms: int = COUNTER_FLUSH_INTERVAL_MS,
+        shards: int = COUNTER_SHARDS,
+        sharded_keys: List[str] = COUNTER_SHARDED_KEYS
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.shards = max(1, shards)
+        self.sharded_keys = set(sharded_keys)
+        # Каждый воркер пишет горячие счетчики в свой шард
+        self.shard = random.randrange(self.shards)
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._flushing: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    def add(self, key: str, amount: int = 1) -> int:
+        """Увеличивает локальное приращение счетчика без обращения к Redis"""
+        self._pending[key] += amount
+        return self._pending[key]
+    
+    def unflushed(self, key: str) -> int:
+        """Приращение, еще не записанное в Redis"""
+        return self._pending.get(key, 0) + self._flushing.get(key, 0)
+    
+    def storage_keys(self, key: str) -> List[str]:
+        """Все ключи Redis, в которых хранится значение счетчика"""
+        base = f"{COUNTER_PREFIX}{key}"
+        if key not in self.sharded_keys:
+            return [base]
+        return [base] + [f"{base}:{shard}" for shard in range(self.shards)]
+    
+    def _write_key(self, key: str) -> str:
+        base = f"{COUNTER_PREFIX}{key}"
+        return f"{base}:{self.shard}" if key in self.sharded_keys else base
+    
+    async def flush(self) -> None:
+        """Записывает накопленные приращения в Redis одним пайплайном"""
+        if not self._pending or self._flushing:
+            return
+        self._flushing, self._pending = self._pending, defaultdict(int)
+        written = False
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for key, amount in self._flushing.items():
+                pipe.incrby(self._write_key(key), amount)
+            await pipe.execute()
+            written = True
+        except Exception as e:
+            report_redis_error("Ошибка при записи счетчиков", e)
+        finally:
+            if not written:
+                # Возвращаем приращения, чтобы записать их при следующей попытке
+                for key, amount in self._flushing.items():
+                    self._pending[key] += amount
+            self._flushing = {}
+    
+    async def start(self) -> None:
+        """Запускает периодическую запись счетчиков"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+    
+    async def stop(self) -> None:
+        """Останавливает периодическую запись и сбрасывает остаток"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+    
+    async def _flush_periodically(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+# Создаем глобальный агрегатор счетчиков
+counter_aggregator = CounterAggregator()
 
 async def increment_counter(key: str, amount: int = 1) -> int:
     """
-    Увеличивает счетчик на указанное значение
+    Увеличивает счетчик на указанное значение.
+    Приращение копится в памяти и записывается в Redis в фоне.
     :param key: Ключ счетчика
     :param amount: Значение для увеличения
-    :return: Новое значение счетчика
+    :return: Еще не записанное в Redis приращение счетчика в этом процессе
     """
-    counter_key = f"{COUNTER_PREFIX}{key}"
-    try:
-        redis = await get_redis()
-        # Увеличиваем счетчик и возвращаем новое значение
-        return await redis.incrby(counter_key, amount)
-    except Exception as e:
-        logger.error(f"Ошибка при увеличении счетчика {key}: {str(e)}")
-        return 0
+    return counter_aggregator.add(key, amount)
+
+def counter_total(key: str, stored: List[Optional[bytes]]) -> int:
+    """
+    Значение счетчика по прочитанным из Redis шардам
+    :param key: Ключ счетчика
+    :param stored: Значения ключей counter_aggregator.storage_keys(key) из MGET
+    :return: Сумма шардов и еще не записанных в Redis приращений этого процесса
+    """
+    return sum(int(value) for value in stored if value) + counter_aggregator.unflushed(key)
 
 async def get_counter(key: str) -> int:
     """
@@ -162,14 +572,12 @@ async def get_counter(key: str) -> int:
     :param key: Ключ счетчика
     :return: Текущее значение счетчика
     """
-    counter_key = f"{COUNTER_PREFIX}{key}"
     try:
         redis = await get_redis()
-        value = await redis.get(counter_key)
-        return int(value) if value else 0
+        return counter_total(key, await redis.mget(counter_aggregator.storage_keys(key)))
     except Exception as e:
-        logger.error(f"Ошибка при получении счетчика {key}: {str(e)}")
-        return 0
+        report_redis_error(f"Ошибка при получении счетчика {key}", e)
+        return counter_aggregator.unflushed(key)
 
 async def set_session_data(session_id: str, data: Dict[str, Any], ttl: int = DEFAULT_SESSION_TTL) -> bool:
     """
@@ -185,7 +593,7 @@ async def set_session_data(session_id: str, data: Dict[str, Any], ttl: int = DEF
         await redis.set(session_key, json.dumps(data), ex=ttl)
         return True
     except Exception as e:
-        logger.error(f"Ошибка при сохранении данных сессии {session_id}: {str(e)}")
+        report_redis_error(f"Ошибка при сохранении данных сессии {session_id}", e)
         return False
 
 async def get_session_data(session_id: str) -> Optional[Dict[str, Any]]:
@@ -200,7 +608,7 @@ async def get_session_data(session_id: str) -> Optional[Dict[str, Any]]:
         data = await redis.get(session_key)
         return json.loads(data) if data else None
     except Exception as e:
-        logger.error(f"Ошибка при получении данных сессии {session_id}: {str(e)}")
+        report_redis_error(f"Ошибка при получении данных сессии {session_id}", e)
         return None
 
 async def update_session_data(session_id: str, data: Dict[str, Any], ttl: int = DEFAULT_SESSION_TTL) -> bool:
@@ -226,7 +634,7 @@ async def update_session_data(session_id: str, data: Dict[str, Any], ttl: int =
         await redis.set(session_key, json.dumps(current_data), ex=ttl)
         return True
     except Exception as e:
-        logger.error(f"Ошибка при обновлении данных сессии {session_id}: {str(e)}")
+        report_redis_error(f"Ошибка при обновлении данных сессии {session_id}", e)
         return False
 
 async def delete_session(session_id: str) -> bool:
@@ -241,5 +649,5 @@ async def delete_session(session_id: str) -> bool:
         await redis.delete(session_key)
         return True
     except Exception as e:
-        logger.error(f"Ошибка при удалении сессии {session_id}: {str(e)}")
+        report_redis_error(f"Ошибка при удалении сессии {session_id}", e)
         return False 
\ No newline at end of file
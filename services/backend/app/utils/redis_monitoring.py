@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from utils.config import REDIS_MONITOR_INTERVAL, REDIS_MONITOR_SAMPLES
+from utils.redis_utils import get_redis, report_redis_error
+from utils.redis_advanced import counter_aggregator, counter_total, redis_stats_from_info
+
+logger = logging.getLogger(__name__)
+
+# Счетчики, которые отдает мониторинг
+MONITORED_COUNTERS = ("api_requests", "share_created", "user_updated", "messages_sent")
+
+# Скорости, считаемые по приращениям счетчиков: имя -> счетчик
+COUNTER_RATES = {
+    "requests_per_sec": "api_requests",
+    "shares_per_sec": "share_created",
+    "user_updates_per_sec": "user_updated",
+    "messages_per_sec": "messages_sent",
+}
+
+def _per_second(newer: int, older: int, seconds: float) -> float:
+    # Счетчики могли обнулиться (например, после перезапуска Redis)
+    return round(max(0, newer - older) / seconds, 3) if seconds > 0 else 0.0
+
+def _rates(newer: Dict[str, Any], older: Dict[str, Any]) -> Dict[str, Any]:
+    """Скорости и доля попаданий между двумя замерами"""
+    seconds = newer["monotonic"] - older["monotonic"]
+    rates = {
+        name: _per_second(newer["counters"][counter], older["counters"][counter], seconds)
+        for name, counter in COUNTER_RATES.items()
+    }
+    rates["commands_per_sec"] = _per_second(
+        newer["redis_stats"]["total_commands_processed"], older["redis_stats"]["total_commands_processed"], seconds
+    )
+    hits = newer["redis_stats"]["keyspace_hits"] - older["redis_stats"]["keyspace_hits"]
+    misses = newer["redis_stats"]["keyspace_misses"] - older["redis_stats"]["keyspace_misses"]
+    rates["hit_rate"] = round(hits / (hits + misses) * 100, 2) if hits >= 0 and misses >= 0 and hits + misses else None
+    return rates
+
+class RedisMonitor:
+    """
+    Фоновый сбор статистики Redis: INFO и счетчики запрашиваются одним
+    пакетом раз в interval секунд, последние замеры хранятся в памяти,
+    поэтому запрос мониторинга не обращается к Redis
+    """
+    def __init__(self, interval: float = REDIS_MONITOR_INTERVAL, max_samples: int = REDIS_MONITOR_SAMPLES):
+        """
+        :param interval: Период сбора в секундах
+        :param max_samples: Сколько последних замеров хранить
+        """
+        self.interval = interval
+        self.samples: Deque[Dict[str, Any]] = deque(maxlen=max(2, max_samples))
+        self.stats = {"samples": 0, "errors": 0, "last_duration": 0.0}
+        self._summary: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запускает периодический сбор"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_periodically())
+            logger.info("Redis monitor started")
+
+    async def stop(self):
+        """Останавливает периодический сбор"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            logger.info("Redis monitor stopped")
+
+    async def _run_periodically(self):
+        try:
+            while True:
+                await self.sample()
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            pass
+
+    async def sample(self) -> bool:
+        """
+        Выполняет один замер: INFO и все ключи счетчиков за один проход по сети
+        :return: True, если замер сохранен
+        """
+        keys = {name: counter_aggregator.storage_keys(name) for name in MONITORED_COUNTERS}
+        started = time.monotonic()
+        try:
+            redis = await get_redis()
+            pipe = redis.pipeline(transaction=False)
+            pipe.info("memory")
+            pipe.info("stats")
+            pipe.mget([key for storage_keys in keys.values() for key in storage_keys])
+            memory, stats, values = await pipe.execute()
+        except Exception as e:
+            self.stats["errors"] += 1
+            report_redis_error("Ошибка при сборе статистики Redis", e)
+            return False
+
+        counters, position = {}, 0
+        for name, storage_keys in keys.items():
+            stored = values[position:position + len(storage_keys)]
+            position += len(storage_keys)
+            counters[name] = counter_total(name, stored)
+
+        self.samples.append({
+            "timestamp": time.time(),
+            "monotonic": time.monotonic(),
+            "redis_stats": redis_stats_from_info({**memory, **stats}),
+            "counters": counters
+        })
+        self._summary = None
+        self.stats["samples"] += 1
+        self.stats["last_duration"] = round(time.monotonic() - started, 4)
+        return True
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """
+        Последний замер со скоростями за последний интервал и за все окно
+        и историей по интервалам; пересчитывается только после нового замера
+        :return: Словарь с данными или None, если замеров еще нет
+        """
+        if not self.samples:
+            return None
+        if self._summary is None:
+            samples = list(self.samples)
+            latest = samples[-1]
+            history: List[Dict[str, Any]] = [
+                {
+                    "timestamp": newer["timestamp"],
+                    "used_memory_bytes": newer["redis_stats"]["used_memory_bytes"],
+                    **_rates(newer, older)
+                }
+                for older, newer in zip(samples, samples[1:])
+            ]
+            self._summary = {
+                "sampled_at": latest["timestamp"],
+                "window_seconds": round(latest["monotonic"] - samples[0]["monotonic"], 3),
+                "redis_stats": latest["redis_stats"],
+                "counters": latest["counters"],
+                "rates": _rates(latest, samples[-2]) if len(samples) > 1 else None,
+                "window_rates": _rates(latest, samples[0]) if len(samples) > 1 else None,
+                "history": history
+            }
+        return self._summary
+
+# Создаем глобальный сборщик статистики Redis
+redis_monitor = RedisMonitor()
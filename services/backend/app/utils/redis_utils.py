@@ -1,10 +1,26 @@
 import json
-from redis.asyncio import Redis
-from typing import Optional, Any
+import random
+import time
+import uuid
+from collections import OrderedDict, deque
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from typing import Optional, Any, Deque, Dict, Iterable, List, Tuple, Union
 import logging
 import asyncio
-from utils.config import REDIS_URL
+from utils.config import (
+    REDIS_URL, L1_CACHE_MAX_SIZE, L1_CACHE_TTL, CACHE_INVALIDATION_CHANNEL,
+    REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_SOCKET_TIMEOUT, REDIS_CONNECT_TIMEOUT,
+    REDIS_BREAKER_FAILURE_THRESHOLD, REDIS_BREAKER_FAILURE_WINDOW,
+    REDIS_BREAKER_PROBE_INTERVAL, REDIS_BREAKER_MAX_PROBE_INTERVAL
+)
 from datetime import date, datetime
+from utils.serialization import dumps, loads
+from utils.cache_codec import cache_codec
+from utils.metrics import metrics, CallbackMetric, redis_command_duration, redis_command_errors
+from utils.tracing import record_span
 
 logger = logging.getLogger(__name__)
 
@@ -15,56 +31,332 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-# Функция для создания подключения к Redis с повторными попытками
-async def get_redis_connection():
-    max_retries = 5
-    retry_delay = 1  # начальная задержка в секундах
+class RedisUnavailableError(Exception):
+    """Redis временно недоступен: автомат разомкнут, команда не отправлялась"""
+
+# Ошибки сети, по которым считаем Redis недоступным (ошибки команд автомат не размыкают)
+CONNECTION_ERRORS = (RedisConnectionError, RedisTimeoutError, OSError, asyncio.TimeoutError)
+
+class CircuitBreaker:
+    """
+    Автоматический выключатель для Redis: после серии сетевых ошибок
+    запросы сразу получают RedisUnavailableError, а восстановление
+    проверяется в фоне, вне обработки запросов
+    """
+    def __init__(
+        self,
+        failure_threshold: int = REDIS_BREAKER_FAILURE_THRESHOLD,
+        failure_window: float = REDIS_BREAKER_FAILURE_WINDOW,
+        probe_interval: float = REDIS_BREAKER_PROBE_INTERVAL,
+        max_probe_interval: float = REDIS_BREAKER_MAX_PROBE_INTERVAL
+    ):
+        """
+        :param failure_threshold: Сколько сетевых ошибок размыкают автомат
+        :param failure_window: За какой период в секундах считаются ошибки
+        :param probe_interval: Начальный интервал проверки восстановления в секундах
+        :param max_probe_interval: Максимальный интервал проверки в секундах
+        """
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.is_open = False
+        self._failures: Deque[float] = deque()
+        self._probe_task: Optional[asyncio.Task] = None
+        self.stats = {"trips": 0, "rejected": 0, "probes": 0}
     
-    for attempt in range(max_retries):
-        try:
-            # Создаем новое подключение к Redis
-            connection = Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=5, socket_connect_timeout=5)
-            # Проверяем подключение
-            await connection.ping()
-            logger.info("Успешное подключение к Redis")
-            return connection
-        except Exception as e:
-            logger.error(f"Ошибка подключения к Redis (попытка {attempt+1}/{max_retries}): {str(e)}")
-            if attempt < max_retries - 1:
-                # Увеличиваем задержку экспоненциально (backoff)
-                wait_time = retry_delay * (2 ** attempt)
-                logger.info(f"Повторная попытка через {wait_time} секунд...")
-                await asyncio.sleep(wait_time)
-            else:
-                logger.error("Не удалось подключиться к Redis после нескольких попыток")
+    def check(self) -> None:
+        """Сразу отказывает, пока Redis недоступен"""
+        if self.is_open:
+            self.stats["rejected"] += 1
+            raise RedisUnavailableError("Redis недоступен")
+    
+    def record_failure(self, error: Exception) -> None:
+        """Учитывает ошибку; при превышении порога размыкает автомат"""
+        if self.is_open or not isinstance(error, CONNECTION_ERRORS):
+            return
+        now = time.monotonic()
+        self._failures.append(now)
+        while self._failures and self._failures[0] <= now - self.failure_window:
+            self._failures.popleft()
+        if len(self._failures) >= self.failure_threshold:
+            self._open()
+    
+    def _open(self) -> None:
+        self.is_open = True
+        self._failures.clear()
+        self.stats["trips"] += 1
+        logger.error("Redis недоступен, запросы обслуживаются без кэша")
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe())
+    
+    def _close(self) -> None:
+        self.is_open = False
+        self._probe_task = None
+        # Пока Redis был недоступен, могли быть пропущены сообщения об инвалидации
+        local_cache.clear()
+        logger.info("Подключение к Redis восстановлено")
+    
+    async def _probe(self) -> None:
+        """Проверяет Redis с растущим интервалом, пока он не ответит"""
+        delay = self.probe_interval
+        while True:
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            self.stats["probes"] += 1
+            try:
+                await redis.ping()
+                self._close()
+                return
+            except asyncio.CancelledError:
+                self._probe_task = None
                 raise
+            except Exception as e:
+                logger.debug(f"Redis по-прежнему недоступен: {str(e)}")
+                delay = min(delay * 2, self.max_probe_interval)
+    
+    async def stop(self) -> None:
+        """Останавливает фоновую проверку восстановления"""
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
 
-# Создаем подключение к Redis
-redis = None
+def _command_name(args: tuple) -> str:
+    name = args[0] if args else "unknown"
+    return (name.decode() if isinstance(name, bytes) else str(name)).upper()
 
-# Функция для получения или создания подключения к Redis
-async def get_redis():
-    global redis
-    if redis is None:
-        redis = await get_redis_connection()
+class InstrumentedPipeline(Pipeline):
+    """Пакет команд, время выполнения которого учитывается в метриках по составу пакета"""
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        if not self.command_stack:
+            return await super().execute(raise_on_error)
+        # Набор команд пакета определяется кодом, поэтому число значений метки ограничено
+        names = dict.fromkeys(_command_name(args) for args, _ in self.command_stack)
+        command = "PIPELINE " + ",".join(names)
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except Exception:
+            redis_command_errors.inc(command)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            redis_command_duration.observe(duration, command)
+            record_span("redis", started, duration, command)
+
+class InstrumentedRedis(Redis):
+    """Клиент Redis, учитывающий время выполнения команд в метриках"""
+    async def execute_command(self, *args, **options):
+        command = _command_name(args)
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            redis_command_errors.inc(command)
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            redis_command_duration.observe(duration, command)
+            record_span("redis", started, duration, command)
+    
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# Общий пул подключений для всех модулей; значения храним в bytes,
+# чтобы отдавать их клиенту без перекодирования. Если установлен hiredis,
+# redis-py использует его парсер ответов автоматически.
+pool = BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    socket_keepalive=True,
+    decode_responses=False
+)
+
+# Клиент Redis поверх общего пула
+redis = InstrumentedRedis(connection_pool=pool)
+
+# Создаем глобальный автомат для Redis
+redis_breaker = CircuitBreaker()
+
+# Функция для получения подключения к Redis
+async def get_redis() -> Redis:
+    """
+    Возвращает клиент Redis с общим пулом подключений
+    :raises RedisUnavailableError: Если Redis недоступен (без сетевого запроса)
+    """
+    redis_breaker.check()
     return redis
 
+def report_redis_error(message: str, error: Exception) -> None:
+    """
+    Логирует ошибку обращения к Redis и учитывает ее в статистике и в автомате
+    :param message: Описание операции для лога
+    :param error: Исключение, полученное при обращении к Redis
+    """
+    if isinstance(error, RedisUnavailableError):
+        # Автомат уже разомкнут и об этом залогировано: не засоряем лог на каждом запросе
+        logger.debug(f"{message}: {str(error)}")
+        return
+    logger.error(f"{message}: {str(error)}")
+    cache_stats["redis"]["errors"] += 1
+    redis_breaker.record_failure(error)
+
+async def close_redis() -> None:
+    """
+    Останавливает проверку восстановления и закрывает подключения пула
+    """
+    await redis_breaker.stop()
+    await pool.disconnect()
+
+class LocalCache:
+    """Ограниченный по размеру LRU-кэш с TTL в памяти процесса (хранит значения в виде JSON)"""
+    def __init__(self, max_size: int = L1_CACHE_MAX_SIZE, ttl: int = L1_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Any:
+        """Возвращает значение или _MISSING, если его нет или оно устарело"""
+        entry = self._data.get(key)
+        if entry is None:
+            cache_stats["l1"]["misses"] += 1
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            cache_stats["l1"]["expired"] += 1
+            cache_stats["l1"]["misses"] += 1
+            return _MISSING
+        self._data.move_to_end(key)
+        cache_stats["l1"]["hits"] += 1
+        return value
+    
+    def set(self, key: str, value: Any, expire: Optional[int] = None) -> None:
+        """Сохраняет значение; TTL не превышает время жизни записи в Redis"""
+        ttl = self.ttl if expire is None else min(self.ttl, expire)
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            cache_stats["l1"]["evictions"] += 1
+    
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+# Маркер отсутствующего значения (None — допустимое значение в кэше)
+_MISSING = object()
+
+# Счетчики попаданий по уровням кэша
+cache_stats: Dict[str, Dict[str, int]] = {
+    "l1": {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "invalidations": 0},
+    "redis": {"hits": 0, "misses": 0, "errors": 0}
+}
+
+# Локальный кэш текущего воркера
+local_cache = LocalCache()
+
+# Идентификатор воркера, чтобы не обрабатывать собственные сообщения об инвалидации
+INSTANCE_ID = uuid.uuid4().hex
+
+_invalidation_task: Optional[asyncio.Task] = None
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Возвращает счетчики попаданий, промахов и вытеснений по уровням кэша
+    """
+    stats = {layer: dict(counters) for layer, counters in cache_stats.items()}
+    stats["l1"]["size"] = len(local_cache)
+    stats["redis"]["circuit_open"] = int(redis_breaker.is_open)
+    stats["redis"].update(redis_breaker.stats)
+    return stats
+
+def _cache_requests() -> Dict[Tuple[str, str], int]:
+    return {
+        (layer, result): cache_stats[layer][key]
+        for layer in cache_stats
+        for result, key in (("hit", "hits"), ("miss", "misses"))
+    }
+
+def _cache_hit_ratio() -> Dict[Tuple[str], float]:
+    ratios = {}
+    for layer, counters in cache_stats.items():
+        total = counters["hits"] + counters["misses"]
+        ratios[(layer,)] = counters["hits"] / total if total else 0.0
+    return ratios
+
+# Попадания по уровням кэша читаются из cache_stats при выгрузке метрик
+metrics.register(CallbackMetric(
+    "cache_requests_total", "Обращения к кэшу по уровням", ("layer", "result"), _cache_requests, "counter"
+))
+metrics.register(CallbackMetric(
+    "cache_hit_ratio", "Доля попаданий по уровням кэша с запуска процесса", ("layer",), _cache_hit_ratio
+))
+metrics.register(CallbackMetric(
+    "cache_l1_entries", "Записей в локальном кэше", (), lambda: {(): len(local_cache)}
+))
+metrics.register(CallbackMetric(
+    "redis_circuit_open", "Автомат Redis разомкнут", (), lambda: {(): int(redis_breaker.is_open)}
+))
+
+def _invalidation_message(keys: Optional[List[str]]) -> str:
+    """Формирует сообщение об инвалидации; keys=None означает очистку всего кэша"""
+    return json.dumps({"origin": INSTANCE_ID, "keys": keys})
+
+def _encode(value: Any) -> Tuple[bytes, bytes]:
+    """
+    Кодирует значение для локального кэша и для Redis
+    :param value: Объект или готовый JSON в bytes (например, тело ответа)
+    :return: JSON для локального кэша и запись в формате кодека для Redis
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value), cache_codec.encode(value)
+    return dumps(value), cache_codec.encode(value)
+
+def _decode(data: bytes) -> bytes:
+    """Приводит запись из Redis (бинарную или JSON прежнего формата) к JSON"""
+    return cache_codec.to_json(data)
+
 async def set_cache(key: str, value: Any, expire: int = 3600) -> None:
     """
     Сохраняет данные в кэш
     :param key: Ключ для сохранения
-    :param value: Значение для сохранения (будет сериализовано в JSON)
+    :param value: Значение для сохранения (будет сериализовано в JSON) или готовый JSON в bytes
     :param expire: Время жизни кэша в секундах (по умолчанию 1 час)
     """
+    json_data, data = _encode(value)
+    local_cache.set(key, json_data, expire)
     try:
         r = await get_redis()
-        await r.set(key, json.dumps(value, cls=CustomJSONEncoder), ex=expire)
+        # Запись и уведомление других воркеров уходят одним пакетом
+        pipe = r.pipeline(transaction=False)
+        pipe.set(key, data, ex=expire)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, _invalidation_message([key]))
+        await pipe.execute()
         logger.debug(f"Данные сохранены в кэш: {key}")
     except Exception as e:
-        logger.error(f"Ошибка при сохранении в кэш: {str(e)}")
-        # Сбрасываем подключение, чтобы при следующем вызове создать новое
-        global redis
-        redis = None
+        report_redis_error("Ошибка при сохранении в кэш", e)
+
+async def get_cache_raw(key: str) -> Optional[bytes]:
+    """
+    Получает сериализованные данные из кэша без десериализации,
+    чтобы отдать их клиенту как готовое тело ответа
+    :param key: Ключ для получения данных
+    :return: JSON в bytes или None, если данных нет
+    """
+    data, _ = await get_cache_with_ttl(key, raw=True)
+    return data
 
 async def get_cache(key: str) -> Optional[Any]:
     """
@@ -72,49 +364,207 @@ async def get_cache(key: str) -> Optional[Any]:
     :param key: Ключ для получения данных
     :return: Данные из кэша или None, если данных нет
     """
+    data, _ = await get_cache_with_ttl(key)
+    return data
+
+async def get_cache_with_ttl(key: str, raw: bool = False) -> Tuple[Optional[Any], Optional[int]]:
+    """
+    Получает данные из кэша вместе с оставшимся временем жизни записи в Redis
+    :param key: Ключ для получения данных
+    :param raw: Вернуть сериализованные данные (bytes) без десериализации
+    :return: Данные (или None) и оставшееся время жизни в секундах
+             (None, если данные взяты из локального кэша или срок не задан)
+    """
+    data = local_cache.get(key)
+    if data is not _MISSING:
+        logger.debug(f"Данные получены из локального кэша: {key}")
+        return (data if raw else loads(data)), None
     try:
         r = await get_redis()
-        data = await r.get(key)
+        pipe = r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        data, ttl = await pipe.execute()
         if data:
             logger.debug(f"Данные получены из кэша: {key}")
-            return json.loads(data)
+            cache_stats["redis"]["hits"] += 1
+            ttl = ttl if ttl is not None and ttl >= 0 else None
+            data = _decode(data)
+            local_cache.set(key, data, ttl)
+            return (data if raw else loads(data)), ttl
         logger.debug(f"Данные не найдены в кэше: {key}")
-        return None
+        cache_stats["redis"]["misses"] += 1
+        return None, None
     except Exception as e:
-        logger.error(f"Ошибка при получении из кэша: {str(e)}")
-        # Сбрасываем подключение, чтобы при следующем вызове создать новое
-        global redis
-        redis = None
-        return None
+        report_redis_error("Ошибка при получении из кэша", e)
+        return None, None
 
 async def delete_cache(key: str) -> None:
     """
     Удаляет данные из кэша
     :param key: Ключ для удаления
     """
+    await delete_many([key])
+
+async def get_many(keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Получает несколько значений из кэша одной командой MGET
+    :param keys: Ключи для получения данных
+    :return: Словарь с найденными данными (отсутствующие ключи не включаются)
+    """
+    result = {}
+    missing = []
+    for key in keys:
+        data = local_cache.get(key)
+        if data is _MISSING:
+            missing.append(key)
+        else:
+            result[key] = loads(data)
+    if not missing:
+        return result
+    try:
+        r = await get_redis()
+        values = await r.mget(missing)
+        found = 0
+        for key, data in zip(missing, values):
+            if data:
+                data = _decode(data)
+                local_cache.set(key, data)
+                result[key] = loads(data)
+                found += 1
+        cache_stats["redis"]["hits"] += found
+        cache_stats["redis"]["misses"] += len(missing) - found
+        logger.debug(f"Получено из кэша {len(result)} ключей, запрошено в Redis {len(missing)}")
+        return result
+    except Exception as e:
+        report_redis_error("Ошибка при получении из кэша", e)
+        return result
+
+async def set_many(
+    items: Dict[str, Any],
+    expire: Union[int, Dict[str, int]] = 3600,
+    delete_keys: Iterable[str] = ()
+) -> None:
+    """
+    Сохраняет несколько значений в кэш за один проход по сети
+    :param items: Словарь ключ -> значение (значения будут сериализованы в JSON)
+    :param expire: Время жизни в секундах, общее или отдельно для каждого ключа
+    :param delete_keys: Ключи, которые нужно удалить в том же проходе
+    """
+    delete_keys = list(delete_keys)
+    if not items and not delete_keys:
+        return
+    for key in delete_keys:
+        local_cache.delete(key)
     try:
         r = await get_redis()
-        await r.delete(key)
-        logger.debug(f"Данные удалены из кэша: {key}")
+        pipe = r.pipeline(transaction=False)
+        for key, value in items.items():
+            ttl = expire.get(key, 3600) if isinstance(expire, dict) else expire
+            json_data, data = _encode(value)
+            local_cache.set(key, json_data, ttl)
+            pipe.set(key, data, ex=ttl)
+        if delete_keys:
+            pipe.delete(*delete_keys)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, _invalidation_message(list(items) + delete_keys))
+        await pipe.execute()
+        logger.debug(f"Сохранено в кэш {len(items)} ключей")
     except Exception as e:
-        logger.error(f"Ошибка при удалении из кэша: {str(e)}")
-        # Сбрасываем подключение, чтобы при следующем вызове создать новое
-        global redis
-        redis = None
+        report_redis_error("Ошибка при сохранении в кэш", e)
+
+async def delete_many(keys: Iterable[str]) -> None:
+    """
+    Удаляет несколько ключей из кэша одной командой
+    :param keys: Ключи для удаления
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    for key in keys:
+        local_cache.delete(key)
+    try:
+        r = await get_redis()
+        pipe = r.pipeline(transaction=False)
+        pipe.delete(*keys)
+        pipe.publish(CACHE_INVALIDATION_CHANNEL, _invalidation_message(keys))
+        await pipe.execute()
+        logger.debug(f"Удалено из кэша {len(keys)} ключей")
+    except Exception as e:
+        report_redis_error("Ошибка при удалении из кэша", e)
 
 async def clear_cache() -> None:
     """
     Очищает весь кэш
     """
+    local_cache.clear()
     try:
         r = await get_redis()
         await r.flushdb()
+        await r.publish(CACHE_INVALIDATION_CHANNEL, _invalidation_message(None))
         logger.debug("Кэш очищен")
     except Exception as e:
-        logger.error(f"Ошибка при очистке кэша: {str(e)}")
-        # Сбрасываем подключение, чтобы при следующем вызове создать новое
-        global redis
-        redis = None
+        report_redis_error("Ошибка при очистке кэша", e)
+
+def _apply_invalidation(data: str) -> None:
+    """Удаляет из локального кэша ключи из сообщения другого воркера"""
+    message = json.loads(data)
+    if message.get("origin") == INSTANCE_ID:
+        return
+    keys = message.get("keys")
+    if keys is None:
+        local_cache.clear()
+    else:
+        for key in keys:
+            local_cache.delete(key)
+    cache_stats["l1"]["invalidations"] += 1
+
+async def _listen_invalidations():
+    """Слушает канал инвалидации и переподключается при ошибках"""
+    while True:
+        pubsub = None
+        try:
+            r = await get_redis()
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            # Пока подписки не было, могли быть пропущены сообщения
+            local_cache.clear()
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    try:
+                        _apply_invalidation(message["data"])
+                    except (ValueError, TypeError) as e:
+                        logger.error(f"Некорректное сообщение инвалидации: {str(e)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            report_redis_error("Ошибка подписки на инвалидацию кэша", e)
+            local_cache.clear()
+            await asyncio.sleep(1)
+        finally:
+            if pubsub is not None:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+async def start_cache_invalidation_listener() -> None:
+    """
+    Запускает фоновую подписку на сообщения об инвалидации локального кэша
+    """
+    global _invalidation_task
+    if _invalidation_task is None:
+        _invalidation_task = asyncio.create_task(_listen_invalidations())
+        logger.info("Подписка на инвалидацию кэша запущена")
+
+async def stop_cache_invalidation_listener() -> None:
+    """
+    Останавливает подписку на инвалидацию локального кэша
+    """
+    global _invalidation_task
+    if _invalidation_task is not None:
+        _invalidation_task.cancel()
+        await asyncio.gather(_invalidation_task, return_exceptions=True)
+        _invalidation_task = None
 
 def get_share_cache_key(share_id: str) -> str:
     """
@@ -126,4 +576,10 @@ def get_user_cache_key(user_id: str) -> str:
     """
     Генерирует ключ для кэширования данных пользователя
     """
-    return f"user:{user_id}" 
\ No newline at end of file
+    return f"user:{user_id}" 
+
+def get_user_stats_cache_key(user_id: str) -> str:
+    """
+    Генерирует ключ для кэширования статистики пользователя
+    """
+    return f"user_stats:{user_id}"
@@ -0,0 +1,119 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import time
+from functools import lru_cache
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+from fastapi import Request
+from starlette.routing import Match
+from utils.config import TRUSTED_PROXIES, BOT_TOKEN, TELEGRAM_INIT_DATA_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# Сети доверенных прокси
+_trusted_networks = [ipaddress.ip_network(net, strict=False) for net in TRUSTED_PROXIES]
+
+@lru_cache(maxsize=1024)
+def is_trusted_proxy(host: str) -> bool:
+    """
+    Проверяет, входит ли адрес в список доверенных прокси
+    """
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _trusted_networks)
+
+def get_client_ip(request: Request) -> str:
+    """
+    Определяет адрес клиента с учетом заголовков доверенных прокси.
+    Заголовкам верим только если запрос пришел от доверенного прокси,
+    иначе клиент мог бы подставить произвольный адрес.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return peer
+    
+    # Cloudflare туннель передает исходный адрес клиента в отдельном заголовке
+    cf_ip = request.headers.get("cf-connecting-ip")
+    if cf_ip:
+        return cf_ip.strip()
+    
+    # Идем по цепочке X-Forwarded-For справа налево до первого недоверенного адреса
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if not is_trusted_proxy(hop):
+                return hop
+        if hops:
+            return hops[0]
+    
+    real_ip = request.headers.get("x-real-ip")
+    if real_ip:
+        return real_ip.strip()
+    return peer
+
+# Ключ проверки подписи initData: HMAC-SHA256 токена бота с ключом "WebAppData"
+_init_data_secret = (
+    hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest() if BOT_TOKEN else None
+)
+
+@lru_cache(maxsize=1024)
+def _verify_init_data(init_data: str) -> Optional[Tuple[int, str]]:
+    """
+    Проверяет подпись initData Telegram WebApp
+    :return: Время авторизации и ID пользователя или None, если подпись неверна.
+             Время жизни проверяет вызывающий, поэтому результат можно кэшировать
+    """
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop("hash", "")
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    expected_hash = hmac.new(_init_data_secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(received_hash.encode(), expected_hash.encode()):
+        return None
+    try:
+        auth_date = int(fields["auth_date"])
+        user_id = json.loads(fields["user"])["id"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not isinstance(user_id, int):
+        return None
+    return auth_date, str(user_id)
+
+def get_telegram_user_id(request: Request) -> Optional[str]:
+    """
+    Возвращает ID пользователя Telegram из подписанных данных WebApp
+    (Telegram.WebApp.initData в заголовке X-Telegram-Init-Data).
+    Без проверки подписи ID мог бы подставить любой клиент.
+    """
+    init_data = request.headers.get("x-telegram-init-data")
+    if not init_data or _init_data_secret is None:
+        return None
+    verified = _verify_init_data(init_data)
+    if verified is None:
+        return None
+    auth_date, user_id = verified
+    if time.time() - auth_date > TELEGRAM_INIT_DATA_MAX_AGE:
+        return None
+    return user_id
+
+def get_route_path(request: Request) -> str:
+    """
+    Возвращает шаблон пути обработавшего запрос маршрута (например, /api/user/{user_id}),
+    чтобы метки метрик не зависели от идентификаторов в URL
+    """
+    endpoint = request.scope.get("endpoint")
+    routes = request.app.router.routes
+    for route in routes:
+        if endpoint is not None and getattr(route, "endpoint", None) is endpoint:
+            return route.path
+    # Запрос не дошел до обработчика (например, отклонен ограничением скорости)
+    for route in routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
@@ -0,0 +1,28 @@
+"""
+Быстрая сериализация JSON на orjson для кэша, ответов API и событий Kafka.
+Даты и время кодируются в ISO 8601, как и в CustomJSONEncoder.
+"""
+from typing import Any
+import orjson
+
+# Ключи словарей не обязаны быть строками (например, id пользователя как int)
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+def _default(obj: Any) -> Any:
+    """Сериализует объекты, которые orjson не поддерживает напрямую"""
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(value: Any) -> bytes:
+    """
+    Сериализует значение в JSON
+    :return: JSON в кодировке UTF-8
+    """
+    return orjson.dumps(value, default=_default, option=_DUMPS_OPTIONS)
+
+def loads(data: Any) -> Any:
+    """
+    Десериализует JSON из bytes, bytearray, memoryview или str
+    """
+    return orjson.loads(data)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Dict, Optional
+from models.models import Share
+from utils.config import (
+    SHARE_EXPIRY_INTERVAL, SHARE_EXPIRY_BATCH_SIZE, SHARE_EXPIRY_MAX_BATCHES
+)
+from utils.redis_utils import delete_many, get_share_cache_key, get_user_stats_cache_key, redis_breaker
+from utils.redis_advanced import acquire_lock, release_lock
+
+logger = logging.getLogger(__name__)
+
+# Имя блокировки, чтобы очистку выполнял только один воркер за раз
+SWEEP_LOCK_NAME = "share_expiry_sweep"
+
+class ShareExpirySweeper:
+    """Фоновая очистка устаревших шар порциями по расписанию"""
+    def __init__(
+        self,
+        interval: int = SHARE_EXPIRY_INTERVAL,
+        batch_size: int = SHARE_EXPIRY_BATCH_SIZE,
+        max_batches: int = SHARE_EXPIRY_MAX_BATCHES
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.owner = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "total_removed": 0,
+            "last_run_removed": 0,
+            "last_run_duration": 0.0,
+            "last_run_at": None
+        }
+    
+    async def start(self):
+        """Запускает периодическую очистку"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_periodically())
+            logger.info("Share expiry sweeper started")
+    
+    async def stop(self):
+        """Останавливает периодическую очистку"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            logger.info("Share expiry sweeper stopped")
+    
+    async def _run_periodically(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.run_once()
+                except Exception as e:
+                    logger.error(f"Ошибка при очистке устаревших шар: {str(e)}")
+        except asyncio.CancelledError:
+            pass
+    
+    async def run_once(self) -> int:
+        """
+        Выполняет один проход очистки
+        :return: Количество удаленных записей
+        """
+        # Блокировка живет не дольше периода, чтобы упавший воркер не остановил очистку
+        locked = await acquire_lock(SWEEP_LOCK_NAME, self.owner, ttl=self.interval)
+        if not locked:
+            if not redis_breaker.is_open:
+                logger.debug("Очистка уже выполняется другим воркером")
+                return 0
+            # Без Redis чистим без блокировки: порции выбираются с SKIP LOCKED,
+            # поэтому параллельные проходы не удаляют одни и те же строки
+            logger.warning("Redis недоступен, очистка шар выполняется без блокировки")
+        
+        started = time.monotonic()
+        removed = 0
+        try:
+            for _ in range(self.max_batches):
+                deleted = await Share.delete_expired_batch(self.batch_size)
+                if deleted:
+                    removed += len(deleted)
+                    # Вместе с шарами сбрасываем статистику их владельцев
+                    await delete_many(
+                        [get_share_cache_key(share_id) for share_id, _ in deleted] +
+                        [get_user_stats_cache_key(user_id) for user_id in {user_id for _, user_id in deleted}]
+                    )
+                if len(deleted) < self.batch_size:
+                    break
+                # Отдаем управление циклу событий между порциями
+                await asyncio.sleep(0)
+        finally:
+            if locked:
+                await release_lock(SWEEP_LOCK_NAME, self.owner)
+        
+        duration = time.monotonic() - started
+        self.stats["runs"] += 1
+        self.stats["total_removed"] += removed
+        self.stats["last_run_removed"] = removed
+        self.stats["last_run_duration"] = round(duration, 4)
+        self.stats["last_run_at"] = time.time()
+        logger.info(f"Очистка шар: удалено {removed} записей за {duration:.3f} с")
+        return removed
+
+# Создаем глобальный экземпляр очистки
+share_expiry_sweeper = ShareExpirySweeper()
@@ -0,0 +1,145 @@
+"""
+Трассировка запросов: дерево участков (span) текущего запроса хранится в
+contextvar. Обращения к базе, Redis и Kafka добавляют в него листья сами,
+крупные шаги обработчиков размечаются через trace_span. Вне запроса
+(фоновые задачи) участки не записываются.
+"""
+import contextvars
+import time
+from typing import Dict, List, Optional, Tuple
+from utils.config import TRACE_MAX_SPANS
+
+
+class Span:
+    """Участок обработки запроса"""
+    __slots__ = ("name", "detail", "started", "duration", "children")
+
+    def __init__(self, name: str, detail: Optional[str] = None, started: Optional[float] = None):
+        self.name = name
+        self.detail = detail
+        self.started = time.perf_counter() if started is None else started
+        self.duration: Optional[float] = None
+        self.children: List["Span"] = []
+
+    @property
+    def label(self) -> str:
+        return f"{self.name} {self.detail}" if self.detail else self.name
+
+    def elapsed(self) -> float:
+        return self.duration if self.duration is not None else time.perf_counter() - self.started
+
+
+# Участок, в который добавляются вложенные участки
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class trace_span:
+    """
+    Контекстный менеджер для разметки шага обработки запроса:
+        with trace_span("user_upsert"):
+            await User.upsert_profile(...)
+    """
+    __slots__ = ("name", "detail", "span", "token")
+
+    def __init__(self, name: str, detail: Optional[str] = None):
+        self.name = name
+        self.detail = detail
+        self.span: Optional[Span] = None
+        self.token = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current_span.get()
+        if parent is None or len(parent.children) >= TRACE_MAX_SPANS:
+            return None
+        self.span = Span(self.name, self.detail)
+        parent.children.append(self.span)
+        self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc_info) -> bool:
+        if self.span is not None:
+            self.span.duration = time.perf_counter() - self.span.started
+            _current_span.reset(self.token)
+        return False
+
+
+def record_span(name: str, started: float, duration: float, detail: Optional[str] = None) -> None:
+    """
+    Добавляет завершенный участок (обращение к зависимости) в текущий запрос
+    :param started: Начало по time.perf_counter()
+    :param duration: Длительность в секундах
+    """
+    parent = _current_span.get()
+    if parent is None or len(parent.children) >= TRACE_MAX_SPANS:
+        return
+    span = Span(name, detail, started)
+    span.duration = duration
+    parent.children.append(span)
+
+
+def start_trace(name: str) -> Tuple[Span, contextvars.Token]:
+    """Начинает трассировку запроса; участки, созданные дальше в этом контексте, попадут в нее"""
+    root = Span(name)
+    return root, _current_span.set(root)
+
+
+def finish_trace(root: Span, token: contextvars.Token) -> None:
+    root.duration = time.perf_counter() - root.started
+    _current_span.reset(token)
+
+
+def _walk(span: Span):
+    for child in span.children:
+        yield child
+        yield from _walk(child)
+
+
+def server_timing(root: Span) -> str:
+    """
+    Значение заголовка Server-Timing: время шагов верхнего уровня,
+    суммарное время обращений к каждой зависимости и общее время
+    """
+    entries: Dict[str, List[float]] = {}
+    for child in root.children:
+        if child.children:
+            entries.setdefault(child.name, [0.0, 0])
+            entries[child.name][0] += child.elapsed()
+            entries[child.name][1] += 1
+    for span in _walk(root):
+        if not span.children:
+            entries.setdefault(span.name, [0.0, 0])
+            entries[span.name][0] += span.elapsed()
+            entries[span.name][1] += 1
+    parts = [f'{name};dur={seconds * 1000:.2f};desc="{count}"' for name, (seconds, count) in entries.items()]
+    parts.append(f"total;dur={root.elapsed() * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def format_span_tree(root: Span) -> str:
+    """Дерево участков для лога; одинаковые обращения к зависимостям на одном уровне схлопываются"""
+    lines = [f"{root.label} {root.elapsed() * 1000:.1f} ms"]
+
+    def render(span: Span, depth: int):
+        # Листья с одинаковой меткой объединяются: "redis GET x3 1.2 ms"
+        grouped: Dict[str, List[float]] = {}
+        order: List[object] = []
+        for child in span.children:
+            if child.children:
+                order.append(child)
+                continue
+            if child.label not in grouped:
+                grouped[child.label] = [0.0, 0]
+                order.append(child.label)
+            grouped[child.label][0] += child.elapsed()
+            grouped[child.label][1] += 1
+        for item in order:
+            if isinstance(item, Span):
+                lines.append(f"{'  ' * depth}{item.label} {item.elapsed() * 1000:.1f} ms")
+                render(item, depth + 1)
+            else:
+                seconds, count = grouped[item]
+                repeat = f" x{count}" if count > 1 else ""
+                lines.append(f"{'  ' * depth}{item}{repeat} {seconds * 1000:.1f} ms")
+
+    render(root, 1)
+    return "\n".join(lines)
@@ -0,0 +1,100 @@
+"""
+Микробенчмарк обработки попадания в кэш для GET /api/share/{id}.
+
+Сравнивает прежний путь (json.loads строки из Redis -> валидация
+SharedDataResponse -> jsonable_encoder -> json.dumps в JSONResponse)
+с текущими:
+    l1_raw        — попадание в локальный кэш: готовое тело ответа отдается как есть;
+    redis_json    — попадание в Redis при CACHE_CODEC=json: запись уже является телом;
+    redis_msgpack — попадание в Redis при CACHE_CODEC=msgpack (по умолчанию):
+                    msgpack -> JSON, после чего тело попадает в локальный кэш.
+
+Запуск из services/backend:
+    python benchmarks/bench_cache_hit.py [--number 100000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from schemas.share import SharedDataResponse
+from utils.cache_codec import CacheCodec
+from utils.redis_utils import CustomJSONEncoder
+from utils.serialization import dumps, loads
+
+SAMPLE = {
+    "share": {
+        "id": "b3f1c2d4-5e6f-4a7b-8c9d-0e1f2a3b4c5d",
+        "birthday": date(1995, 7, 14),
+        "created_at": datetime(2024, 5, 1, 12, 30, 15, 123456)
+    },
+    "user": {
+        "first_name": "Иван",
+        "last_name": "Петров",
+        "username": "ivan_petrov"
+    }
+}
+
+# Так значение лежало в Redis раньше (decode_responses=True возвращал str)
+LEGACY_ENTRY = json.dumps(SAMPLE, cls=CustomJSONEncoder)
+# Так тело ответа лежит в локальном кэше
+RAW_ENTRY = dumps(SAMPLE)
+# Так значение лежит в Redis в каждом из форматов кодека
+JSON_CODEC = CacheCodec("json")
+MSGPACK_CODEC = CacheCodec("msgpack")
+JSON_ENTRY = JSON_CODEC.encode(SAMPLE)
+MSGPACK_ENTRY = MSGPACK_CODEC.encode(SAMPLE)
+
+def legacy_hit() -> bytes:
+    """Прежний путь: десериализация, валидация Pydantic и повторная сериализация"""
+    data = json.loads(LEGACY_ENTRY)
+    model = SharedDataResponse(**data)
+    return JSONResponse(content=jsonable_encoder(model)).body
+
+def raw_hit() -> bytes:
+    """Попадание в локальный кэш: готовое тело ответа"""
+    return Response(content=RAW_ENTRY, media_type="application/json").body
+
+def redis_json_hit() -> bytes:
+    """Попадание в Redis, запись в формате json"""
+    return Response(content=JSON_CODEC.to_json(JSON_ENTRY), media_type="application/json").body
+
+def redis_msgpack_hit() -> bytes:
+    """Попадание в Redis, запись в формате msgpack: распаковка и сериализация в JSON"""
+    return Response(content=MSGPACK_CODEC.to_json(MSGPACK_ENTRY), media_type="application/json").body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100000, help="Количество итераций")
+    args = parser.parse_args()
+    
+    # Все варианты должны отдавать эквивалентный JSON
+    paths = (
+        ("legacy", legacy_hit),
+        ("redis_msgpack", redis_msgpack_hit),
+        ("redis_json", redis_json_hit),
+        ("l1_raw", raw_hit),
+    )
+    assert all(loads(func()) == loads(legacy_hit()) for _, func in paths)
+    
+    results = {}
+    for name, func in paths:
+        seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+        results[name] = seconds / args.number * 1e6
+    
+    print(f"{'path':<20}{'us/hit':>10}")
+    for name, per_hit in results.items():
+        print(f"{name:<20}{per_hit:>10.2f}")
+    print()
+    for name in ("redis_msgpack", "redis_json", "l1_raw"):
+        saved = results["legacy"] - results[name]
+        print(f"CPU saved per {name} hit: {saved:.2f} us ({results['legacy'] / results[name]:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
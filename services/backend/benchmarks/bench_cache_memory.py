@@ -0,0 +1,95 @@
+"""
+Бенчмарк объема кэша шар в разных форматах значений.
+
+Считает суммарный размер значений для N шар (по умолчанию 100 000) в прежнем
+формате JSON и в бинарном формате кодека (с сжатием и без). Если указан
+--redis-url, дополнительно записывает значения в отдельную базу Redis и
+измеряет прирост used_memory — с учетом накладных расходов на ключи.
+
+Запуск из services/backend:
+    python benchmarks/bench_cache_memory.py [--count 100000] [--redis-url redis://localhost:6379/15]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from utils.cache_codec import CacheCodec
+from utils.redis_utils import CustomJSONEncoder, get_share_cache_key
+
+def make_share(rng: random.Random) -> dict:
+    """Запись кэша шары в том виде, в котором ее формирует share_data"""
+    name = lambda: "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(4, 10)))
+    created_at = datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 86400 * 365))
+    return {
+        "share": {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "birthday": date(1970, 1, 1) + timedelta(days=rng.randint(0, 365 * 40)),
+            "created_at": created_at
+        },
+        "user": {
+            "first_name": name(),
+            "last_name": name() if rng.random() < 0.7 else None,
+            "username": name().lower() if rng.random() < 0.8 else None
+        }
+    }
+
+FORMATS = {
+    "json (legacy)": lambda v: json.dumps(v, cls=CustomJSONEncoder).encode(),
+    "msgpack": CacheCodec("msgpack", compression="none").encode,
+    "msgpack+lz4 (>0 B)": CacheCodec("msgpack", compression="lz4", compression_threshold=0).encode,
+    "msgpack+zlib (>0 B)": CacheCodec("msgpack", compression="zlib", compression_threshold=0).encode,
+}
+
+async def measure_redis(redis_url: str, entries: list, encode) -> int:
+    """Прирост used_memory после записи всех значений в чистую базу"""
+    from redis.asyncio import Redis
+    r = Redis.from_url(redis_url)
+    try:
+        await r.flushdb()
+        before = (await r.info("memory"))["used_memory"]
+        for i in range(0, len(entries), 1000):
+            pipe = r.pipeline(transaction=False)
+            for value in entries[i:i + 1000]:
+                pipe.set(get_share_cache_key(value["share"]["id"]), encode(value), ex=3600)
+            await pipe.execute()
+        after = (await r.info("memory"))["used_memory"]
+        await r.flushdb()
+        return after - before
+    finally:
+        await r.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000, help="Количество шар")
+    parser.add_argument("--redis-url", help="Отдельная база Redis для замера used_memory (будет очищена)")
+    args = parser.parse_args()
+    
+    rng = random.Random(42)
+    entries = [make_share(rng) for _ in range(args.count)]
+    default_codec = CacheCodec()
+    
+    print(f"{'format':<22}{'total MB':>10}{'avg B':>8}{'vs json':>9}" + (f"{'redis MB':>10}" if args.redis_url else ""))
+    baseline = None
+    for name, encode in FORMATS.items():
+        encoded = [encode(value) for value in entries]
+        # Каждая запись должна читаться обратно в тот же JSON
+        sample = encoded[0]
+        assert json.loads(default_codec.to_json(sample)) == json.loads(FORMATS["json (legacy)"](entries[0]))
+        total = sum(len(data) for data in encoded)
+        baseline = baseline or total
+        line = f"{name:<22}{total / 2 ** 20:>10.2f}{total / len(encoded):>8.1f}{total / baseline:>9.2f}"
+        if args.redis_url:
+            used = asyncio.run(measure_redis(args.redis_url, entries, encode))
+            line += f"{used / 2 ** 20:>10.2f}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Бенчмарк кодирования событий Kafka.
+
+Сравнивает прежний формат (json.dumps в backend, json.loads(value.decode())
+в боте), orjson и бинарный конверт common.events: средний размер сообщения,
+время кодирования и декодирования одного события и пропускную способность
+декодирования (событий в секунду) для смеси всех типов событий.
+
+Запуск из services/backend:
+    python benchmarks/bench_event_codec.py [--count 20000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+import uuid
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+import orjson
+from common.events import (
+    ShareCreated, UserUpdated, SendMessage, TEMPLATE_SHARE_SAVED, EventDecodeError, decode_event, encode_event
+)
+
+def make_event(rng: random.Random):
+    """Событие в том виде, в котором его отправляет backend"""
+    name = lambda: "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(4, 10)))
+    user_id = str(rng.randint(10 ** 8, 10 ** 10))
+    kind = rng.random()
+    if kind < 0.4:
+        created_at = datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 86400 * 365))
+        return ShareCreated(
+            share_id=str(uuid.UUID(int=rng.getrandbits(128))),
+            user_id=user_id,
+            birthday=(date(1970, 1, 1) + timedelta(days=rng.randint(0, 365 * 40))).isoformat(),
+            created_at=created_at.isoformat()
+        )
+    if kind < 0.7:
+        return UserUpdated(
+            user_id=user_id,
+            action=rng.choice(("created", "updated")),
+            first_name=name(),
+            last_name=name() if rng.random() < 0.7 else None,
+            username=name().lower() if rng.random() < 0.8 else None
+        )
+    return SendMessage(
+        chat_id=int(user_id),
+        template_id=TEMPLATE_SHARE_SAVED,
+        params={"share_link": f"https://t.me/app_bot/app?startapp={uuid.UUID(int=rng.getrandbits(128))}"},
+        priority="reply"
+    )
+
+def to_legacy(event) -> dict:
+    """Словарь события в прежнем формате JSON"""
+    data = asdict(event)
+    if isinstance(event, SendMessage):
+        return {"event_type": event.TOPIC, **data}
+    event_id = data.pop("event_id")
+    if isinstance(event, ShareCreated):
+        return {"event_type": event.TOPIC, "share_id": data.pop("share_id"), "user_id": data.pop("user_id"),
+                "data": data, "event_id": event_id}
+    return {"event_type": event.TOPIC, "user_id": data.pop("user_id"), "data": data, "event_id": event_id}
+
+# Сообщения, на которых бот должен получать EventDecodeError, а не падать: (значение, топик)
+MALFORMED = [
+    (b"", None),
+    (b"{bad", "send_message"),
+    (b"[1, 2]", "send_message"),
+    (b'{"event_type": [1]}', None),
+    (b'{"event_type": "unknown"}', None),
+    (b'{"event_type": "share_created", "data": "x"}', None),
+    (b'{"event_type": "user_updated", "data": [1]}', None),
+    (b'{"chat_id": 1, "message_data": "x"}', "send_message"),
+    (b'{"chat_id": 1, "params": [1]}', "send_message"),
+    (bytes((0xE1, 1, 1, 0)) + b"\x01", None),
+    (bytes((0xE1, 1, 9, 0)), None),
+    (bytes((0xE1, 1, 1, 0)) + b"\xc1", None),
+]
+
+def check_malformed():
+    """Проверяет, что некорректные сообщения дают только EventDecodeError"""
+    for value, topic in MALFORMED:
+        try:
+            decode_event(value, topic)
+        except EventDecodeError:
+            continue
+        raise AssertionError(f"decode_event accepted malformed message {value!r}")
+
+# Формат: (как backend готовит событие, кодирование, декодирование в боте)
+FORMATS = {
+    "json (legacy)": (to_legacy, lambda data: json.dumps(data).encode(), lambda value: json.loads(value.decode())),
+    "orjson": (to_legacy, orjson.dumps, orjson.loads),
+    "envelope": (lambda event: event, encode_event, decode_event),
+}
+
+def best_of(repeat: int, func, items) -> float:
+    """Лучшее время одного прохода по всем элементам"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000, help="Количество событий")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов замера, берется лучший")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    events = [make_event(rng) for _ in range(args.count)]
+
+    # Бот читает и прежний JSON, и конверт: оба должны давать одно и то же событие
+    for event in events[:100]:
+        assert decode_event(encode_event(event)) == event
+        assert decode_event(json.dumps(to_legacy(event)).encode(), event.TOPIC) == event
+    check_malformed()
+
+    print(f"{'format':<16}{'avg B':>8}{'vs json':>9}{'enc µs':>9}{'dec µs':>9}{'dec ev/s':>11}")
+    baseline = None
+    for name, (prepare, encode, decode) in FORMATS.items():
+        prepared = [prepare(event) for event in events]
+        encoded = [encode(item) for item in prepared]
+        size = sum(len(value) for value in encoded) / len(encoded)
+        baseline = baseline or size
+        encode_time = best_of(args.repeat, encode, prepared) / len(prepared)
+        decode_time = best_of(args.repeat, decode, encoded) / len(encoded)
+        print(
+            f"{name:<16}{size:>8.1f}{size / baseline:>9.2f}"
+            f"{encode_time * 1e6:>9.2f}{decode_time * 1e6:>9.2f}{1 / decode_time:>11.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
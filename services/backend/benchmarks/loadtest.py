@@ -0,0 +1,300 @@
+"""
+Нагрузочный тест backend без внешних зависимостей.
+
+Запускает настоящее FastAPI-приложение из app/main.py в процессе и подает
+запросы через httpx.ASGITransport. Зависимости заменены локальными:
+Redis — RespServer в памяти (см. standins.py), Kafka — KafkaSink,
+база — SQLite в памяти или база из --db-url (например, локальный Postgres).
+
+Сценарий задает смесь запросов POST /api/share, GET /api/share/{id} и
+GET /api/user/{id} и число одновременных клиентов. Перед замером через API
+создаются --seed шар, чтобы GET-запросы попадали в существующие данные.
+Отчет: пропускная способность, p50/p95/p99 по каждому типу запроса и
+количество обращений к Redis, базе и Kafka в расчете на запрос.
+
+С --check результаты сравниваются с сохраненными в baselines.json, и при
+регрессии больше допустимой процесс завершается с кодом 1. Время зависит от
+машины: базовые значения для CI сохраняются на той же машине через
+--save-baseline. Количество обращений к зависимостям от машины не зависит.
+
+Нужен httpx (в зависимости сервиса не входит): pip install httpx
+
+Запуск из services/backend:
+    python benchmarks/loadtest.py [--scenario mixed] [--requests 5000] [--concurrency 32]
+    python benchmarks/loadtest.py --scenario read --check
+    python benchmarks/loadtest.py --scenario write --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", ".."))
+
+from standins import RespServer, KafkaSink, DbCallCounter, register_app_scripts
+
+BASELINES_PATH = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+# Смесь запросов (веса) и число одновременных клиентов
+SCENARIOS = {
+    "mixed": {"mix": {"post_share": 1, "get_share": 6, "get_user": 3}, "concurrency": 32},
+    "read": {"mix": {"get_share": 7, "get_user": 3}, "concurrency": 64},
+    "write": {"mix": {"post_share": 1}, "concurrency": 16},
+}
+
+# Правила ограничения скорости как по умолчанию, но с недостижимыми лимитами:
+# проверка выполняется на каждом запросе, но не отклоняет нагрузку
+LOADTEST_RATE_LIMIT_POLICIES = [
+    {"name": "ip", "limit": 10 ** 9, "period": 60},
+    {"name": "share_create", "limit": 10 ** 9, "period": 60, "algorithm": "token_bucket",
+     "route": "/api/share", "methods": ["POST"]},
+    {"name": "user", "limit": 10 ** 9, "period": 60, "scope": "user"},
+    {"name": "global", "limit": 10 ** 9, "period": 1, "algorithm": "token_bucket", "scope": "global"},
+]
+
+# Метрики, которые сравниваются с базовыми: чем больше, тем лучше
+HIGHER_IS_BETTER = {"throughput"}
+
+
+def parse_mix(raw: str) -> Dict[str, float]:
+    """Разбирает смесь вида post_share=1,get_share=6"""
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("post_share", "get_share", "get_user"):
+            raise argparse.ArgumentTypeError(f"Unknown request type: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Генерирует запросы сценария и запоминает созданные шары и пользователей"""
+    def __init__(self, mix: Dict[str, float], users: int, rng: random.Random):
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.users = users
+        self.rng = rng
+        self.share_ids: List[str] = []
+        self.user_ids: List[int] = []
+        self._next_share = 0
+
+    def share_body(self) -> dict:
+        self._next_share += 1
+        chat_id = self.rng.randint(1, self.users)
+        return {
+            "shareId": f"lt-{self._next_share}-{self.rng.getrandbits(32):08x}",
+            "chatId": chat_id,
+            "data": {"birthday": (date(1970, 1, 1) + timedelta(days=self.rng.randint(0, 365 * 40))).isoformat()},
+            "userInfo": {"first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+        }
+
+    def next_request(self):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        if kind == "post_share" or not self.share_ids:
+            return "post_share", "POST", "/api/share", self.share_body()
+        if kind == "get_share":
+            return kind, "GET", f"/api/share/{self.rng.choice(self.share_ids)}", None
+        return kind, "GET", f"/api/user/{self.rng.choice(self.user_ids)}", None
+
+    def created(self, body: dict):
+        self.share_ids.append(body["shareId"])
+        self.user_ids.append(body["chatId"])
+
+
+async def send(client, workload: Workload, request, latencies, statuses):
+    kind, method, path, body = request
+    started = time.perf_counter()
+    response = await client.request(method, path, json=body)
+    latencies[kind].append(time.perf_counter() - started)
+    statuses[kind][response.status_code] += 1
+    if kind == "post_share" and response.status_code == 200:
+        workload.created(body)
+
+
+async def run(args) -> dict:
+    redis_server = await RespServer().start()
+    # Настройки читаются при импорте приложения
+    os.environ["REDIS_URL"] = redis_server.url
+    os.environ["RATE_LIMIT_POLICIES"] = json.dumps(LOADTEST_RATE_LIMIT_POLICIES)
+    import utils.config as config
+    config.DATABASE_URL = args.db_url
+    register_app_scripts(redis_server)
+
+    from utils.kafka_utils import kafka_client, serialize_value
+    kafka = KafkaSink(serialize_value)
+    kafka_client.producer = kafka
+
+    import httpx
+    from main import app
+    await app.router.startup()
+    db = DbCallCounter()
+    db.install()
+
+    rng = random.Random(args.seed_value)
+    workload = Workload(args.mix, args.users, rng)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest") as client:
+            for _ in range(args.seed):
+                await send(client, workload, ("post_share", "POST", "/api/share", workload.share_body()),
+                           defaultdict(list), defaultdict(Counter))
+            await asyncio.sleep(0.1)
+            redis_server.reset_counters()
+            kafka.reset_counters()
+            db.reset_counters()
+
+            remaining = args.requests
+
+            async def worker():
+                nonlocal remaining
+                while remaining > 0:
+                    remaining -= 1
+                    await send(client, workload, workload.next_request(), latencies, statuses)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            # Фоновая отправка в Kafka успевает дойти до заменителя
+            await asyncio.sleep(0.1)
+    finally:
+        db.uninstall()
+        await app.router.shutdown()
+        await redis_server.stop()
+
+    total = sum(len(values) for values in latencies.values())
+    everything = sorted(value for values in latencies.values() for value in values)
+    result = {
+        "requests": total,
+        "seconds": round(elapsed, 3),
+        "throughput": round(total / elapsed, 1),
+        "p50_ms": round(percentile(everything, 50) * 1000, 3),
+        "p95_ms": round(percentile(everything, 95) * 1000, 3),
+        "p99_ms": round(percentile(everything, 99) * 1000, 3),
+        "redis_commands_per_request": round(sum(redis_server.commands.values()) / total, 3),
+        "db_queries_per_request": round(sum(db.calls.values()) / total, 3),
+        "kafka_messages_per_request": round(sum(kafka.messages.values()) / total, 3),
+        "errors": sum(count for codes in statuses.values() for code, count in codes.items() if code >= 400),
+    }
+    details = {
+        "routes": {
+            kind: {
+                "count": len(values),
+                "p50_ms": percentile(sorted(values), 50) * 1000,
+                "p95_ms": percentile(sorted(values), 95) * 1000,
+                "p99_ms": percentile(sorted(values), 99) * 1000,
+                "max_ms": max(values) * 1000,
+                "statuses": dict(statuses[kind]),
+            }
+            for kind, values in sorted(latencies.items())
+        },
+        "redis_commands": dict(redis_server.commands.most_common()),
+        "db_queries": dict(db.calls),
+        "db_seconds": {name: round(value, 4) for name, value in db.seconds.items()},
+        "kafka_messages": dict(kafka.messages),
+        "kafka_bytes": dict(kafka.bytes),
+    }
+    return {"summary": result, "details": details}
+
+
+def report(name: str, args, outcome: dict):
+    summary, details = outcome["summary"], outcome["details"]
+    print(f"scenario {name}: {summary['requests']} requests, concurrency {args.concurrency}, "
+          f"{summary['seconds']}s, {summary['throughput']} req/s, errors {summary['errors']}")
+    print(f"{'route':<12}{'count':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}  statuses")
+    for kind, route in details["routes"].items():
+        print(f"{kind:<12}{route['count']:>8}{route['p50_ms']:>9.2f}{route['p95_ms']:>9.2f}"
+              f"{route['p99_ms']:>9.2f}{route['max_ms']:>9.2f}  {route['statuses']}")
+    print(f"{'all':<12}{summary['requests']:>8}{summary['p50_ms']:>9.2f}{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}")
+    print(f"redis: {summary['redis_commands_per_request']} commands/request {details['redis_commands']}")
+    print(f"db:    {summary['db_queries_per_request']} queries/request {details['db_queries']} "
+          f"time {details['db_seconds']}")
+    print(f"kafka: {summary['kafka_messages_per_request']} messages/request {details['kafka_messages']} "
+          f"bytes {details['kafka_bytes']}")
+
+
+def check(name: str, summary: dict, baselines: dict, tolerance: float, count_tolerance: float) -> List[str]:
+    """Возвращает список регрессий относительно базовых значений сценария"""
+    baseline = baselines.get(name)
+    if baseline is None:
+        return [f"no baseline for scenario {name}, run with --save-baseline"]
+    regressions = []
+    for metric, expected in baseline.items():
+        if metric in ("requests", "seconds") or metric not in summary:
+            continue
+        actual = summary[metric]
+        allowed = count_tolerance if metric.endswith("_per_request") or metric == "errors" else tolerance
+        if metric in HIGHER_IS_BETTER:
+            failed = actual < expected * (1 - allowed)
+        else:
+            failed = actual > expected * (1 + allowed) + (0 if expected else allowed)
+        if failed:
+            regressions.append(f"{metric}: {actual} vs baseline {expected} (tolerance {allowed:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--mix", type=parse_mix, help="Смесь запросов, например post_share=1,get_share=6,get_user=3")
+    parser.add_argument("--concurrency", type=int, help="Одновременных клиентов (по умолчанию из сценария)")
+    parser.add_argument("--requests", type=int, default=5000, help="Запросов в замере")
+    parser.add_argument("--seed", type=int, default=500, help="Шар, создаваемых до замера")
+    parser.add_argument("--users", type=int, default=1000, help="Количество разных пользователей")
+    parser.add_argument("--db-url", default="sqlite://:memory:", help="База данных (Tortoise URL)")
+    parser.add_argument("--random-seed", dest="seed_value", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    parser.add_argument("--check", action="store_true", help="Сравнить с baselines.json, код 1 при регрессии")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результат как базовый")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Допустимое ухудшение времени и пропускной способности")
+    parser.add_argument("--count-tolerance", type=float, default=0.1, help="Допустимый рост обращений к зависимостям")
+    args = parser.parse_args()
+
+    scenario = SCENARIOS[args.scenario]
+    args.mix = args.mix or scenario["mix"]
+    args.concurrency = args.concurrency or scenario["concurrency"]
+    # Базовые значения относятся к сценарию в его стандартной конфигурации
+    name = args.scenario if args.mix == scenario["mix"] and args.concurrency == scenario["concurrency"] else "custom"
+
+    outcome = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(outcome, indent=2))
+    else:
+        report(name, args, outcome)
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    if args.save_baseline:
+        baselines[name] = outcome["summary"]
+        with open(BASELINES_PATH, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline for {name} saved to {BASELINES_PATH}", file=sys.stderr)
+    if args.check:
+        regressions = check(name, outcome["summary"], baselines, args.tolerance, args.count_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against baseline {name}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
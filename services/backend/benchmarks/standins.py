@@ -0,0 +1,595 @@
+"""
+Локальные заменители зависимостей backend для бенчмарков.
+
+RespServer — Redis в памяти процесса, говорящий по протоколу RESP2: приложение
+подключается к нему обычным клиентом redis-py, через пул соединений,
+конвейеры и pub/sub, как к настоящему серверу. Lua не исполняется: для
+EVAL/EVALSHA регистрируются Python-реализации известных скриптов
+(см. register_app_scripts).
+
+KafkaSink — продюсер, который сериализует сообщения как AIOKafkaProducer
+и только считает их.
+
+DbCallCounter — счетчик запросов Tortoise ORM с учетом вложенных вызовов.
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+# Скрипт: (хранилище, ключи, аргументы) -> ответ
+ScriptFunc = Callable[['RespServer', List[bytes], List[bytes]], Any]
+
+
+class RespError(Exception):
+    """Ошибка, отдаваемая клиенту как ответ -ERR"""
+
+
+class _Simple(str):
+    """Простая строка RESP (+OK)"""
+
+
+OK = _Simple("OK")
+QUEUED = _Simple("QUEUED")
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, _Simple):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, RespError):
+        return b"-" + str(value).encode() + b"\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, (bytes, bytearray)):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    raise TypeError(f"Cannot encode {type(value).__name__} as RESP")
+
+
+def _int(value: bytes) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise RespError("ERR value is not an integer or out of range")
+
+
+class _Client:
+    """Состояние одного соединения"""
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.channels: Set[bytes] = set()
+        self.multi: Optional[List[List[bytes]]] = None
+
+
+class RespServer:
+    """Redis в памяти с подмножеством команд, которые использует backend"""
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.data: Dict[bytes, Any] = {}
+        # Ключ -> время истечения (мс, time.time)
+        self.expires: Dict[bytes, int] = {}
+        self.channels: Dict[bytes, Set[_Client]] = defaultdict(set)
+        self.scripts: Dict[str, bytes] = {}
+        self.script_funcs: Dict[str, ScriptFunc] = {}
+        self.commands: Counter = Counter()
+        self.stats = {"connections": 0, "keyspace_hits": 0, "keyspace_misses": 0}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers = {
+            name[4:].upper().encode(): getattr(self, name) for name in dir(self) if name.startswith("cmd_")
+        }
+
+    @property
+    def url(self) -> str:
+        # Сервер говорит только на RESP2
+        return f"redis://{self.host}:{self.port}/0?protocol=2"
+
+    async def start(self) -> 'RespServer':
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for clients in self.channels.values():
+                for client in clients:
+                    client.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def register_script(self, source: str, func: ScriptFunc):
+        """Регистрирует Python-реализацию Lua-скрипта"""
+        sha = hashlib.sha1(source.encode()).hexdigest()
+        self.scripts[sha] = source.encode()
+        self.script_funcs[sha] = func
+
+    def reset_counters(self):
+        self.commands.clear()
+        self.stats.update(keyspace_hits=0, keyspace_misses=0)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Client(writer)
+        self.stats["connections"] += 1
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                writer.write(_encode(self._execute(client, args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in client.channels:
+                self.channels[channel].discard(client)
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    def _execute(self, client: _Client, args: List[bytes]) -> Any:
+        name = args[0].upper()
+        if client.multi is not None and name not in (b"EXEC", b"DISCARD", b"MULTI"):
+            client.multi.append(args)
+            return QUEUED
+        self.commands[name.decode()] += 1
+        handler = self._handlers.get(name)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name.decode()}'")
+        try:
+            if name in (b"PING", b"SUBSCRIBE", b"UNSUBSCRIBE", b"MULTI", b"EXEC", b"DISCARD"):
+                return handler(client, *args[1:])
+            return handler(*args[1:])
+        except RespError as e:
+            return e
+        except TypeError:
+            return RespError(f"ERR wrong number of arguments for '{name.decode().lower()}' command")
+
+    # Хранилище
+
+    def _now_ms(self) -> int:
+        return int(time.time() * 1000)
+
+    def _alive(self, key: bytes) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= self._now_ms():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return key in self.data
+
+    def _get(self, key: bytes, kind: type) -> Any:
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if not isinstance(value, kind):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _hash(self, key: bytes) -> Dict[bytes, bytes]:
+        value = self._get(key, dict)
+        if value is None:
+            value = self.data[key] = {}
+        return value
+
+    def _set(self, key: bytes, value: Any, ttl_ms: Optional[int] = None, keep_ttl: bool = False):
+        self.data[key] = value
+        if ttl_ms is not None:
+            self.expires[key] = self._now_ms() + ttl_ms
+        elif not keep_ttl:
+            self.expires.pop(key, None)
+
+    def _delete(self, key: bytes) -> bool:
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    # Служебные команды
+
+    def cmd_ping(self, client: _Client, message: bytes = None):
+        if client.channels:
+            # В режиме подписки ответ приходит в формате сообщения pub/sub
+            return [b"pong", message or b""]
+        return message if message is not None else _Simple("PONG")
+
+    def cmd_echo(self, message: bytes):
+        return message
+
+    def cmd_hello(self, protover: bytes = b"2", *options: bytes):
+        if protover != b"2":
+            raise RespError("NOPROTO this protocol version is not supported")
+        return [b"server", b"redis", b"version", b"7.0.0", b"proto", 2, b"mode", b"standalone", b"role", b"master"]
+
+    def cmd_select(self, db: bytes):
+        return OK
+
+    def cmd_client(self, *args):
+        return OK
+
+    def cmd_time(self):
+        now = time.time()
+        return [str(int(now)), str(int(now % 1 * 1_000_000))]
+
+    def cmd_info(self, *sections):
+        used = sum(len(key) + (len(value) if isinstance(value, bytes) else 64) for key, value in self.data.items())
+        lines = [
+            "# Server", "redis_version:7.0.0-standin",
+            "# Clients", f"connected_clients:{self.stats['connections']}",
+            "# Memory", f"used_memory:{used}", f"used_memory_human:{used / 1024:.2f}K",
+            f"used_memory_peak:{used}", f"used_memory_peak_human:{used / 1024:.2f}K",
+            "# Stats", f"total_connections_received:{self.stats['connections']}",
+            f"total_commands_processed:{sum(self.commands.values())}", "instantaneous_ops_per_sec:0",
+            f"keyspace_hits:{self.stats['keyspace_hits']}", f"keyspace_misses:{self.stats['keyspace_misses']}",
+            "# Keyspace", f"db0:keys={len(self.data)},expires={len(self.expires)},avg_ttl=0",
+        ]
+        return "\r\n".join(lines).encode()
+
+    def cmd_dbsize(self):
+        return len(self.data)
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return OK
+
+    cmd_flushall = cmd_flushdb
+
+    # Строки и ключи
+
+    def cmd_get(self, key: bytes):
+        value = self._get(key, bytes)
+        self.stats["keyspace_hits" if value is not None else "keyspace_misses"] += 1
+        return value
+
+    def cmd_mget(self, *keys: bytes):
+        return [self.cmd_get(key) for key in keys]
+
+    def cmd_set(self, key: bytes, value: bytes, *options: bytes):
+        ttl_ms, keep_ttl, nx, xx = None, False, False, False
+        options = [option.upper() for option in options]
+        i = 0
+        while i < len(options):
+            option = options[i]
+            if option in (b"EX", b"PX"):
+                i += 1
+                ttl_ms = _int(options[i]) * (1000 if option == b"EX" else 1)
+            elif option == b"NX":
+                nx = True
+            elif option == b"XX":
+                xx = True
+            elif option == b"KEEPTTL":
+                keep_ttl = True
+            else:
+                raise RespError("ERR syntax error")
+            i += 1
+        exists = self._alive(key)
+        if (nx and exists) or (xx and not exists):
+            return None
+        self._set(key, value, ttl_ms, keep_ttl)
+        return OK
+
+    def cmd_mset(self, *pairs: bytes):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self._set(key, value)
+        return OK
+
+    def cmd_del(self, *keys: bytes):
+        return sum(self._alive(key) and self._delete(key) for key in keys)
+
+    cmd_unlink = cmd_del
+
+    def cmd_exists(self, *keys: bytes):
+        return sum(self._alive(key) for key in keys)
+
+    def cmd_expire(self, key: bytes, seconds: bytes):
+        return self.cmd_pexpire(key, str(_int(seconds) * 1000).encode())
+
+    def cmd_pexpire(self, key: bytes, ms: bytes):
+        if not self._alive(key):
+            return 0
+        self.expires[key] = self._now_ms() + _int(ms)
+        return 1
+
+    def cmd_pttl(self, key: bytes):
+        if not self._alive(key):
+            return -2
+        deadline = self.expires.get(key)
+        return -1 if deadline is None else max(0, deadline - self._now_ms())
+
+    def cmd_ttl(self, key: bytes):
+        ttl = self.cmd_pttl(key)
+        return ttl if ttl < 0 else math.ceil(ttl / 1000)
+
+    def cmd_incrby(self, key: bytes, amount: bytes):
+        value = _int(self._get(key, bytes) or b"0") + _int(amount)
+        self._set(key, str(value).encode(), keep_ttl=True)
+        return value
+
+    def cmd_incr(self, key: bytes):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_decrby(self, key: bytes, amount: bytes):
+        return self.cmd_incrby(key, str(-_int(amount)).encode())
+
+    # Хеши
+
+    def cmd_hset(self, key: bytes, *pairs: bytes):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        value = self._hash(key)
+        added = 0
+        for field, item in zip(pairs[::2], pairs[1::2]):
+            added += field not in value
+            value[field] = item
+        return added
+
+    def cmd_hget(self, key: bytes, field: bytes):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, key: bytes, *fields: bytes):
+        value = self._get(key, dict) or {}
+        return [value.get(field) for field in fields]
+
+    def cmd_hgetall(self, key: bytes):
+        value = self._get(key, dict) or {}
+        return [item for pair in value.items() for item in pair]
+
+    def cmd_hdel(self, key: bytes, *fields: bytes):
+        value = self._get(key, dict) or {}
+        return sum(value.pop(field, None) is not None for field in fields)
+
+    # Pub/Sub
+
+    def cmd_publish(self, channel: bytes, message: bytes):
+        subscribers = list(self.channels.get(channel, ()))
+        payload = _encode([b"message", channel, message])
+        for client in subscribers:
+            client.writer.write(payload)
+        return len(subscribers)
+
+    def cmd_subscribe(self, client: _Client, *channels: bytes):
+        replies = []
+        for channel in channels:
+            client.channels.add(channel)
+            self.channels[channel].add(client)
+            replies.append(_encode([b"subscribe", channel, len(client.channels)]))
+        # Каждый канал подтверждается отдельным ответом
+        client.writer.write(b"".join(replies[:-1]))
+        return [b"subscribe", channels[-1], len(client.channels)]
+
+    def cmd_unsubscribe(self, client: _Client, *channels: bytes):
+        channels = channels or tuple(client.channels) or (None,)
+        replies = []
+        for channel in channels:
+            client.channels.discard(channel)
+            self.channels.get(channel, set()).discard(client)
+            replies.append([b"unsubscribe", channel, len(client.channels)])
+        client.writer.write(b"".join(_encode(reply) for reply in replies[:-1]))
+        return replies[-1]
+
+    # Транзакции
+
+    def cmd_multi(self, client: _Client):
+        client.multi = []
+        return OK
+
+    def cmd_exec(self, client: _Client):
+        if client.multi is None:
+            raise RespError("ERR EXEC without MULTI")
+        queued, client.multi = client.multi, None
+        return [self._execute(client, args) for args in queued]
+
+    def cmd_discard(self, client: _Client):
+        client.multi = None
+        return OK
+
+    # Скрипты
+
+    def cmd_script(self, subcommand: bytes, *args: bytes):
+        subcommand = subcommand.upper()
+        if subcommand == b"LOAD":
+            sha = hashlib.sha1(args[0]).hexdigest()
+            self.scripts[sha] = args[0]
+            return sha
+        if subcommand == b"EXISTS":
+            return [int(sha.decode() in self.scripts) for sha in args]
+        if subcommand == b"FLUSH":
+            self.scripts = {sha: self.scripts[sha] for sha in self.script_funcs}
+            return OK
+        raise RespError("ERR unknown SCRIPT subcommand")
+
+    def cmd_eval(self, source: bytes, numkeys: bytes, *args: bytes):
+        return self.cmd_evalsha(self.cmd_script(b"LOAD", source).encode(), numkeys, *args)
+
+    def cmd_evalsha(self, sha: bytes, numkeys: bytes, *args: bytes):
+        sha = sha.decode().lower()
+        if sha not in self.scripts:
+            raise RespError("NOSCRIPT No matching script. Please use EVAL.")
+        func = self.script_funcs.get(sha)
+        if func is None:
+            raise RespError("ERR script is not emulated by the stand-in server")
+        count = _int(numkeys)
+        return func(self, list(args[:count]), list(args[count:]))
+
+
+def _lua_number(value: float) -> bytes:
+    """Число так, как его записывает tostring в Lua"""
+    return (str(int(value)) if float(value).is_integer() else repr(float(value))).encode()
+
+
+def _optional_number(value: Optional[bytes]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def rate_limit_script(server: RespServer, keys: List[bytes], args: List[bytes]) -> List[int]:
+    """Python-версия RATE_LIMIT_SCRIPT из utils.redis_advanced"""
+    now = server._now_ms()
+    retry = 0
+    plans = []
+    for i, key in enumerate(keys):
+        algo, limit, period = args[i * 3].decode(), float(args[i * 3 + 1]), float(args[i * 3 + 2])
+        if algo == "sw":
+            start = now - (now % period)
+            data = server.cmd_hmget(key, b"start", b"cur", b"prev")
+            s = _optional_number(data[0])
+            s = start if s is None else s
+            cur = _optional_number(data[1]) or 0
+            prev = _optional_number(data[2]) or 0
+            if s != start:
+                prev = cur if start - s == period else 0
+                cur = 0
+            elapsed = now - start
+            estimated = prev * (period - elapsed) / period + cur
+            if estimated + 1 > limit:
+                wait = period - elapsed
+                if prev > 0 and cur + 1 <= limit:
+                    wait = min(wait, math.ceil((estimated + 1 - limit) * period / prev))
+                retry = max(retry, wait)
+            plans.append((start, cur + 1, prev))
+        else:
+            rate = limit / period
+            data = server.cmd_hmget(key, b"tokens", b"ts")
+            tokens = _optional_number(data[0])
+            tokens = limit if tokens is None else tokens
+            ts = _optional_number(data[1])
+            ts = now if ts is None else ts
+            tokens = min(limit, tokens + max(0, now - ts) * rate)
+            if tokens < 1:
+                retry = max(retry, math.ceil((1 - tokens) / rate))
+            plans.append((tokens - 1,))
+    if retry > 0:
+        return [0, int(retry)]
+    for i, key in enumerate(keys):
+        period = float(args[i * 3 + 2])
+        if args[i * 3] == b"sw":
+            server.cmd_hset(key, b"start", _lua_number(plans[i][0]), b"cur", _lua_number(plans[i][1]),
+                            b"prev", _lua_number(plans[i][2]))
+            server.cmd_pexpire(key, _lua_number(period * 2))
+        else:
+            server.cmd_hset(key, b"tokens", _lua_number(plans[i][0]), b"ts", _lua_number(now))
+            server.cmd_pexpire(key, _lua_number(period + 1000))
+    return [1, 0]
+
+
+def release_lock_script(server: RespServer, keys: List[bytes], args: List[bytes]) -> int:
+    """Python-версия RELEASE_LOCK_SCRIPT из utils.redis_advanced"""
+    if server.cmd_get(keys[0]) == args[0]:
+        return server.cmd_del(keys[0])
+    return 0
+
+
+def register_app_scripts(server: RespServer):
+    """Регистрирует Python-версии Lua-скриптов приложения (импортирует приложение)"""
+    from utils.redis_advanced import RATE_LIMIT_SCRIPT, RELEASE_LOCK_SCRIPT
+    server.register_script(RATE_LIMIT_SCRIPT, rate_limit_script)
+    server.register_script(RELEASE_LOCK_SCRIPT, release_lock_script)
+
+
+class KafkaSink:
+    """
+    Заменитель AIOKafkaProducer: сериализует сообщения тем же сериализатором,
+    подтверждает их сразу и считает сообщения и байты по топикам
+    """
+    def __init__(self, value_serializer: Callable[[Any], bytes]):
+        self.value_serializer = value_serializer
+        self.messages: Counter = Counter()
+        self.bytes: Counter = Counter()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def reset_counters(self):
+        self.messages.clear()
+        self.bytes.clear()
+
+    def _record(self, topic: str, value: Any):
+        self.messages[topic] += 1
+        self.bytes[topic] += len(self.value_serializer(value))
+
+    async def send(self, topic: str, value: Any = None, key: bytes = None, **kwargs) -> asyncio.Future:
+        self._record(topic, value)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def send_and_wait(self, topic: str, value: Any = None, key: bytes = None, **kwargs):
+        self._record(topic, value)
+
+
+class DbCallCounter:
+    """
+    Считает запросы к базе через клиенты Tortoise ORM: количество и суммарное
+    время по методам execute_*. Вложенные вызовы (метод клиента транзакции,
+    вызывающий метод базового клиента) считаются один раз.
+    """
+    METHODS = ("execute_insert", "execute_many", "execute_query", "execute_query_dict", "execute_script")
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.seconds: Counter = Counter()
+        self._depth = contextvars.ContextVar("db_call_depth", default=0)
+        self._patched = []
+
+    def install(self):
+        from tortoise.backends.base.client import BaseDBAsyncClient
+        pending = [BaseDBAsyncClient]
+        while pending:
+            cls = pending.pop()
+            pending.extend(cls.__subclasses__())
+            for name in self.METHODS:
+                original = cls.__dict__.get(name)
+                if original is not None:
+                    self._patched.append((cls, name, original))
+                    setattr(cls, name, self._wrap(name, original))
+
+    def uninstall(self):
+        for cls, name, original in reversed(self._patched):
+            setattr(cls, name, original)
+        self._patched.clear()
+
+    def reset_counters(self):
+        self.calls.clear()
+        self.seconds.clear()
+
+    def _wrap(self, name: str, method):
+        counter = self
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            depth = counter._depth.get()
+            token = counter._depth.set(depth + 1)
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                counter._depth.reset(token)
+                if depth == 0:
+                    counter.calls[name] += 1
+                    counter.seconds[name] += time.perf_counter() - started
+        return wrapper
@@ -4,6 +4,7 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from utils.config import BOT_TOKEN, EXTERNAL_URL, SKIP_UPDATES
 from utils.kafka_utils import KafkaEventHandler
+from utils.send_scheduler import SendScheduler, PRIORITY_REPLY
 from aiogram.utils import executor
 
 # Настройка логирования
@@ -18,6 +19,8 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=BOT_TOKEN)
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
+# Все исходящие сообщения проходят через планировщик с учетом лимитов Telegram
+send_scheduler = SendScheduler(bot)
 kafka_handler = None
 
 @dp.message_handler(commands=['start'])
@@ -26,7 +29,9 @@ async def start_cmd(message: types.Message):
     share_id = message.get_args()
     
     if not EXTERNAL_URL:
-        await message.answer("Извините, приложение временно недоступно")
+        await send_scheduler.send_message(
+            message.chat.id, "Извините, приложение временно недоступно", priority=PRIORITY_REPLY
+        )
         return
     
     keyboard = types.InlineKeyboardMarkup()
@@ -35,9 +40,11 @@ async def start_cmd(message: types.Message):
         web_app=types.WebAppInfo(url=EXTERNAL_URL)
     ))
     
-    await message.answer(
+    await send_scheduler.send_message(
+            message.chat.id,
             "Привет! Нажмите на кнопку ниже, чтобы открыть приложение:",
-            reply_markup=keyboard
+            reply_markup=keyboard,
+            priority=PRIORITY_REPLY
         )
 
 async def on_startup(dispatcher: Dispatcher):
@@ -46,7 +53,8 @@ async def on_startup(dispatcher: Dispatcher):
     # Инициализация Kafka
     try:
         global kafka_handler
-        kafka_handler = KafkaEventHandler(dispatcher)
+        await send_scheduler.start()
+        kafka_handler = KafkaEventHandler(dispatcher, send_scheduler)
         await kafka_handler.start()
         logger.info("Kafka успешно инициализирована")
     except Exception as e:
@@ -57,6 +65,7 @@ async def on_shutdown(dispatcher: Dispatcher):
     logger.info("Stopping Kafka handler...")
     if kafka_handler:
         await kafka_handler.stop()
+    await send_scheduler.stop()
     
     logger.info("\nБот остановлен")
     logger.info("==================================================\n")
@@ -0,0 +1,107 @@
+"""
+Повторная отправка сообщений из DLQ в исходные топики с ограничением скорости.
+
+Читает DLQ от последнего зафиксированного смещения группы повторной отправки
+до конца, публикует каждое сообщение в топик из заголовка original_topic
+(счетчик попыток сбрасывается) и фиксирует смещения после публикации.
+
+Запуск в контейнере бота:
+    python app/replay_dlq.py --rate 5 [--topic send_message] [--limit 100] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, TopicPartition
+from utils.config import KAFKA_BOOTSTRAP_SERVERS, KAFKA_DLQ_TOPIC
+from utils.retry import HEADER_ERROR, parse_headers, original_topic
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    stream=sys.stdout
+)
+logger = logging.getLogger(__name__)
+
+
+async def replay(args) -> int:
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+        group_id=args.group,
+        auto_offset_reset='earliest',
+        enable_auto_commit=False
+    )
+    producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, acks='all')
+    await consumer.start()
+    await producer.start()
+    replayed = skipped = 0
+    interval = 1 / args.rate
+    try:
+        # Партиции назначаем сами: позиция хранится в группе, но ребалансировок нет
+        await consumer.topics()
+        partitions = [TopicPartition(args.dlq_topic, p) for p in consumer.partitions_for_topic(args.dlq_topic) or ()]
+        if not partitions:
+            logger.info(f"Topic {args.dlq_topic} not found")
+            return 0
+        consumer.assign(partitions)
+        # Дочитываем только до конца DLQ на момент запуска
+        end_offsets = await consumer.end_offsets(partitions)
+        remaining = {tp for tp in partitions if await consumer.position(tp) < end_offsets[tp]}
+        while remaining and (args.limit is None or replayed < args.limit):
+            batches = await consumer.getmany(*remaining, timeout_ms=1000, max_records=100)
+            for tp, messages in batches.items():
+                for msg in messages:
+                    if args.limit is not None and replayed >= args.limit:
+                        break
+                    headers = parse_headers(msg.headers)
+                    topic = original_topic(msg, headers)
+                    if args.topic and topic != args.topic:
+                        skipped += 1
+                    elif args.dry_run:
+                        logger.info(f"Would replay {tp.partition}:{msg.offset} to {topic}: {headers.get(HEADER_ERROR)}")
+                        replayed += 1
+                    else:
+                        # Заголовки не переносим: счетчик попыток начинается заново
+                        await producer.send_and_wait(topic, msg.value, key=msg.key)
+                        replayed += 1
+                        await asyncio.sleep(interval)
+                    if not args.dry_run:
+                        await consumer.commit({tp: msg.offset + 1})
+                    if msg.offset + 1 >= end_offsets[tp]:
+                        remaining.discard(tp)
+                        break
+    finally:
+        await consumer.stop()
+        await producer.stop()
+    logger.info(f"Replayed {replayed} messages, skipped {skipped}")
+    return replayed
+
+
+def positive_rate(value: str) -> float:
+    """Скорость для argparse: строго больше нуля, иначе пауза между сообщениями не определена"""
+    try:
+        rate = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a number")
+    if not rate > 0:
+        raise argparse.ArgumentTypeError(f"rate must be greater than 0, got {value}")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=positive_rate, default=5, help="Сообщений в секунду")
+    parser.add_argument('--topic', help="Отправлять только сообщения из этого исходного топика")
+    parser.add_argument('--limit', type=int, help="Максимум сообщений за запуск")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать сообщения, не отправлять и не фиксировать")
+    parser.add_argument('--dlq-topic', default=KAFKA_DLQ_TOPIC)
+    parser.add_argument('--group', help="Группа, в которой хранится позиция повторной отправки")
+    args = parser.parse_args()
+    if not args.group:
+        # С фильтром по топику — своя позиция, чтобы пропущенные сообщения остались для других запусков
+        args.group = f"bot_dlq_replay.{args.topic}" if args.topic else 'bot_dlq_replay'
+    asyncio.run(replay(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,3 +24,45 @@ EXTERNAL_URL = os.getenv("EXTERNAL_URL")
 
 # Получаем значения из переменных окружения
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
+
+# Один consumer на все топики бота
+KAFKA_GROUP_ID = os.getenv('KAFKA_GROUP_ID', 'bot_event_handler')
+# При первом запуске новой группы продолжить с смещений прежних групп по топикам
+KAFKA_MIGRATE_LEGACY_OFFSETS = os.getenv('KAFKA_MIGRATE_LEGACY_OFFSETS', 'true').lower() == 'true'
+# Пакетное чтение: максимум сообщений за один getmany и сколько ждать их (в миллисекундах)
+KAFKA_FETCH_MAX_RECORDS = int(os.getenv('KAFKA_FETCH_MAX_RECORDS', '500'))
+KAFKA_FETCH_TIMEOUT_MS = int(os.getenv('KAFKA_FETCH_TIMEOUT_MS', '200'))
+KAFKA_MAX_PARTITION_FETCH_BYTES = int(os.getenv('KAFKA_MAX_PARTITION_FETCH_BYTES', str(1024 * 1024)))
+
+# Параллельная обработка событий Kafka
+# Сколько событий одновременно принято в обработку (на все ключи); порядок сохраняется внутри chat_id
+KAFKA_MAX_IN_FLIGHT = int(os.getenv('KAFKA_MAX_IN_FLIGHT', '64'))
+# Как часто фиксировать смещения обработанных сообщений (в миллисекундах)
+KAFKA_COMMIT_INTERVAL_MS = int(os.getenv('KAFKA_COMMIT_INTERVAL_MS', '1000'))
+# Пауза перед следующим чтением после ошибки в цикле обработки (в миллисекундах)
+KAFKA_ERROR_BACKOFF_MS = int(os.getenv('KAFKA_ERROR_BACKOFF_MS', '1000'))
+# Повторы при временных ошибках (сеть, 5xx): задержки ступеней в секундах, для каждой свой топик
+KAFKA_RETRY_DELAYS = [int(delay) for delay in os.getenv('KAFKA_RETRY_DELAYS', '10,60,600').split(',')]
+KAFKA_RETRY_TOPIC_PREFIX = os.getenv('KAFKA_RETRY_TOPIC_PREFIX', 'bot.retry')
+# Сообщения, которые не удалось обработать, с исходными данными и ошибкой
+KAFKA_DLQ_TOPIC = os.getenv('KAFKA_DLQ_TOPIC', 'bot.dlq')
+# Повторная публикация в топик повтора или DLQ, пока она не удастся: начальная и максимальная пауза (в миллисекундах)
+KAFKA_FORWARD_BACKOFF_MS = int(os.getenv('KAFKA_FORWARD_BACKOFF_MS', '500'))
+KAFKA_FORWARD_MAX_BACKOFF_MS = int(os.getenv('KAFKA_FORWARD_MAX_BACKOFF_MS', '30000'))
+# Сколько ждать завершения принятых событий при остановке (в секундах)
+KAFKA_SHUTDOWN_TIMEOUT = float(os.getenv('KAFKA_SHUTDOWN_TIMEOUT', '10'))
+
+# Лимиты Telegram Bot API для исходящих сообщений
+# Общий лимит бота (сообщений в секунду) и допустимый всплеск
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_GLOBAL_BURST = int(os.getenv('TELEGRAM_GLOBAL_BURST', '5'))
+# Минимальный интервал между сообщениями в один чат (в секундах): личные чаты и группы
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1'))
+TELEGRAM_GROUP_CHAT_INTERVAL = float(os.getenv('TELEGRAM_GROUP_CHAT_INTERVAL', '3'))
+# Сколько раз возвращать сообщение в очередь после RetryAfter
+TELEGRAM_RETRY_AFTER_ATTEMPTS = int(os.getenv('TELEGRAM_RETRY_AFTER_ATTEMPTS', '3'))
+
+# URL для Redis
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Сколько помнить обработанные события (в секундах), чтобы отбрасывать повторные доставки
+EVENT_DEDUPE_TTL = int(os.getenv('EVENT_DEDUPE_TTL', str(24 * 3600)))
@@ -0,0 +1,57 @@
+import logging
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+from redis.asyncio import Redis
+from utils.config import REDIS_URL, EVENT_DEDUPE_TTL
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEDUPE_PREFIX = "bot:event:"
+
+
+class EventDeduplicator:
+    """
+    Помнит идентификаторы обработанных событий в Redis (ключ с TTL на событие)
+    и в небольшом LRU в памяти. При недоступности Redis проверка пропускается:
+    лучше повторное сообщение, чем потерянное.
+    """
+    def __init__(self, redis_url: str = REDIS_URL, ttl: int = EVENT_DEDUPE_TTL, local_size: int = 10000):
+        self.redis = Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self.ttl = ttl
+        self.local_size = local_size
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self.metrics = {"checked": 0, "duplicates": 0, "errors": 0}
+
+    async def seen(self, event_ids: Iterable[Optional[str]]) -> Set[str]:
+        """Возвращает уже обработанные события из пачки; в Redis — одна команда MGET"""
+        ids = [event_id for event_id in event_ids if event_id]
+        self.metrics["checked"] += len(ids)
+        found = {event_id for event_id in ids if event_id in self._recent}
+        remote = [event_id for event_id in ids if event_id not in found]
+        if remote:
+            try:
+                values = await self.redis.mget([f"{DEDUPE_PREFIX}{event_id}" for event_id in remote])
+                found.update(event_id for event_id, value in zip(remote, values) if value is not None)
+            except Exception as e:
+                self.metrics["errors"] += 1
+                logger.error(f"Error checking processed events, dedupe skipped for this batch: {e}")
+        self.metrics["duplicates"] += len(found)
+        return found
+
+    async def mark(self, event_id: Optional[str]):
+        """Запоминает событие как обработанное"""
+        if not event_id:
+            return
+        self._recent[event_id] = None
+        self._recent.move_to_end(event_id)
+        while len(self._recent) > self.local_size:
+            self._recent.popitem(last=False)
+        try:
+            await self.redis.set(f"{DEDUPE_PREFIX}{event_id}", 1, ex=self.ttl)
+        except Exception as e:
+            self.metrics["errors"] += 1
+            logger.error(f"Error marking event {event_id} as processed: {e}")
+
+    async def close(self):
+        await self.redis.close()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class KeyedWorkerPool:
+    """
+    Параллельная обработка задач с сохранением порядка внутри одного ключа.
+    Задачи с разными ключами выполняются одновременно, с одинаковым — по очереди.
+    Общее число принятых, но еще не завершенных задач ограничено max_in_flight:
+    submit ждет свободного места, что притормаживает чтение из Kafka.
+    """
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._queues: Dict[Hashable, Deque[Callable[[], Awaitable[None]]]] = {}
+        self._workers: Set[asyncio.Task] = set()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Количество принятых, но еще не завершенных задач"""
+        return self._in_flight
+
+    @property
+    def active_keys(self) -> int:
+        """Количество ключей, по которым сейчас идет обработка"""
+        return len(self._queues)
+
+    async def submit(self, key: Hashable, job: Callable[[], Awaitable[None]]):
+        """Ставит задачу в очередь ключа, дожидаясь свободного места"""
+        await self._slots.acquire()
+        self._in_flight += 1
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(job)
+            return
+        self._queues[key] = deque([job])
+        worker = asyncio.create_task(self._drain(key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+
+    async def _drain(self, key: Hashable):
+        """Выполняет задачи ключа по порядку, пока его очередь не опустеет"""
+        queue = self._queues[key]
+        try:
+            while queue:
+                job = queue[0]
+                try:
+                    await job()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Unhandled error in job for key {key}: {e}")
+                finally:
+                    queue.popleft()
+                    self._in_flight -= 1
+                    self._slots.release()
+        finally:
+            del self._queues[key]
+
+    async def join(self, timeout: float = None) -> bool:
+        """Ждет завершения всех принятых задач; возвращает False по таймауту"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._workers:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.wait(set(self._workers), timeout=remaining)
+        return True
+
+    async def stop(self):
+        """Отменяет незавершенные задачи"""
+        for worker in list(self._workers):
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+class OffsetTracker:
+    """
+    Отслеживает обработку сообщений по партициям и вычисляет смещения,
+    которые можно зафиксировать: сообщения завершаются не по порядку,
+    поэтому фиксируется только непрерывный обработанный префикс.
+
+    Каждый отзыв партиций увеличивает поколение. Сообщения регистрируются
+    с поколением, при котором они были получены: если партицию с тех пор
+    отобрали (и, возможно, назначили снова), сообщение и его завершение
+    игнорируются — их заново получит текущий владелец партиции.
+    """
+    def __init__(self):
+        self._started: Dict[Any, Deque[int]] = {}
+        self._done: Dict[Any, Set[int]] = {}
+        self._committable: Dict[Any, int] = {}
+        self.generation = 0
+        # Поколение, в котором партицию отобрали в последний раз
+        self._revoked_at: Dict[Any, int] = {}
+
+    def is_current(self, partition: Any, generation: int) -> bool:
+        """Не отбирали ли партицию после получения сообщения поколения generation"""
+        return self._revoked_at.get(partition, 0) <= generation
+
+    def start(self, partition: Any, offset: int, generation: int) -> bool:
+        """
+        Регистрирует сообщение, принятое в обработку
+        :param generation: Значение generation в момент получения сообщения
+        :return: False, если партицию с тех пор отобрали и сообщение нужно пропустить
+        """
+        if not self.is_current(partition, generation):
+            return False
+        self._started.setdefault(partition, deque()).append(offset)
+        self._done.setdefault(partition, set())
+        return True
+
+    def done(self, partition: Any, offset: int, generation: int):
+        """Отмечает сообщение как успешно обработанное"""
+        started = self._started.get(partition)
+        if started is None or not self.is_current(partition, generation):
+            # Партицию уже отобрали при ребалансировке
+            return
+        done = self._done[partition]
+        done.add(offset)
+        while started and started[0] in done:
+            done.discard(started[0])
+            self._committable[partition] = started.popleft() + 1
+
+    def pending(self, partition: Any) -> int:
+        """Количество незавершенных сообщений партиции"""
+        started = self._started.get(partition)
+        return len(started) - len(self._done[partition]) if started else 0
+
+    def take_commits(self, assigned: Optional[Set[Any]] = None) -> Dict[Any, int]:
+        """
+        Забирает смещения, которые еще не были зафиксированы
+        :param assigned: Текущее назначение; смещения других партиций отбрасываются
+        """
+        commits, self._committable = self._committable, {}
+        if assigned is not None:
+            commits = {partition: offset for partition, offset in commits.items() if partition in assigned}
+        return commits
+
+    def restore_commits(self, commits: Dict[Any, int]):
+        """Возвращает смещения после неудачной фиксации, не затирая более новые"""
+        for partition, offset in commits.items():
+            if partition in self._started and self._committable.get(partition, -1) < offset:
+                self._committable[partition] = offset
+
+    def forget(self, partitions):
+        """Сбрасывает состояние отобранных партиций"""
+        self.generation += 1
+        for partition in partitions:
+            self._started.pop(partition, None)
+            self._done.pop(partition, None)
+            self._committable.pop(partition, None)
+            self._revoked_at[partition] = self.generation
@@ -1,228 +1,477 @@
-import json
 import logging
 import asyncio
-from typing import Dict, Any, Optional
-from aiogram import types, Dispatcher
-from aiokafka import AIOKafkaConsumer
-from utils.config import KAFKA_BOOTSTRAP_SERVERS
+import time
+from typing import Dict, Optional, Set, Tuple
+from aiogram import Dispatcher
+from aiogram.utils.exceptions import BadRequest, ChatNotFound, Unauthorized
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener, TopicPartition
+from aiokafka.errors import CommitFailedError, IllegalStateError
+from utils.config import (
+    KAFKA_BOOTSTRAP_SERVERS, KAFKA_GROUP_ID, KAFKA_MIGRATE_LEGACY_OFFSETS,
+    KAFKA_FETCH_MAX_RECORDS, KAFKA_FETCH_TIMEOUT_MS, KAFKA_MAX_PARTITION_FETCH_BYTES,
+    KAFKA_MAX_IN_FLIGHT, KAFKA_COMMIT_INTERVAL_MS, KAFKA_ERROR_BACKOFF_MS, KAFKA_SHUTDOWN_TIMEOUT,
+    KAFKA_FORWARD_BACKOFF_MS, KAFKA_FORWARD_MAX_BACKOFF_MS
+)
+from utils.dispatcher import KeyedWorkerPool, OffsetTracker
+from utils.send_scheduler import SendScheduler, PRIORITIES, PRIORITY_NOTIFICATION
+from utils.templates import template_registry, build_inline_keyboard
+from utils.dedupe import EventDeduplicator
+from utils.retry import retry_policy, parse_headers, original_topic, attempt_of, not_before_ms
 from datetime import datetime
+from common.events import TOPICS, Event, EventDecodeError, ShareCreated, UserUpdated, SendMessage, decode_event
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Группы, в которых топики читались отдельными consumer'ами до перехода на общий
+LEGACY_GROUP_IDS = {topic: f"bot_{topic.replace('-', '_')}_handler" for topic in TOPICS}
+
+# Получатель недоступен (бот заблокирован, чат не найден): сообщение просто пропускаем
+DROP_ERRORS = (Unauthorized, ChatNotFound)
+# Повтор не поможет (некорректный запрос или событие): сообщение сразу уходит в DLQ
+PERMANENT_ERRORS = (BadRequest, ValueError, KeyError, TypeError)
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    """Фиксирует обработанные смещения перед тем, как партиции отберут"""
+    def __init__(self, handler: 'KafkaEventHandler'):
+        self.handler = handler
+
+    async def on_partitions_revoked(self, revoked):
+        await self.handler._commit()
+        self.handler.tracker.forget(revoked)
+
+    async def on_partitions_assigned(self, assigned):
+        if KAFKA_MIGRATE_LEGACY_OFFSETS:
+            await self.handler._seek_to_legacy_offsets(assigned)
+
 
 class KafkaEventHandler:
     """Обработчик событий Kafka для бота"""
-    def __init__(self, dp: Dispatcher):
+    def __init__(self, dp: Dispatcher, sender: SendScheduler, max_in_flight: int = KAFKA_MAX_IN_FLIGHT):
         self.dp = dp
-        self.consumers = {}
-        self.tasks = []
+        # Все сообщения уходят через планировщик с учетом лимитов Telegram
+        self.sender = sender
+        self.consumer: Optional[AIOKafkaConsumer] = None
+        # Продюсер для топиков повторов и DLQ
+        self.producer: Optional[AIOKafkaProducer] = None
+        self.retry_policy = retry_policy
+        # Отбрасывает события, уже обработанные до ребалансировки или падения
+        self.dedupe = EventDeduplicator()
+        self._in_flight_ids: Set[str] = set()
+        self.tracker = OffsetTracker()
+        # Общий пул на все топики: события одного чата обрабатываются по порядку
+        self.pool = KeyedWorkerPool(max_in_flight)
+        self.commit_interval = KAFKA_COMMIT_INTERVAL_MS / 1000
+        self.task = None
+        self._last_commit = 0.0
+        self.metrics = {
+            "received": 0, "processed": 0, "dropped": 0, "retried": 0, "dead_lettered": 0,
+            "forward_failed": 0, "deferred": 0, "duplicates": 0, "revoked": 0, "commits": 0,
+            "batches": 0, "last_batch_size": 0
+        }
         logger.info("KafkaEventHandler initialized")
         
     async def start(self):
-        """Запускает обработчики событий Kafka"""
+        """Запускает обработчик событий Kafka"""
         try:
-            # Создаем и запускаем consumer для каждого типа событий
-            for topic in ['share_created', 'user_updated', 'send_message']:
-                consumer = await self._create_consumer(topic)
-                if consumer:
-                    task = asyncio.create_task(self._handle_events(consumer))
-                    self.tasks.append(task)
-                    logger.info(f"Started consumer task for topic {topic}")
+            self.producer = AIOKafkaProducer(bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS, enable_idempotence=True)
+            await self.producer.start()
+            # Один consumer на все топики бота и топики повторов
+            self.consumer = await self._create_consumer()
+            if self.consumer:
+                self.task = asyncio.create_task(self._handle_events())
+                logger.info(f"Started consumer task for topics {TOPICS}")
         except Exception as e:
             logger.error(f"Error starting Kafka event handlers: {e}")
             raise
     
     async def stop(self):
-        """Останавливает все Kafka consumers"""
+        """Останавливает Kafka consumer"""
         try:
-            # Отменяем все задачи
-            for task in self.tasks:
-                task.cancel()
+            # Перестаем читать новые сообщения
+            if self.task:
+                self.task.cancel()
+                await asyncio.gather(self.task, return_exceptions=True)
             
-            # Ждем завершения всех задач
-            if self.tasks:
-                await asyncio.gather(*self.tasks, return_exceptions=True)
+            # Даем принятым событиям завершиться и фиксируем их смещения
+            if not await self.pool.join(KAFKA_SHUTDOWN_TIMEOUT):
+                logger.warning(f"{self.pool.in_flight} events still in flight on shutdown, they will be redelivered")
+            await self.pool.stop()
+            await self._commit()
             
-            # Останавливаем все consumers
-            for consumer in self.consumers.values():
-                await consumer.stop()
+            if self.consumer:
+                await self.consumer.stop()
+            if self.producer:
+                await self.producer.stop()
+            await self.dedupe.close()
             
-            logger.info("All Kafka consumers stopped")
+            logger.info(f"Kafka consumer stopped, metrics: {self.metrics}")
         except Exception as e:
-            logger.error(f"Error stopping Kafka consumers: {e}")
+            logger.error(f"Error stopping Kafka consumer: {e}")
     
-    async def _create_consumer(self, topic: str) -> Optional[AIOKafkaConsumer]:
-        """Создает и запускает consumer для указанного топика"""
+    async def _create_consumer(self) -> Optional[AIOKafkaConsumer]:
+        """Создает и запускает consumer, подписанный на все топики бота"""
         try:
-            group_id = f"bot_{topic.replace('-', '_')}_handler"
             consumer = AIOKafkaConsumer(
-                topic,
                 bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-                group_id=group_id,
-                auto_offset_reset='earliest'
+                group_id=KAFKA_GROUP_ID,
+                auto_offset_reset='earliest',
+                # Смещения фиксируем сами, только после успешной обработки
+                enable_auto_commit=False,
+                max_partition_fetch_bytes=KAFKA_MAX_PARTITION_FETCH_BYTES
             )
+            consumer.subscribe(TOPICS + self.retry_policy.topics, listener=_RebalanceListener(self))
+            # Ссылка нужна до старта: партиции могут быть назначены во время start()
+            self.consumer = consumer
             await consumer.start()
-            self.consumers[topic] = consumer
-            logger.info(f"Consumer created and started for topic {topic}")
+            logger.info(f"Consumer created and started for topics {TOPICS}")
             return consumer
         except Exception as e:
-            logger.error(f"Error creating consumer for topic {topic}: {e}")
+            logger.error(f"Error creating consumer for topics {TOPICS}: {e}")
+            self.consumer = None
             return None
     
-    async def _handle_events(self, consumer: AIOKafkaConsumer):
-        """Обрабатывает события из Kafka"""
-        try:
-            async for msg in consumer:
+    async def _seek_to_legacy_offsets(self, assigned):
+        """
+        Для партиций без зафиксированного смещения в новой группе продолжает
+        чтение с места, где остановились прежние группы по топикам,
+        чтобы переход на общий consumer не перечитывал всю историю
+        """
+        for tp in assigned:
+            if tp.topic not in LEGACY_GROUP_IDS:
+                continue
+            try:
+                if await self.consumer.committed(tp) is not None:
+                    continue
+                legacy = AIOKafkaConsumer(
+                    bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
+                    group_id=LEGACY_GROUP_IDS[tp.topic],
+                    enable_auto_commit=False
+                )
+                await legacy.start()
                 try:
-                    topic = msg.topic
-                    value = json.loads(msg.value.decode())
-
-                    if topic == 'share_created':
-                        await self._handle_share_created(value)
-                    elif topic == 'user_updated':
-                        await self._handle_user_updated(value)
-                    elif topic == 'send_message':
-                        await self._handle_send_message(value)
-
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error decoding message: {e}")
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-
-        except asyncio.CancelledError:
-            logger.info("Consumer task was cancelled")
-        except Exception as e:
-            logger.error(f"Error in event handler: {e}")
+                    offset = await legacy.committed(tp)
+                finally:
+                    await legacy.stop()
+                if offset is not None:
+                    self.consumer.seek(tp, offset)
+                    logger.info(f"Resuming {tp.topic}:{tp.partition} from legacy group offset {offset}")
+            except Exception as e:
+                logger.error(f"Error reading legacy offset for {tp.topic}:{tp.partition}: {e}")
     
-    async def _handle_share_created(self, data: dict):
-        """Обрабатывает событие создания шары"""
-        try:
-            logger.info(f"Processing share_created event: {data}")
-            
-            # Получаем данные из события
-            share_id = data.get('share_id')
-            user_id = data.get('user_id')
-            share_data = data.get('data', {})
-            
-            if not share_id or not user_id:
-                logger.error(f"Missing required fields in share_created event: {data}")
+    async def _handle_events(self):
+        """Читает события из Kafka пачками и передает их в пул обработчиков"""
+        while True:
+            try:
+                await self._handle_batch()
+            except asyncio.CancelledError:
+                logger.info("Consumer task was cancelled")
                 return
-                
-            # Формируем сообщение для пользователя
-            message_text = (
-                f"🔄 Ваша шара с ID {share_id} успешно создана!\n\n"
-                f"Данные шары:\n"
-            )
-            
-            # Добавляем информацию о дне рождения, если она есть
-            if 'birthday' in share_data:
-                message_text += f"📅 День рождения: {share_data['birthday']}\n"
-                
-            # Добавляем информацию о времени создания
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            message_text += f"\nВремя создания: {current_time}"
-            
-            # Отправляем сообщение пользователю
-            await self.dp.bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                parse_mode="HTML"
+            except Exception as e:
+                # Одна ошибка (Kafka, Redis, некорректное сообщение) не должна останавливать чтение
+                logger.error(f"Error in event handler: {e}")
+                await asyncio.sleep(KAFKA_ERROR_BACKOFF_MS / 1000)
+    
+    async def _handle_batch(self):
+        """Читает одну пачку событий и передает ее в пул обработчиков"""
+        batches = await self.consumer.getmany(
+            timeout_ms=KAFKA_FETCH_TIMEOUT_MS,
+            max_records=KAFKA_FETCH_MAX_RECORDS
+        )
+        # Поколение назначения, при котором получена пачка: если партицию
+        # отберут, пока пачка ждет места в пуле, ее сообщения будут пропущены
+        generation = self.tracker.generation
+        assigned = self.consumer.assignment()
+        size = sum(len(messages) for messages in batches.values())
+        if size:
+            self.metrics["batches"] += 1
+            self.metrics["last_batch_size"] = size
+            self.metrics["received"] += size
+        # Первое еще не переданное в обработку смещение каждой партиции пачки
+        unsubmitted = {tp: messages[0].offset for tp, messages in batches.items() if tp in assigned and messages}
+        try:
+            entries = []
+            for tp, messages in batches.items():
+                if tp not in assigned:
+                    self.metrics["revoked"] += len(messages)
+                    continue
+                for msg in messages:
+                    headers = parse_headers(msg.headers)
+                    if self.retry_policy.is_retry_topic(tp.topic) and self._defer(tp, msg, headers):
+                        # Остальные сообщения ступени тоже еще рано обрабатывать
+                        break
+                    entries.append((tp, msg, headers) + self._decode(msg, original_topic(msg, headers)))
+            # Уже обработанные события ищем одним запросом на пачку
+            duplicates = await self.dedupe.seen(
+                event.event_id for _, _, _, event, _ in entries if event is not None
             )
-            
-            logger.info(f"Share creation notification sent to user {user_id}")
-            
-        except Exception as e:
-            logger.error(f"Error handling share_created event: {e}")
+            for tp, msg, headers, event, error in entries:
+                await self._submit(tp, msg, headers, event, error, duplicates, generation)
+                unsubmitted[tp] = msg.offset + 1
+        except Exception:
+            # Иначе следующие пачки зафиксировали бы смещения поверх пропущенных сообщений
+            self._rewind(unsubmitted)
+            raise
+        # Смещения фиксируются одним запросом на пачку, не чаще интервала
+        if asyncio.get_running_loop().time() - self._last_commit >= self.commit_interval:
+            await self._commit()
     
-    async def _handle_user_updated(self, data: dict):
-        """Обрабатывает событие обновления пользователя"""
+    def _rewind(self, positions: Dict[TopicPartition, int]):
+        """Возвращает чтение партиций к сообщениям, не переданным в обработку"""
+        assigned = self.consumer.assignment()
+        for tp, offset in positions.items():
+            if tp in assigned:
+                self.consumer.seek(tp, offset)
+    
+    def _defer(self, tp: TopicPartition, msg, headers: Dict[str, str]) -> bool:
+        """
+        Если время повтора еще не наступило, приостанавливает партицию ступени
+        и возвращается к сообщению позже, не занимая обработчики
+        """
+        due = not_before_ms(headers)
+        wait = (due / 1000 - time.time()) if due else 0
+        if wait <= 0:
+            return False
+        self.consumer.seek(tp, msg.offset)
+        self.consumer.pause(tp)
+        asyncio.get_running_loop().call_later(wait, self._resume, tp)
+        self.metrics["deferred"] += 1
+        return True
+    
+    def _resume(self, tp: TopicPartition):
+        # Партицию могли отобрать при ребалансировке
+        if self.consumer is not None and tp in self.consumer.assignment():
+            self.consumer.resume(tp)
+    
+    @staticmethod
+    def _decode(msg, topic: str) -> Tuple[Optional[Event], Optional[Exception]]:
+        """Декодирует сообщение: (событие, None) или (None, ошибка)"""
         try:
-            logger.info(f"Processing user_updated event: {data}")
-            user_id = data.get('user_id')
-            user_data = data.get('data', {})
-            if user_id:
-                action = user_data.get('action')
-                if action == 'created':
-                    message_text = "👋 Добро пожаловать! Ваш профиль успешно создан."
-                else:
-                    message_text = "✅ Ваш профиль успешно обновлен."
-                await self.dp.bot.send_message(chat_id=user_id, text=message_text)
+            return decode_event(msg.value, topic), None
+        except EventDecodeError as e:
+            return None, e
         except Exception as e:
-            logger.error(f"Error handling user_updated event: {e}")
-            
-    async def _handle_send_message(self, data: dict):
-        """Обрабатывает событие отправки сообщения"""
+            # Непредвиденная ошибка разбора не должна повторяться на каждом чтении пачки
+            return None, EventDecodeError(f"{type(e).__name__}: {e}")
+    
+    async def _submit(
+        self,
+        tp: TopicPartition,
+        msg,
+        headers: Dict[str, str],
+        event: Optional[Event],
+        error: Optional[Exception],
+        duplicates: Set[str],
+        generation: int
+    ):
+        """Ставит событие в очередь чата, пропуская повторные доставки"""
+        if not self.tracker.start(tp, msg.offset, generation):
+            # Партицию отобрали, пока пачка ждала: сообщение получит новый владелец
+            self.metrics["revoked"] += 1
+            return
+        topic = original_topic(msg, headers)
+        if error is not None:
+            logger.error(f"Error decoding message at {msg.topic}:{msg.partition}:{msg.offset}: {error}")
+            # Публикация в DLQ может повторяться долго, поэтому не выполняется в цикле чтения
+            await self.pool.submit(msg.key or tp, lambda: self._dead_letter(tp, msg, generation, topic, headers, error))
+            return
+        event_id = event.event_id
+        if event_id and (event_id in duplicates or event_id in self._in_flight_ids):
+            logger.info(f"Skipping duplicate {topic} event {event_id} at {msg.topic}:{msg.offset}")
+            self.metrics["duplicates"] += 1
+            self.tracker.done(tp, msg.offset, generation)
+            return
+        if event_id:
+            self._in_flight_ids.add(event_id)
+        # События одного чата обрабатываются по порядку
+        key = str(event.chat_id) if event.chat_id else msg.key or tp
+        await self.pool.submit(key, lambda: self._process(tp, msg, topic, event, headers, generation))
+    
+    async def _dead_letter(self, tp: TopicPartition, msg, generation: int, topic: str, headers: Dict[str, str], error: Exception):
+        """Передает в DLQ сообщение, которое не удалось декодировать"""
+        if await self._forward(tp, msg, generation, topic, self.retry_policy.dlq_topic, attempt_of(headers), 0, error):
+            self.metrics["dead_lettered"] += 1
+            self.tracker.done(tp, msg.offset, generation)
+    
+    async def _process(self, tp: TopicPartition, msg, topic: str, event: Event, headers: Dict[str, str], generation: int):
+        """
+        Обрабатывает событие. При временной ошибке событие уходит в топик
+        следующей ступени повторов, при постоянной — в DLQ; смещение
+        фиксируется, только когда событие обработано или передано дальше.
+        """
+        event_id = event.event_id
         try:
-            logger.info(f"Processing send_message event")
-            message_data = data.get('message_data', {})
-            
-            if not message_data:
-                logger.error("No message_data in event")
+            await self._dispatch(event)
+            self.metrics["processed"] += 1
+            # Запоминаем событие до фиксации смещения: повторная доставка будет пропущена
+            await self.dedupe.mark(event_id)
+        except DROP_ERRORS as e:
+            logger.warning(f"Dropping {topic} event at {msg.topic}:{msg.offset}, recipient unavailable: {e}")
+            self.metrics["dropped"] += 1
+            await self.dedupe.mark(event_id)
+        except PERMANENT_ERRORS as e:
+            logger.error(f"Dead-lettering {topic} event at {msg.topic}:{msg.offset}: {e}")
+            if not await self._forward(tp, msg, generation, topic, self.retry_policy.dlq_topic, attempt_of(headers), 0, e):
                 return
-                
-            chat_id = message_data.get('chat_id')
-            text = message_data.get('text')
-            
-            if not chat_id or not text:
-                logger.error(f"Missing required fields in message_data: {message_data}")
+            self.metrics["dead_lettered"] += 1
+        except Exception as e:
+            attempt = attempt_of(headers)
+            target, delay = self.retry_policy.next_topic(attempt)
+            logger.warning(f"Failed {topic} event at {msg.topic}:{msg.offset} (attempt {attempt + 1}), moving to {target}: {e}")
+            if not await self._forward(tp, msg, generation, topic, target, attempt + 1, delay, e):
                 return
-                
-            # Получаем дополнительные параметры
-            parse_mode = message_data.get('parse_mode', 'HTML')
-            disable_web_page_preview = message_data.get('disable_web_page_preview', False)
-            disable_notification = message_data.get('disable_notification', False)
-            reply_to_message_id = message_data.get('reply_to_message_id')
-            
-            # Проверяем наличие клавиатуры
-            reply_markup = None
-            if 'reply_markup' in message_data:
-                markup_data = message_data['reply_markup']
-                if 'inline_keyboard' in markup_data:
-                    keyboard = types.InlineKeyboardMarkup()
-                    
-                    for row in markup_data['inline_keyboard']:
-                        buttons = []
-                        for button_data in row:
-                            button = None
-                            
-                            # Создаем кнопку в зависимости от типа
-                            if 'url' in button_data and button_data['url']:
-                                button = types.InlineKeyboardButton(
-                                    text=button_data['text'],
-                                    url=button_data['url']
-                                )
-                            elif 'callback_data' in button_data and button_data['callback_data']:
-                                button = types.InlineKeyboardButton(
-                                    text=button_data['text'],
-                                    callback_data=button_data['callback_data']
-                                )
-                            elif 'web_app' in button_data and button_data['web_app']:
-                                button = types.InlineKeyboardButton(
-                                    text=button_data['text'],
-                                    web_app=types.WebAppInfo(url=button_data['web_app']['url'])
-                                )
-                                
-                            if button:
-                                buttons.append(button)
-                                
-                        if buttons:
-                            keyboard.row(*buttons)
-                            
-                    reply_markup = keyboard
+            self.metrics["dead_lettered" if target == self.retry_policy.dlq_topic else "retried"] += 1
+        finally:
+            self._in_flight_ids.discard(event_id)
+        self.tracker.done(tp, msg.offset, generation)
+    
+    async def _forward(
+        self,
+        tp: TopicPartition,
+        msg,
+        generation: int,
+        topic: str,
+        target: str,
+        attempt: int,
+        delay: int,
+        error: Exception
+    ) -> bool:
+        """
+        Публикует исходное сообщение в топик повтора или DLQ. Неудачная
+        публикация повторяется с растущей паузой: пока сообщение не передано
+        дальше, его смещение нельзя зафиксировать, и партиция стоит на месте.
+        :return: False, если партицию отобрали раньше, чем публикация удалась
+        """
+        backoff = KAFKA_FORWARD_BACKOFF_MS / 1000
+        while True:
+            try:
+                await self.producer.send_and_wait(
+                    target,
+                    msg.value,
+                    key=msg.key,
+                    headers=self.retry_policy.retry_headers(topic, attempt, delay, error)
+                )
+                return True
+            except Exception as e:
+                logger.error(f"Error forwarding {topic} event to {target}, retrying in {backoff:.1f}s: {e}")
+                self.metrics["forward_failed"] += 1
+            await asyncio.sleep(backoff)
+            # Сообщение получит новый владелец партиции
+            if not self.tracker.is_current(tp, generation):
+                return False
+            backoff = min(backoff * 2, KAFKA_FORWARD_MAX_BACKOFF_MS / 1000)
+    
+    async def _dispatch(self, event: Event):
+        """Вызывает обработчик события; ошибки пробрасываются вызывающему"""
+        if isinstance(event, ShareCreated):
+            await self._handle_share_created(event)
+        elif isinstance(event, UserUpdated):
+            await self._handle_user_updated(event)
+        elif isinstance(event, SendMessage):
+            await self._handle_send_message(event)
+    
+    async def _commit(self):
+        """Фиксирует смещения обработанных сообщений одним запросом"""
+        self._last_commit = asyncio.get_running_loop().time()
+        if self.consumer is None:
+            return
+        # Смещения отобранных партиций фиксирует их новый владелец
+        commits = self.tracker.take_commits(self.consumer.assignment())
+        if not commits:
+            return
+        try:
+            await self.consumer.commit(commits)
+            self.metrics["commits"] += 1
+        except (CommitFailedError, IllegalStateError) as e:
+            # Группа перестроилась или партиции уже не наши: повтор фиксации
+            # не поможет, сообщения после последней фиксации получит новый владелец
+            logger.warning(f"Dropping offsets that can no longer be committed {commits}: {e}")
+        except Exception as e:
+            logger.error(f"Error committing offsets: {e}")
+            self.tracker.restore_commits(commits)
+    
+    async def _handle_share_created(self, event: ShareCreated):
+        """Обрабатывает событие создания шары"""
+        logger.info(f"Processing share_created event: {event}")
+        
+        if not event.share_id or not event.user_id:
+            logger.error(f"Missing required fields in share_created event: {event}")
+            return
+        
+        # Время создания берем из события: при повторной доставке оно не меняется
+        created_at = event.created_at
+        message = template_registry.render('share_created', {
+            'share_id': event.share_id,
+            'birthday': event.birthday,
+            'created_at': created_at[:19].replace('T', ' ') if created_at else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        })
+        
+        # Отправляем сообщение пользователю
+        await self.sender.send_message(chat_id=event.user_id, priority=PRIORITY_NOTIFICATION, **message)
+        
+        logger.info(f"Share creation notification sent to user {event.user_id}")
+    
+    async def _handle_user_updated(self, event: UserUpdated):
+        """Обрабатывает событие обновления пользователя"""
+        logger.info(f"Processing user_updated event: {event}")
+        if event.user_id:
+            template_id = 'user_created' if event.action == 'created' else 'user_updated'
+            message = template_registry.render(template_id)
+            await self.sender.send_message(chat_id=event.user_id, priority=PRIORITY_NOTIFICATION, **message)
             
-            # Отправляем сообщение
-            await self.dp.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=parse_mode,
-                disable_web_page_preview=disable_web_page_preview,
-                disable_notification=disable_notification,
-                reply_to_message_id=reply_to_message_id,
-                reply_markup=reply_markup
-            )
+    async def _handle_send_message(self, event: SendMessage):
+        """
+        Обрабатывает событие отправки сообщения: либо шаблон (template_id и params),
+        либо готовый текст с разметкой в message_data
+        """
+        logger.info(f"Processing send_message event")
+        if event.template_id:
+            chat_id = event.chat_id
+            if not chat_id:
+                logger.error(f"Missing chat_id in template message event: {event}")
+                return
+            message = template_registry.render(event.template_id, event.params)
+            priority = PRIORITIES.get(event.priority, PRIORITY_NOTIFICATION)
+            await self.sender.send_message(chat_id=chat_id, priority=priority, **message)
+            logger.info(f"Template message {event.template_id} sent to chat_id {chat_id}")
+            return
+        
+        message_data = event.message_data or {}
+        
+        if not message_data:
+            logger.error("No message_data in event")
+            return
             
-            logger.info(f"Message sent to chat_id {chat_id}")
+        chat_id = message_data.get('chat_id')
+        text = message_data.get('text')
+        
+        if not chat_id or not text:
+            logger.error(f"Missing required fields in message_data: {message_data}")
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling send_message event: {e}") 
\ No newline at end of file
+        # Получаем дополнительные параметры
+        parse_mode = message_data.get('parse_mode', 'HTML')
+        disable_web_page_preview = message_data.get('disable_web_page_preview', False)
+        disable_notification = message_data.get('disable_notification', False)
+        reply_to_message_id = message_data.get('reply_to_message_id')
+        priority = PRIORITIES.get(message_data.get('priority'), PRIORITY_NOTIFICATION)
+        
+        # Проверяем наличие клавиатуры
+        reply_markup = None
+        if 'reply_markup' in message_data:
+            reply_markup = build_inline_keyboard(message_data['reply_markup'])
+        
+        # Отправляем сообщение
+        await self.sender.send_message(
+            chat_id=chat_id,
+            text=text,
+            parse_mode=parse_mode,
+            disable_web_page_preview=disable_web_page_preview,
+            disable_notification=disable_notification,
+            reply_to_message_id=reply_to_message_id,
+            reply_markup=reply_markup,
+            priority=priority
+        )
+        
+        logger.info(f"Message sent to chat_id {chat_id}")
@@ -0,0 +1,91 @@
+import time
+from typing import Dict, List, Optional, Tuple
+from utils.config import KAFKA_RETRY_DELAYS, KAFKA_RETRY_TOPIC_PREFIX, KAFKA_DLQ_TOPIC
+
+# Заголовки сообщений в топиках повторов и DLQ
+HEADER_ORIGINAL_TOPIC = 'original_topic'
+HEADER_ATTEMPT = 'attempt'
+HEADER_NOT_BEFORE = 'not_before_ms'
+HEADER_ERROR = 'error'
+HEADER_FAILED_AT = 'failed_at_ms'
+
+Headers = List[Tuple[str, bytes]]
+
+
+class RetryPolicy:
+    """
+    Ступени повторов: попытка N уходит в топик с задержкой delays[N-1],
+    после последней ступени сообщение попадает в DLQ
+    """
+    def __init__(
+        self,
+        delays: List[int] = KAFKA_RETRY_DELAYS,
+        prefix: str = KAFKA_RETRY_TOPIC_PREFIX,
+        dlq_topic: str = KAFKA_DLQ_TOPIC
+    ):
+        self.delays = delays
+        self.topics = [f"{prefix}.{delay}s" for delay in delays]
+        self.dlq_topic = dlq_topic
+        self._delay_by_topic = dict(zip(self.topics, delays))
+
+    def is_retry_topic(self, topic: str) -> bool:
+        return topic in self._delay_by_topic
+
+    def next_topic(self, attempt: int) -> Tuple[str, int]:
+        """
+        Куда отправить сообщение после неудачной попытки
+        :param attempt: Сколько повторов уже было (0 для исходного топика)
+        :return: Топик и задержка в секундах (0 для DLQ)
+        """
+        if attempt < len(self.topics):
+            return self.topics[attempt], self.delays[attempt]
+        return self.dlq_topic, 0
+
+    def retry_headers(self, original_topic: str, attempt: int, delay: int, error: Exception) -> Headers:
+        now_ms = int(time.time() * 1000)
+        return [
+            (HEADER_ORIGINAL_TOPIC, original_topic.encode()),
+            (HEADER_ATTEMPT, str(attempt).encode()),
+            (HEADER_NOT_BEFORE, str(now_ms + delay * 1000).encode()),
+            (HEADER_ERROR, _describe(error).encode()),
+            (HEADER_FAILED_AT, str(now_ms).encode()),
+        ]
+
+
+def parse_headers(headers) -> Dict[str, str]:
+    """Заголовки сообщения в виде словаря строк (битые байты заменяются, а не роняют разбор)"""
+    return {key: value.decode(errors='replace') for key, value in (headers or ()) if value is not None}
+
+
+def original_topic(msg, headers: Dict[str, str]) -> str:
+    """Топик, из которого сообщение пришло изначально"""
+    return headers.get(HEADER_ORIGINAL_TOPIC, msg.topic)
+
+
+def attempt_of(headers: Dict[str, str]) -> int:
+    """Номер попытки; нечисловой заголовок считаем первой попыткой"""
+    return _int_header(headers, HEADER_ATTEMPT) or 0
+
+
+def not_before_ms(headers: Dict[str, str]) -> Optional[int]:
+    """Момент, раньше которого сообщение не обрабатывается; нечисловой заголовок — без задержки"""
+    return _int_header(headers, HEADER_NOT_BEFORE)
+
+
+def _int_header(headers: Dict[str, str], key: str) -> Optional[int]:
+    value = headers.get(key)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _describe(error: Exception) -> str:
+    # Ограничиваем длину: заголовки хранятся вместе с каждым сообщением
+    return f"{type(error).__name__}: {error}"[:1000]
+
+
+# Создаем глобальную политику повторов
+retry_policy = RetryPolicy()
@@ -0,0 +1,240 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+from utils.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST, TELEGRAM_CHAT_INTERVAL,
+    TELEGRAM_GROUP_CHAT_INTERVAL, TELEGRAM_RETRY_AFTER_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Классы приоритета: меньшее значение отправляется раньше
+PRIORITY_REPLY = 0         # ответы на действия пользователя в боте
+PRIORITY_NOTIFICATION = 1  # уведомления о событиях пользователя
+PRIORITY_BULK = 2          # массовые рассылки
+
+PRIORITIES = {
+    'reply': PRIORITY_REPLY,
+    'notification': PRIORITY_NOTIFICATION,
+    'bulk': PRIORITY_BULK,
+}
+
+
+class _SendRequest:
+    """Сообщение в очереди на отправку"""
+    __slots__ = ('priority', 'seq', 'chat_id', 'kwargs', 'future', 'enqueued_at', 'attempts')
+
+    def __init__(self, priority: int, seq: int, chat_id: Any, kwargs: Dict[str, Any], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other: '_SendRequest') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendScheduler:
+    """
+    Планировщик исходящих сообщений с учетом лимитов Telegram:
+    общий token bucket на бота, минимальный интервал между сообщениями
+    в один чат и приоритеты. В каждый чат одновременно отправляется не
+    больше одного сообщения. RetryAfter откладывает чат на указанное
+    время и возвращает сообщение в очередь.
+    """
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = TELEGRAM_GLOBAL_RATE,
+        burst: int = TELEGRAM_GLOBAL_BURST,
+        chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+        group_chat_interval: float = TELEGRAM_GROUP_CHAT_INTERVAL,
+        retry_after_attempts: int = TELEGRAM_RETRY_AFTER_ATTEMPTS
+    ):
+        self.bot = bot
+        self.rate = rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self.group_chat_interval = group_chat_interval
+        self.retry_after_attempts = retry_after_attempts
+        self._queue: List[_SendRequest] = []
+        self._seq = itertools.count()
+        self._chat_ready_at: Dict[Any, float] = {}
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sending = set()
+        # Чаты, сообщение в которые сейчас отправляется
+        self._chats_in_flight = set()
+        self.metrics = {
+            'enqueued': 0, 'sent': 0, 'failed': 0, 'retry_after': 0,
+            'queue_latency_total': 0.0, 'queue_latency_max': 0.0,
+            'send_latency_total': 0.0, 'send_latency_max': 0.0,
+        }
+
+    async def start(self):
+        """Запускает цикл отправки"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Send scheduler started")
+
+    async def stop(self):
+        """Останавливает цикл отправки; сообщения в очереди получают ошибку"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        for request in self._queue:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Send scheduler stopped"))
+        self._queue.clear()
+        logger.info(f"Send scheduler stopped, metrics: {self.get_metrics()}")
+
+    async def send_message(self, chat_id: Any, text: str, priority: int = PRIORITY_NOTIFICATION, **kwargs):
+        """
+        Ставит сообщение в очередь и ждет его отправки.
+        Ошибки Bot API пробрасываются вызывающему.
+        """
+        future = asyncio.get_running_loop().create_future()
+        kwargs['text'] = text
+        heapq.heappush(self._queue, _SendRequest(priority, next(self._seq), chat_id, kwargs, future))
+        self.metrics['enqueued'] += 1
+        self._wakeup.set()
+        return await future
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Возвращает счетчики, глубину очереди по приоритетам и задержки"""
+        metrics = dict(self.metrics)
+        depth = {name: 0 for name in PRIORITIES}
+        names = {value: name for name, value in PRIORITIES.items()}
+        for request in self._queue:
+            depth[names.get(request.priority, 'bulk')] += 1
+        metrics['queue_depth'] = depth
+        metrics['in_flight'] = len(self._sending)
+        completed = metrics['sent'] + metrics['failed']
+        if completed:
+            metrics['queue_latency_avg'] = metrics['queue_latency_total'] / completed
+            metrics['send_latency_avg'] = metrics['send_latency_total'] / completed
+        return metrics
+
+    def _interval_for(self, chat_id: Any) -> float:
+        """Группы и каналы (отрицательный chat_id) имеют более строгий лимит"""
+        try:
+            return self.group_chat_interval if int(chat_id) < 0 else self.chat_interval
+        except (TypeError, ValueError):
+            # @username канала
+            return self.group_chat_interval
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _pop_ready(self, now: float) -> Tuple[Optional[_SendRequest], Optional[float]]:
+        """
+        Достает самое приоритетное сообщение, чат которого готов к отправке
+        :return: Сообщение (или None) и через сколько секунд освободится ближайший чат
+        """
+        deferred = []
+        request, wait = None, None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            if candidate.future.done():
+                # Вызывающий больше не ждет отправки
+                continue
+            if candidate.chat_id in self._chats_in_flight:
+                # Ждем результата предыдущего сообщения: после RetryAfter оно уйдет первым
+                deferred.append(candidate)
+                continue
+            ready_at = self._chat_ready_at.get(candidate.chat_id, 0)
+            if ready_at <= now:
+                request = candidate
+                break
+            deferred.append(candidate)
+            wait = ready_at - now if wait is None else min(wait, ready_at - now)
+        for candidate in deferred:
+            heapq.heappush(self._queue, candidate)
+        return request, wait
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            request, wait = self._pop_ready(now)
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._tokens -= 1
+            self._chat_ready_at[request.chat_id] = now + self._interval_for(request.chat_id)
+            self._chats_in_flight.add(request.chat_id)
+            task = asyncio.create_task(self._send(request))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+            self._forget_idle_chats(now)
+
+    def _forget_idle_chats(self, now: float):
+        """Не дает словарю интервалов расти бесконечно"""
+        if len(self._chat_ready_at) > 10000:
+            self._chat_ready_at = {
+                chat_id: ready_at for chat_id, ready_at in self._chat_ready_at.items() if ready_at > now
+            }
+
+    async def _send(self, request: _SendRequest):
+        try:
+            await self._attempt(request)
+        finally:
+            # Следующее сообщение в чат можно отправлять только после ответа на это
+            self._chats_in_flight.discard(request.chat_id)
+            self._wakeup.set()
+
+    async def _attempt(self, request: _SendRequest):
+        started = time.monotonic()
+        queue_latency = started - request.enqueued_at
+        try:
+            result = await self.bot.send_message(chat_id=request.chat_id, **request.kwargs)
+        except RetryAfter as e:
+            self.metrics['retry_after'] += 1
+            self._chat_ready_at[request.chat_id] = time.monotonic() + e.timeout
+            logger.warning(f"Flood control for chat {request.chat_id}, retry in {e.timeout}s")
+            if request.attempts < self.retry_after_attempts and not request.future.done():
+                # Сообщение остается в очереди со своим местом: порядок в чате не меняется
+                request.attempts += 1
+                heapq.heappush(self._queue, request)
+                return
+            self._complete(request, started, queue_latency, error=e)
+        except Exception as e:
+            self._complete(request, started, queue_latency, error=e)
+        else:
+            self._complete(request, started, queue_latency, result=result)
+
+    def _complete(self, request: _SendRequest, started: float, queue_latency: float, result=None, error=None):
+        send_latency = time.monotonic() - started
+        self.metrics['failed' if error else 'sent'] += 1
+        self.metrics['queue_latency_total'] += queue_latency
+        self.metrics['queue_latency_max'] = max(self.metrics['queue_latency_max'], queue_latency)
+        self.metrics['send_latency_total'] += send_latency
+        self.metrics['send_latency_max'] = max(self.metrics['send_latency_max'], send_latency)
+        if request.future.done():
+            return
+        if error:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(result)
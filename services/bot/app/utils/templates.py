@@ -0,0 +1,187 @@
+import html
+import logging
+from string import Formatter
+from typing import Any, Dict, List, Optional, Tuple
+from aiogram import types
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_formatter = Formatter()
+
+
+class CompiledText:
+    """
+    Текст с подстановками вида {name}, разобранный один раз при регистрации.
+    Строка, в которой все параметры отсутствуют или равны None, при отрисовке
+    пропускается — так задаются необязательные строки сообщения.
+    """
+    def __init__(self, source: str, escape_html: bool = False):
+        self.source = source
+        self.escape_html = escape_html
+        # Каждая строка — список пар (текст, имя параметра или None)
+        self.lines: List[List[Tuple[str, Optional[str]]]] = []
+        self.fields = set()
+        for line in source.split('\n'):
+            segments = []
+            for literal, field, spec, conversion in _formatter.parse(line):
+                if spec or conversion:
+                    raise ValueError(f"Format specs are not supported in templates: {line!r}")
+                segments.append((literal, field or None))
+                if field:
+                    self.fields.add(field)
+            self.lines.append(segments)
+
+    def render(self, params: Dict[str, Any]) -> str:
+        """Подставляет параметры; отсутствующий параметр в обязательной строке — KeyError"""
+        out = []
+        for segments in self.lines:
+            names = [field for _, field in segments if field]
+            if names and all(params.get(name) is None for name in names):
+                continue
+            parts = []
+            for literal, field in segments:
+                parts.append(literal)
+                if field:
+                    value = params[field]
+                    value = '' if value is None else str(value)
+                    parts.append(html.escape(value, quote=False) if self.escape_html else value)
+            out.append(''.join(parts))
+        return '\n'.join(out)
+
+
+class KeyboardLayout:
+    """
+    Инлайн-клавиатура, заданная строками кнопок. Кнопка — словарь с text и
+    одним из url, callback_data или web_app (URL строкой); значения могут
+    содержать подстановки. Клавиатура без подстановок собирается один раз.
+    """
+    def __init__(self, rows: List[List[Dict[str, str]]]):
+        self.rows = [
+            [{key: CompiledText(value) for key, value in button.items()} for button in row]
+            for row in rows
+        ]
+        self.is_static = not any(
+            text.fields for row in self.rows for button in row for text in button.values()
+        )
+        self._static_markup = self._build({}) if self.is_static else None
+
+    def render(self, params: Dict[str, Any]) -> types.InlineKeyboardMarkup:
+        if self._static_markup is not None:
+            return self._static_markup
+        return self._build(params)
+
+    def _build(self, params: Dict[str, Any]) -> types.InlineKeyboardMarkup:
+        keyboard = types.InlineKeyboardMarkup()
+        for row in self.rows:
+            buttons = []
+            for button in row:
+                values = {key: text.render(params) for key, text in button.items()}
+                if values.get('web_app'):
+                    values['web_app'] = types.WebAppInfo(url=values['web_app'])
+                buttons.append(types.InlineKeyboardButton(**values))
+            keyboard.row(*buttons)
+        return keyboard
+
+
+class MessageTemplate:
+    """Шаблон сообщения: текст, режим разметки и необязательная клавиатура"""
+    def __init__(
+        self,
+        template_id: str,
+        text: str,
+        parse_mode: Optional[str] = None,
+        keyboard: Optional[List[List[Dict[str, str]]]] = None,
+        disable_web_page_preview: bool = False
+    ):
+        self.template_id = template_id
+        self.parse_mode = parse_mode
+        self.text = CompiledText(text, escape_html=parse_mode == 'HTML')
+        self.keyboard = KeyboardLayout(keyboard) if keyboard else None
+        self.disable_web_page_preview = disable_web_page_preview
+
+    def render(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Возвращает аргументы для send_message (кроме chat_id)"""
+        message = {'text': self.text.render(params)}
+        if self.parse_mode:
+            message['parse_mode'] = self.parse_mode
+        if self.disable_web_page_preview:
+            message['disable_web_page_preview'] = True
+        if self.keyboard:
+            message['reply_markup'] = self.keyboard.render(params)
+        return message
+
+
+class TemplateRegistry:
+    """Реестр шаблонов сообщений по идентификатору"""
+    def __init__(self):
+        self._templates: Dict[str, MessageTemplate] = {}
+
+    def register(self, template: MessageTemplate):
+        self._templates[template.template_id] = template
+
+    def render(self, template_id: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Отрисовывает шаблон; неизвестный шаблон или параметр — KeyError"""
+        template = self._templates.get(template_id)
+        if template is None:
+            raise KeyError(f"Unknown message template: {template_id}")
+        return template.render(params or {})
+
+    def __contains__(self, template_id: str) -> bool:
+        return template_id in self._templates
+
+
+def build_inline_keyboard(markup_data: Dict[str, Any]) -> Optional[types.InlineKeyboardMarkup]:
+    """Собирает клавиатуру из словаря в формате Bot API (для событий с готовой разметкой)"""
+    if 'inline_keyboard' not in markup_data:
+        return None
+    keyboard = types.InlineKeyboardMarkup()
+    for row in markup_data['inline_keyboard']:
+        buttons = []
+        for button_data in row:
+            if button_data.get('url'):
+                buttons.append(types.InlineKeyboardButton(text=button_data['text'], url=button_data['url']))
+            elif button_data.get('callback_data'):
+                buttons.append(types.InlineKeyboardButton(
+                    text=button_data['text'], callback_data=button_data['callback_data']
+                ))
+            elif button_data.get('web_app'):
+                buttons.append(types.InlineKeyboardButton(
+                    text=button_data['text'], web_app=types.WebAppInfo(url=button_data['web_app']['url'])
+                ))
+        if buttons:
+            keyboard.row(*buttons)
+    return keyboard
+
+
+# Создаем глобальный реестр шаблонов
+template_registry = TemplateRegistry()
+
+template_registry.register(MessageTemplate(
+    'share_created',
+    "🔄 Ваша шара с ID {share_id} успешно создана!\n"
+    "\n"
+    "Данные шары:\n"
+    "📅 День рождения: {birthday}\n"
+    "\n"
+    "Время создания: {created_at}",
+    parse_mode='HTML'
+))
+template_registry.register(MessageTemplate(
+    'user_created',
+    "👋 Добро пожаловать! Ваш профиль успешно создан."
+))
+template_registry.register(MessageTemplate(
+    'user_updated',
+    "✅ Ваш профиль успешно обновлен."
+))
+template_registry.register(MessageTemplate(
+    'share_saved',
+    "✅ Данные успешно сохранены!\n"
+    "\n"
+    "Нажмите на ссылку ниже, чтобы открыть мини-приложение с вашими данными:\n"
+    "⚠️ Ссылка действительна 24 часа\n"
+    "\n"
+    "{share_link}",
+    parse_mode='HTML'
+))
@@ -0,0 +1,202 @@
+"""
+Бенчмарк пропускной способности бота без Telegram и Kafka.
+
+Настоящие KafkaEventHandler, SendScheduler и aiogram.Bot работают против
+FakeBotAPI (локальный HTTP-сервер с задержкой и ошибками), события подает
+EventFeeder из записанных payload'ов. Меряет скорость обработки событий и
+доставки сообщений, задержку от подачи события до ответа Bot API
+(p50/p95/p99) и потребление памяти.
+
+Параметры обработчика и планировщика задаются флагами, поэтому их можно
+подбирать локально: --max-in-flight, --rate/--burst, --chat-interval,
+--fetch-max-records, --commit-interval-ms.
+
+Запуск из services/bot:
+    python benchmarks/bench_throughput.py [--events 3000] [--chats 500] [--latency-ms 30]
+    python benchmarks/bench_throughput.py --rate 1000 --chat-interval 0 --max-in-flight 256
+    python benchmarks/bench_throughput.py --enforce-limits --feed-rate 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Dict, List
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "app"))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", ".."))
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args) -> Dict:
+    from aiogram import Bot, Dispatcher
+    from aiogram.bot.api import TelegramAPIServer
+    from utils.kafka_utils import KafkaEventHandler
+    from utils.send_scheduler import SendScheduler
+    from fake_bot_api import FakeBotAPI
+    from feeder import EventFeeder, FeedConsumer, ForwardSink, MemoryRedis, load_recorded
+
+    api = await FakeBotAPI(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, retry_after_rate=args.retry_after_rate,
+        retry_after=args.retry_after, error_rate=args.error_rate, not_found_rate=args.not_found_rate,
+        enforce_limits=args.enforce_limits
+    ).start()
+    bot = Bot(token="123456:BENCHMARK", server=TelegramAPIServer.from_base(api.url))
+    sender = SendScheduler(
+        bot, rate=args.rate, burst=args.burst,
+        chat_interval=args.chat_interval, group_chat_interval=args.group_chat_interval
+    )
+    handler = KafkaEventHandler(Dispatcher(bot), sender, max_in_flight=args.max_in_flight)
+    feeder = EventFeeder(load_recorded(args.recorded), args.chats, args.partitions, args.format)
+    handler.consumer = consumer = FeedConsumer(feeder)
+    handler.producer = producer = ForwardSink()
+    await handler.dedupe.close()
+    handler.dedupe.redis = MemoryRedis()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_mb()
+    rss_peak = rss_before
+    await sender.start()
+    started = time.monotonic()
+    handler.task = asyncio.create_task(handler._handle_events())
+    feeding = asyncio.create_task(feeder.feed_at_rate(args.events, args.feed_rate))
+
+    finished = ("processed", "dropped", "retried", "dead_lettered", "duplicates")
+    deadline = started + args.timeout
+    while sum(handler.metrics[name] for name in finished) < args.events and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+        rss_peak = max(rss_peak, rss_mb())
+    elapsed = time.monotonic() - started
+    timed_out = sum(handler.metrics[name] for name in finished) < args.events
+
+    feeding.cancel()
+    await handler.stop()
+    await sender.stop()
+    await (await bot.get_session()).close()
+    await api.stop()
+    traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    latencies = sorted(
+        api.delivered_at[token] - fed_at for token, fed_at in feeder.fed_at.items() if token in api.delivered_at
+    )
+    scheduler = sender.get_metrics()
+    return {
+        "events": args.events,
+        "seconds": round(elapsed, 3),
+        "timed_out": timed_out,
+        "events_per_second": round(handler.metrics["processed"] / elapsed, 1),
+        "messages_per_second": round(api.delivered / elapsed, 1),
+        "event_bytes_avg": round(feeder.bytes / max(1, feeder.fed), 1),
+        "latency_ms": {
+            "measured": len(latencies),
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "memory_mb": {
+            "rss_before": round(rss_before, 1),
+            "rss_peak": round(rss_peak, 1),
+            "rss_growth": round(rss_peak - rss_before, 1),
+            "traced_peak": round(traced_peak, 1) if traced_peak is not None else None,
+        },
+        "handler": dict(handler.metrics),
+        "scheduler": {name: scheduler[name] for name in ("sent", "failed", "retry_after")},
+        "queue_latency_max_ms": round(scheduler["queue_latency_max"] * 1000, 1),
+        "api": {
+            "statuses": dict(api.statuses),
+            "limit_violations": api.limit_violations,
+            "max_concurrent_requests": api.max_in_flight,
+        },
+        "forwarded": dict(producer.messages),
+        "commit_calls": consumer.commit_calls,
+    }
+
+
+def report(args, result: Dict):
+    status = " (TIMED OUT)" if result["timed_out"] else ""
+    print(f"{result['events']} events ({args.format}, {result['event_bytes_avg']} B avg) over {args.chats} chats "
+          f"in {result['seconds']}s{status}")
+    print(f"throughput: {result['events_per_second']} events/s, {result['messages_per_second']} messages/s delivered")
+    latency = result["latency_ms"]
+    print(f"latency feed -> delivered (n={latency['measured']}): p50 {latency['p50']} ms, p95 {latency['p95']} ms, "
+          f"p99 {latency['p99']} ms, max {latency['max']} ms")
+    memory = result["memory_mb"]
+    traced = f", traced peak {memory['traced_peak']} MB" if memory["traced_peak"] is not None else ""
+    print(f"memory: rss {memory['rss_before']} -> peak {memory['rss_peak']} MB (+{memory['rss_growth']}){traced}")
+    print(f"handler: {result['handler']}")
+    print(f"scheduler: {result['scheduler']}, queue latency max {result['queue_latency_max_ms']} ms")
+    print(f"bot api: {result['api']}")
+    print(f"forwarded: {result['forwarded']}, commits {result['commit_calls']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    workload = parser.add_argument_group("нагрузка")
+    workload.add_argument("--events", type=int, default=3000)
+    workload.add_argument("--chats", type=int, default=500)
+    workload.add_argument("--partitions", type=int, default=6)
+    workload.add_argument("--feed-rate", type=float, default=0, help="Событий в секунду (0 — весь backlog сразу)")
+    workload.add_argument("--format", choices=("envelope", "json"), default="envelope")
+    workload.add_argument("--recorded", default=os.path.join(BENCHMARKS_DIR, "recorded_events.jsonl"))
+    workload.add_argument("--timeout", type=float, default=300)
+    tuning = parser.add_argument_group("настройки бота")
+    tuning.add_argument("--max-in-flight", type=int, default=64)
+    tuning.add_argument("--rate", type=float, default=28, help="Сообщений в секунду на бота")
+    tuning.add_argument("--burst", type=int, default=28)
+    tuning.add_argument("--chat-interval", type=float, default=1.0)
+    tuning.add_argument("--group-chat-interval", type=float, default=3.0)
+    tuning.add_argument("--fetch-max-records", type=int, help="KAFKA_FETCH_MAX_RECORDS")
+    tuning.add_argument("--commit-interval-ms", type=int, help="KAFKA_COMMIT_INTERVAL_MS")
+    fake_api = parser.add_argument_group("Bot API")
+    fake_api.add_argument("--latency-ms", type=float, default=30)
+    fake_api.add_argument("--jitter-ms", type=float, default=10)
+    fake_api.add_argument("--retry-after-rate", type=float, default=0.0)
+    fake_api.add_argument("--retry-after", type=int, default=1)
+    fake_api.add_argument("--error-rate", type=float, default=0.0)
+    fake_api.add_argument("--not-found-rate", type=float, default=0.0)
+    fake_api.add_argument("--enforce-limits", action="store_true", help="429 при превышении лимитов Telegram")
+    parser.add_argument("--tracemalloc", action="store_true", help="Учитывать пик выделенной памяти (медленнее)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # Настройки обработчика читаются при импорте
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+    if args.fetch_max_records:
+        os.environ["KAFKA_FETCH_MAX_RECORDS"] = str(args.fetch_max_records)
+    if args.commit_interval_ms:
+        os.environ["KAFKA_COMMIT_INTERVAL_MS"] = str(args.commit_interval_ms)
+
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        report(args, result)
+    if result["timed_out"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
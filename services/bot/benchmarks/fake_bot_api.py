@@ -0,0 +1,208 @@
+"""
+Локальный заменитель Telegram Bot API для бенчмарков бота.
+
+Отвечает на sendMessage в формате Bot API с настраиваемой задержкой и
+внедряет ошибки: 429 с retry_after (случайно или при превышении лимитов
+Telegram — 30 сообщений в секунду на бота и 1 в секунду на чат),
+500 и «chat not found» для части чатов. Для каждого успешного сообщения
+запоминает время получения, чтобы бенчмарк мог посчитать задержку доставки.
+
+Отдельный запуск (бот подключается через TelegramAPIServer.from_base):
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 50 --enforce-limits
+"""
+import argparse
+import asyncio
+import random
+import re
+import time
+import zlib
+from collections import Counter, deque
+from typing import Deque, Dict, Optional
+from aiohttp import web
+
+# Метка события в тексте сообщения, ее расставляет EventFeeder
+TOKEN_PATTERN = re.compile(r"bench(\d+)")
+
+# Лимиты Telegram для ботов
+TELEGRAM_GLOBAL_LIMIT = 30
+TELEGRAM_CHAT_INTERVAL = 1.0
+TELEGRAM_GROUP_LIMIT = 20  # сообщений в минуту в группу
+
+
+class FakeBotAPI:
+    """HTTP-сервер с подмножеством Bot API, которое использует бот"""
+    def __init__(
+        self,
+        latency_ms: float = 30,
+        jitter_ms: float = 10,
+        retry_after_rate: float = 0.0,
+        retry_after: int = 1,
+        error_rate: float = 0.0,
+        not_found_rate: float = 0.0,
+        enforce_limits: bool = False,
+        seed: int = 42
+    ):
+        """
+        :param latency_ms: Средняя задержка ответа
+        :param jitter_ms: Разброс задержки (равномерно в обе стороны)
+        :param retry_after_rate: Доля запросов, получающих 429 случайно
+        :param retry_after: Значение retry_after в ответах 429
+        :param error_rate: Доля запросов, получающих 500
+        :param not_found_rate: Доля чатов, для которых всегда отвечаем «chat not found»
+        :param enforce_limits: Отвечать 429 при превышении лимитов Telegram
+        """
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.enforce_limits = enforce_limits
+        self.rng = random.Random(seed)
+        self.statuses: Counter = Counter()
+        self.limit_violations = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Метка события -> время получения сообщения (time.monotonic)
+        self.delivered_at: Dict[int, float] = {}
+        self._message_id = 0
+        self._recent: Deque[float] = deque()
+        self._chat_sent_at: Dict[str, float] = {}
+        self._group_sent: Dict[str, Deque[float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> 'FakeBotAPI':
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def delivered(self) -> int:
+        return self.statuses[200]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        data = dict(await request.post()) if request.can_read_body else {}
+        if method == "getme":
+            return self._ok({"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"})
+        if method != "sendmessage":
+            return self._error(404, "Not Found: method not found")
+        # Лимиты считаются по времени прихода запроса, как у Telegram
+        received_at = time.monotonic()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+            return self._send_message(data, received_at)
+        finally:
+            self.in_flight -= 1
+
+    def _send_message(self, data: Dict[str, str], received_at: float) -> web.Response:
+        chat_id, text = str(data.get("chat_id", "")), data.get("text", "")
+        if not chat_id or not text:
+            return self._error(400, "Bad Request: message text is empty")
+        if self._chat_not_found(chat_id):
+            return self._error(400, "Bad Request: chat not found")
+        if self.rng.random() < self.error_rate:
+            return self._error(500, "Internal Server Error")
+        if self.enforce_limits and not self._within_limits(chat_id, received_at):
+            self.limit_violations += 1
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        if self.rng.random() < self.retry_after_rate:
+            return self._error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        now = time.monotonic()
+        for token in TOKEN_PATTERN.findall(text):
+            self.delivered_at.setdefault(int(token), now)
+        self._message_id += 1
+        chat_type = "group" if chat_id.startswith("-") else "private"
+        return self._ok({
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if chat_id.lstrip("-").isdigit() else 0, "type": chat_type},
+            "text": text
+        })
+
+    def _chat_not_found(self, chat_id: str) -> bool:
+        # Один и тот же чат всегда либо доступен, либо нет
+        return self.not_found_rate > 0 and zlib.crc32(chat_id.encode()) % 10000 < self.not_found_rate * 10000
+
+    def _within_limits(self, chat_id: str, now: float) -> bool:
+        """Учитывает сообщение в лимитах; False, если лимит превышен"""
+        while self._recent and now - self._recent[0] >= 1:
+            self._recent.popleft()
+        if len(self._recent) >= TELEGRAM_GLOBAL_LIMIT:
+            return False
+        if chat_id.startswith("-"):
+            sent = self._group_sent.setdefault(chat_id, deque())
+            while sent and now - sent[0] >= 60:
+                sent.popleft()
+            if len(sent) >= TELEGRAM_GROUP_LIMIT:
+                return False
+            sent.append(now)
+        else:
+            if now - self._chat_sent_at.get(chat_id, -TELEGRAM_CHAT_INTERVAL) < TELEGRAM_CHAT_INTERVAL:
+                return False
+            self._chat_sent_at[chat_id] = now
+        self._recent.append(now)
+        return True
+
+    def _ok(self, result) -> web.Response:
+        self.statuses[200] += 1
+        return web.json_response({"ok": True, "result": result})
+
+    def _error(self, status: int, description: str, **parameters) -> web.Response:
+        self.statuses[status] += 1
+        body = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    parser.add_argument("--enforce-limits", action="store_true")
+    args = parser.parse_args()
+
+    async def serve():
+        api = FakeBotAPI(
+            args.latency_ms, args.jitter_ms, args.retry_after_rate, args.retry_after,
+            args.error_rate, args.not_found_rate, args.enforce_limits
+        )
+        await api.start(args.host, args.port)
+        print(f"Fake Bot API listening on {api.url}")
+        try:
+            while True:
+                await asyncio.sleep(10)
+                print(f"statuses {dict(api.statuses)}, limit violations {api.limit_violations}")
+        finally:
+            await api.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
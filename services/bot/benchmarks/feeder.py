@@ -0,0 +1,201 @@
+"""
+Подача событий в KafkaEventHandler без Kafka.
+
+EventFeeder воспроизводит записанные события (recorded_events.jsonl, формат
+backend до перехода на бинарный конверт): каждой копии выдается новый
+event_id, чат из заданного пула и метка benchN в идентификаторе шары или
+тексте, по которой FakeBotAPI отмечает доставку. Сообщения раскладываются
+по партициям по ключу, как у продюсера backend.
+
+FeedConsumer и ForwardSink подменяют consumer и producer обработчика,
+MemoryRedis — Redis дедупликатора.
+"""
+import asyncio
+import json
+import time
+import zlib
+from collections import Counter, deque
+from dataclasses import replace
+from typing import Deque, Dict, List, NamedTuple, Optional
+from aiokafka import TopicPartition
+from common.events import Event, ShareCreated, UserUpdated, decode_event, encode_event, new_event_id
+
+FORMATS = ("envelope", "json")
+
+
+class Record(NamedTuple):
+    """Поля ConsumerRecord, которые читает обработчик"""
+    topic: str
+    partition: int
+    offset: int
+    key: Optional[bytes]
+    value: bytes
+    headers: list
+    timestamp: int
+
+
+def load_recorded(path: str) -> List[Event]:
+    """Читает записанные события: строка JSON с полями topic и value"""
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                events.append(decode_event(json.dumps(item["value"]).encode(), item["topic"]))
+    return events
+
+
+def _legacy_json(event: Event) -> bytes:
+    """Событие в JSON прежнего формата backend"""
+    if isinstance(event, ShareCreated):
+        data = {"share_id": event.share_id, "user_id": event.user_id,
+                "data": {"birthday": event.birthday, "created_at": event.created_at}}
+    elif isinstance(event, UserUpdated):
+        data = {"user_id": event.user_id, "data": {"first_name": event.first_name, "last_name": event.last_name,
+                                                   "username": event.username, "action": event.action}}
+    elif event.template_id:
+        data = {"chat_id": event.chat_id, "template_id": event.template_id, "params": event.params}
+        if event.priority:
+            data["priority"] = event.priority
+    else:
+        data = {"message_data": event.message_data}
+    data.update(event_id=event.event_id, event_type=event.TOPIC)
+    return json.dumps(data).encode()
+
+
+class EventFeeder:
+    """Генерирует копии записанных событий и раскладывает их по партициям"""
+    def __init__(self, recorded: List[Event], chats: int, partitions: int = 6, fmt: str = "envelope",
+                 first_chat_id: int = 100000):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt}")
+        self.recorded = recorded
+        self.chats = chats
+        self.partitions = partitions
+        self.fmt = fmt
+        self.first_chat_id = first_chat_id
+        self.queues: Dict[TopicPartition, Deque[Record]] = {}
+        self.offsets: Counter = Counter()
+        # Метка события -> время подачи (time.monotonic)
+        self.fed_at: Dict[int, float] = {}
+        self.fed = 0
+        self.bytes = 0
+        self.available = asyncio.Event()
+
+    def make(self, seq: int) -> Event:
+        """Копия записанного события с новыми идентификаторами и меткой bench{seq}"""
+        event = self.recorded[seq % len(self.recorded)]
+        # Простое число в шаге разносит соседние события по разным чатам
+        chat_id = self.first_chat_id + (seq * 7919) % self.chats
+        token = f"bench{seq}"
+        if isinstance(event, ShareCreated):
+            return replace(event, share_id=token, user_id=str(chat_id), event_id=new_event_id())
+        if isinstance(event, UserUpdated):
+            return replace(event, user_id=str(chat_id), event_id=new_event_id())
+        if event.template_id:
+            params = {name: f"{value}_{token}" for name, value in (event.params or {}).items()}
+            return replace(event, chat_id=chat_id, params=params, event_id=new_event_id())
+        message_data = dict(event.message_data, chat_id=chat_id, text=f"{event.message_data['text']}\n#{token}")
+        return replace(event, chat_id=chat_id, message_data=message_data, event_id=new_event_id())
+
+    def feed(self, count: int = 1):
+        """Подает следующие count событий"""
+        for _ in range(count):
+            seq = self.fed
+            event = self.make(seq)
+            value = encode_event(event) if self.fmt == "envelope" else _legacy_json(event)
+            key = str(event.chat_id).encode()
+            tp = TopicPartition(event.TOPIC, zlib.crc32(key) % self.partitions)
+            queue = self.queues.setdefault(tp, deque())
+            queue.append(Record(tp.topic, tp.partition, self.offsets[tp], key, value, [], int(time.time() * 1000)))
+            self.offsets[tp] += 1
+            if not isinstance(event, UserUpdated):
+                self.fed_at[seq] = time.monotonic()
+            self.fed += 1
+            self.bytes += len(value)
+        self.available.set()
+
+    async def feed_at_rate(self, count: int, rate: float):
+        """Подает события с заданной скоростью (0 — все сразу, как накопленный backlog)"""
+        if rate <= 0:
+            self.feed(count)
+            return
+        started = time.monotonic()
+        while self.fed < count:
+            due = min(count, int((time.monotonic() - started) * rate) + 1)
+            if due > self.fed:
+                self.feed(due - self.fed)
+            await asyncio.sleep(0.005)
+
+
+class FeedConsumer:
+    """Заменитель AIOKafkaConsumer, отдающий сообщения EventFeeder"""
+    def __init__(self, feeder: EventFeeder):
+        self.feeder = feeder
+        self.commits: Dict[TopicPartition, int] = {}
+        self.commit_calls = 0
+        self._paused = set()
+
+    async def getmany(self, *partitions, timeout_ms: int = 0, max_records: Optional[int] = None):
+        if not any(self.feeder.queues.values()):
+            self.feeder.available.clear()
+            try:
+                await asyncio.wait_for(self.feeder.available.wait(), timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                return {}
+        batches = {}
+        budget = max_records or float("inf")
+        # Как Kafka: пачка набирается по партициям по очереди
+        for tp, queue in self.feeder.queues.items():
+            if tp in self._paused:
+                continue
+            while queue and budget > 0:
+                batches.setdefault(tp, []).append(queue.popleft())
+                budget -= 1
+        return batches
+
+    async def commit(self, offsets: Dict[TopicPartition, int]):
+        self.commit_calls += 1
+        self.commits.update(offsets)
+
+    def seek(self, tp: TopicPartition, offset: int):
+        pass
+
+    def pause(self, *partitions):
+        self._paused.update(partitions)
+
+    def resume(self, *partitions):
+        self._paused.difference_update(partitions)
+
+    def assignment(self):
+        return set(self.feeder.queues)
+
+    async def stop(self):
+        pass
+
+
+class ForwardSink:
+    """Заменитель producer'а обработчика: считает сообщения, ушедшие в топики повторов и DLQ"""
+    def __init__(self):
+        self.messages: Counter = Counter()
+
+    async def send_and_wait(self, topic: str, value: bytes = None, key: bytes = None, headers=None):
+        self.messages[topic] += 1
+
+    async def stop(self):
+        pass
+
+
+class MemoryRedis:
+    """Команды Redis, которые использует EventDeduplicator, в памяти процесса"""
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key: str, value, ex: int = None):
+        self.data[key] = str(value).encode()
+
+    async def close(self):
+        pass
@@ -0,0 +1,13 @@
+"""
+Пути импорта для тестов бота: модули приложения лежат в app,
+общий пакет common — в каталоге services.
+
+Запуск из services/bot:
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(1, os.path.join(HERE, "..", ".."))
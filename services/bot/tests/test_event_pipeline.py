@@ -0,0 +1,132 @@
+"""
+Разбор входящих событий Kafka: декодирование, заголовки повторов
+и вычисление фиксируемых смещений
+"""
+import pytest
+from common.events import SendMessage, ShareCreated, TEMPLATE_SHARE_SAVED, EventDecodeError, decode_event, encode_event
+from utils.dispatcher import OffsetTracker
+from utils.retry import RetryPolicy, attempt_of, not_before_ms, original_topic, parse_headers
+
+# Некорректные сообщения и топики, из которых они пришли
+MALFORMED = [
+    (b"", None),
+    (b"{bad", "send_message"),
+    (b"[1, 2]", "send_message"),
+    (b'{"event_type": [1]}', None),
+    (b'{"event_type": "unknown"}', None),
+    (b'{"event_type": "share_created", "data": "x"}', None),
+    (b'{"event_type": "user_updated", "data": [1]}', None),
+    (b'{"chat_id": 1, "message_data": "x"}', "send_message"),
+    (b'{"chat_id": 1, "params": [1]}', "send_message"),
+    (bytes((0xE1, 1, 1, 0)) + b"\x01", None),
+    (bytes((0xE1, 1, 9, 0)), None),
+    (bytes((0xE1, 1, 1, 0)) + b"\xc1", None),
+]
+
+
+@pytest.mark.parametrize("value,topic", MALFORMED)
+def test_decode_event_rejects_malformed(value, topic):
+    with pytest.raises(EventDecodeError):
+        decode_event(value, topic)
+
+
+@pytest.mark.parametrize("threshold", [0, 10 ** 6])
+def test_decode_event_round_trip(threshold):
+    event = SendMessage(chat_id=42, template_id=TEMPLATE_SHARE_SAVED, params={"share_link": "x" * 600})
+    assert decode_event(encode_event(event, compression_threshold=threshold)) == event
+
+
+def test_decode_event_reads_legacy_json_by_topic():
+    event = decode_event(b'{"share_id": "s1", "user_id": "7", "data": {"birthday": "2000-01-01"}}', "share_created")
+    assert event == ShareCreated(share_id="s1", user_id="7", birthday="2000-01-01", event_id=None)
+
+
+class _Message:
+    topic = "send_message"
+
+
+def test_retry_headers_round_trip():
+    policy = RetryPolicy(delays=[10, 60], prefix="bot.retry", dlq_topic="bot.dlq")
+    headers = parse_headers(policy.retry_headers("send_message", 2, 10, ValueError("boom")))
+    assert attempt_of(headers) == 2
+    assert not_before_ms(headers) > 0
+    assert original_topic(_Message(), headers) == "send_message"
+    assert headers["error"] == "ValueError: boom"
+
+
+def test_parse_headers_tolerates_bad_values():
+    headers = parse_headers([("attempt", b"\xff"), ("not_before_ms", b"soon"), ("error", None)])
+    assert "error" not in headers
+    assert attempt_of(headers) == 0
+    assert not_before_ms(headers) is None
+
+
+def test_headers_default_to_first_attempt_without_delay():
+    headers = parse_headers(None)
+    assert attempt_of(headers) == 0
+    assert not_before_ms(headers) is None
+    assert original_topic(_Message(), headers) == "send_message"
+
+
+def test_retry_policy_ends_in_dlq():
+    policy = RetryPolicy(delays=[10, 60], prefix="bot.retry", dlq_topic="bot.dlq")
+    assert policy.next_topic(0) == ("bot.retry.10s", 10)
+    assert policy.next_topic(1) == ("bot.retry.60s", 60)
+    assert policy.next_topic(2) == ("bot.dlq", 0)
+    assert policy.is_retry_topic("bot.retry.60s") and not policy.is_retry_topic("bot.dlq")
+
+
+def test_offset_tracker_commits_contiguous_prefix():
+    tracker = OffsetTracker()
+    for offset in (5, 6, 7):
+        assert tracker.start("p0", offset, tracker.generation)
+    tracker.done("p0", 7, tracker.generation)
+    assert tracker.take_commits() == {}
+    tracker.done("p0", 5, tracker.generation)
+    assert tracker.take_commits() == {"p0": 6}
+    assert tracker.pending("p0") == 1
+    tracker.done("p0", 6, tracker.generation)
+    assert tracker.take_commits() == {"p0": 8}
+    assert tracker.pending("p0") == 0
+
+
+def test_offset_tracker_ignores_messages_from_revoked_generation():
+    tracker = OffsetTracker()
+    old = tracker.generation
+    tracker.start("p0", 1, old)
+    tracker.start("p1", 1, old)
+    tracker.forget(["p0"])
+    # Сообщения p0 из старого поколения больше не учитываются
+    assert not tracker.start("p0", 2, old)
+    tracker.done("p0", 1, old)
+    assert tracker.take_commits() == {}
+    # Другие партиции того же поколения продолжают работать
+    tracker.done("p1", 1, old)
+    assert tracker.take_commits() == {"p1": 2}
+    # После повторного назначения p0 принимается в новом поколении
+    assert tracker.start("p0", 1, tracker.generation)
+    tracker.done("p0", 1, tracker.generation)
+    assert tracker.take_commits() == {"p0": 2}
+
+
+def test_offset_tracker_take_commits_filters_assignment():
+    tracker = OffsetTracker()
+    for partition in ("p0", "p1"):
+        tracker.start(partition, 0, tracker.generation)
+        tracker.done(partition, 0, tracker.generation)
+    assert tracker.take_commits(assigned={"p1"}) == {"p1": 1}
+    assert tracker.take_commits() == {}
+
+
+def test_offset_tracker_restore_commits_keeps_newer_offsets():
+    tracker = OffsetTracker()
+    for offset in (0, 1):
+        tracker.start("p0", offset, tracker.generation)
+    tracker.start("p1", 0, tracker.generation)
+    tracker.done("p0", 0, tracker.generation)
+    failed = tracker.take_commits()
+    tracker.done("p0", 1, tracker.generation)
+    tracker.forget(["p1"])
+    tracker.restore_commits({**failed, "p1": 1})
+    # Более новое смещение p0 не затирается, отобранная p1 не восстанавливается
+    assert tracker.take_commits() == {"p0": 2}
@@ -0,0 +1,4 @@
+"""
+Общий код сервисов backend и bot (контракты событий Kafka).
+Копируется в образ каждого сервиса как пакет common.
+"""
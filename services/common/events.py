@@ -0,0 +1,235 @@
+"""
+Контракт событий Kafka между backend и ботом.
+
+Бинарный формат сообщения:
+    байт 0    — маркер 0xE1 (JSON с него начаться не может)
+    байт 1    — версия конверта
+    байт 2    — код типа события
+    байт 3    — флаги (сжатие)
+    остальное — msgpack-массив значений полей в порядке их объявления (возможно, сжатый lz4)
+
+Поля передаются по позиции, без имен. Новые поля добавляются только в конец
+и только со значением по умолчанию: старый читатель отбрасывает лишние
+значения, новый подставляет умолчания для отсутствующих.
+Сообщения без маркера читаются как JSON прежнего формата.
+"""
+import json
+import uuid
+from dataclasses import dataclass, field, fields
+from typing import Any, ClassVar, Dict, Optional, Type, Union
+import msgpack
+
+try:
+    import lz4.block as lz4_block
+except ImportError:  # pragma: no cover - lz4 есть в requirements; без него события не сжимаются
+    lz4_block = None
+
+# Топики
+SHARE_CREATED_TOPIC = 'share_created'
+USER_UPDATED_TOPIC = 'user_updated'
+SEND_MESSAGE_TOPIC = 'send_message'
+TOPICS = [SHARE_CREATED_TOPIC, USER_UPDATED_TOPIC, SEND_MESSAGE_TOPIC]
+
+# Шаблоны сообщений, зарегистрированные в боте
+TEMPLATE_SHARE_SAVED = 'share_saved'
+
+MAGIC = 0xE1
+ENVELOPE_VERSION = 1
+HEADER_SIZE = 4
+
+# Флаги
+FLAG_LZ4 = 1
+
+# Сжимать полезную нагрузку не меньше этого размера (в байтах)
+COMPRESSION_THRESHOLD = 512
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class EventDecodeError(ValueError):
+    """Сообщение не удалось разобрать как событие"""
+
+
+def _legacy_object(data: Dict[str, Any], key: str) -> Optional[Dict[str, Any]]:
+    """Вложенный объект события прежнего формата или None, если поля нет"""
+    value = data.get(key)
+    if value is not None and not isinstance(value, dict):
+        raise EventDecodeError(f"Field {key} is not an object")
+    return value
+
+
+def new_event_id() -> str:
+    """Уникальный идентификатор события: по нему бот отбрасывает повторные доставки"""
+    return uuid.uuid4().hex
+
+
+@dataclass
+class ShareCreated:
+    """Пользователь создал шару"""
+    TYPE: ClassVar[int] = 1
+    TOPIC: ClassVar[str] = SHARE_CREATED_TOPIC
+    share_id: str
+    user_id: str
+    birthday: Optional[str] = None
+    created_at: Optional[str] = None
+    event_id: str = field(default_factory=new_event_id)
+
+    @property
+    def chat_id(self) -> str:
+        return self.user_id
+
+    @classmethod
+    def from_legacy(cls, data: Dict[str, Any]) -> 'ShareCreated':
+        details = _legacy_object(data, 'data') or {}
+        return cls(
+            share_id=data.get('share_id'),
+            user_id=data.get('user_id'),
+            birthday=details.get('birthday'),
+            created_at=details.get('created_at'),
+            event_id=data.get('event_id')
+        )
+
+
+@dataclass
+class UserUpdated:
+    """Профиль пользователя создан или обновлен"""
+    TYPE: ClassVar[int] = 2
+    TOPIC: ClassVar[str] = USER_UPDATED_TOPIC
+    user_id: str
+    action: str = 'updated'
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    username: Optional[str] = None
+    event_id: str = field(default_factory=new_event_id)
+
+    @property
+    def chat_id(self) -> str:
+        return self.user_id
+
+    @classmethod
+    def from_legacy(cls, data: Dict[str, Any]) -> 'UserUpdated':
+        details = _legacy_object(data, 'data') or {}
+        return cls(
+            user_id=data.get('user_id'),
+            action=details.get('action', 'updated'),
+            first_name=details.get('first_name'),
+            last_name=details.get('last_name'),
+            username=details.get('username'),
+            event_id=data.get('event_id')
+        )
+
+
+@dataclass
+class SendMessage:
+    """
+    Отправить сообщение в чат: по шаблону бота (template_id и params)
+    или готовым текстом с разметкой (message_data в формате Bot API)
+    """
+    TYPE: ClassVar[int] = 3
+    TOPIC: ClassVar[str] = SEND_MESSAGE_TOPIC
+    chat_id: int
+    template_id: Optional[str] = None
+    params: Optional[Dict[str, Any]] = None
+    priority: Optional[str] = None
+    message_data: Optional[Dict[str, Any]] = None
+    event_id: str = field(default_factory=new_event_id)
+
+    @classmethod
+    def from_legacy(cls, data: Dict[str, Any]) -> 'SendMessage':
+        message_data = _legacy_object(data, 'message_data')
+        return cls(
+            chat_id=data.get('chat_id') or (message_data or {}).get('chat_id'),
+            template_id=data.get('template_id'),
+            params=_legacy_object(data, 'params'),
+            priority=data.get('priority') or (message_data or {}).get('priority'),
+            message_data=message_data,
+            event_id=data.get('event_id')
+        )
+
+
+Event = Union[ShareCreated, UserUpdated, SendMessage]
+
+EVENT_TYPES: Dict[int, Type] = {cls.TYPE: cls for cls in (ShareCreated, UserUpdated, SendMessage)}
+EVENT_TYPES_BY_TOPIC: Dict[str, Type] = {cls.TOPIC: cls for cls in EVENT_TYPES.values()}
+
+# Имена полей в порядке кодирования, вычисляются один раз
+_FIELDS: Dict[Type, tuple] = {cls: tuple(f.name for f in fields(cls)) for cls in EVENT_TYPES.values()}
+
+
+def encode_event(event: Event, compression_threshold: int = COMPRESSION_THRESHOLD) -> bytes:
+    """
+    Кодирует событие в бинарный конверт
+    :param event: Событие
+    :param compression_threshold: Сжимать полезную нагрузку не меньше этого размера
+    :return: Значение сообщения Kafka
+    """
+    payload = msgpack.packb([getattr(event, name) for name in _FIELDS[type(event)]], use_bin_type=True)
+    flags = 0
+    if lz4_block is not None and len(payload) >= compression_threshold:
+        compressed = lz4_block.compress(payload, store_size=True)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, FLAG_LZ4
+    return bytes((MAGIC, ENVELOPE_VERSION, event.TYPE, flags)) + payload
+
+
+def decode_event(value: Buffer, topic: Optional[str] = None) -> Event:
+    """
+    Декодирует событие из бинарного конверта или JSON прежнего формата
+    :param value: Значение сообщения Kafka
+    :param topic: Топик сообщения — для JSON без поля event_type
+    :raises EventDecodeError: Если сообщение не удалось разобрать
+    """
+    if not value:
+        raise EventDecodeError("Empty message")
+    # memoryview: полезная нагрузка читается без копирования заголовка и данных
+    view = memoryview(value)
+    if view[0] != MAGIC:
+        return _decode_legacy(value, topic)
+    if len(view) < HEADER_SIZE:
+        raise EventDecodeError("Truncated event header")
+    version, type_code, flags = view[1], view[2], view[3]
+    if version > ENVELOPE_VERSION:
+        raise EventDecodeError(f"Unsupported envelope version {version}")
+    cls = EVENT_TYPES.get(type_code)
+    if cls is None:
+        raise EventDecodeError(f"Unknown event type {type_code}")
+    payload = view[HEADER_SIZE:]
+    try:
+        if flags & FLAG_LZ4:
+            if lz4_block is None:
+                raise EventDecodeError("lz4 is not installed")
+            payload = lz4_block.decompress(payload)
+        values = msgpack.unpackb(payload, raw=False)
+    except EventDecodeError:
+        raise
+    except Exception as e:
+        raise EventDecodeError(f"Malformed {cls.__name__} payload: {e}") from e
+    if not isinstance(values, list):
+        raise EventDecodeError(f"Malformed {cls.__name__} payload: not an array")
+    try:
+        # Значения полей, добавленных более новой версией, отбрасываются
+        return cls(*values[:len(_FIELDS[cls])])
+    except TypeError as e:
+        raise EventDecodeError(f"Missing fields for {cls.__name__}: {e}") from e
+
+
+def _decode_legacy(value: Buffer, topic: Optional[str]) -> Event:
+    """Разбирает событие в JSON прежнего формата"""
+    try:
+        # json.loads принимает bytes напрямую, без промежуточной строки
+        data = json.loads(bytes(value) if isinstance(value, memoryview) else value)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise EventDecodeError(f"Malformed JSON event: {e}") from e
+    if not isinstance(data, dict):
+        raise EventDecodeError("JSON event is not an object")
+    event_type = data.get('event_type') or topic
+    cls = EVENT_TYPES_BY_TOPIC.get(event_type) if isinstance(event_type, str) else None
+    if cls is None:
+        raise EventDecodeError(f"Unknown event type {event_type!r}")
+    try:
+        return cls.from_legacy(data)
+    except EventDecodeError:
+        raise
+    except Exception as e:
+        # Остальные поля не проверяются по отдельности: любая ошибка разбора — это некорректное событие
+        raise EventDecodeError(f"Malformed {cls.__name__} event: {e}") from e